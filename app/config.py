@@ -11,9 +11,21 @@ class Settings(BaseSettings):
 
     # Client API Keys (comma-separated for multiple clients)
     api_keys: str = ""  # e.g., "roborder_key_abc123,client2_key_xyz789"
+    # JSON list of {"key" | "key_sha256", "tenant_id", "rate_limit", "burst", "model_tier"}
+    api_keys_file: Optional[str] = None
+    # Redis hash of key digest -> JSON metadata, e.g. "api_keys"; empty disables the Redis source
+    api_keys_redis_hash: str = ""
+    api_keys_reload_seconds: float = 60.0  # 0 disables periodic reload
 
     # Redis Cache
     redis_url: str = "redis://localhost:6379"
+    redis_connect_timeout: float = 1.0
+    redis_op_timeout: float = 0.25  # budget per cache operation
+    redis_bulk_op_timeout: float = 2.0  # budget per image read/write (payloads up to a few MB)
+    redis_reconnect_base_delay: float = 0.5
+    redis_reconnect_max_delay: float = 30.0
+    redis_breaker_failure_threshold: int = 5  # consecutive errors before skipping Redis
+    redis_breaker_reset_seconds: float = 10.0
 
     # CORS
     allowed_origins: str = "https://app.roborder.ai"
@@ -23,13 +35,115 @@ class Settings(BaseSettings):
 
     # Reply Generation
     max_tokens_per_reply: int = 200  # Enough for 2 quality sentences
+    speculative_candidates: int = 1  # >1 requests candidates in parallel, first valid wins
+    # Template replies without a model call: off, praise (pure praise only) or
+    # safe (praise, plus price/stock questions the product context answers exactly)
+    reply_fast_path: str = "off"
+
+    # Model routing: entries replace the default route of the same name, e.g.
+    # {"reply:negative": {"models": ["openai/gpt-4.1-mini", "openai/gpt-4.1-nano"],
+    #                     "max_tokens": 200, "temperature": 0.4, "attempt_timeout": 8}}
+    model_routes: dict[str, dict] = {}
+    # USD per million tokens, used when the provider does not report a cost
+    model_prices: dict[str, dict[str, float]] = {
+        "openai/gpt-4.1-nano": {"input": 0.10, "output": 0.40},
+        "openai/gpt-4.1-mini": {"input": 0.40, "output": 1.60},
+    }
+
+    # Batch Replies
+    batch_max_comments: int = 100
+    batch_concurrency: int = 4  # comments generated at once per batch
+
+    # Language Detection (local classifier, LLM only below this confidence)
+    language_detection_min_confidence: float = 0.7
+
+    # Prompts
+    prompt_hot_reload: bool = False  # re-read templates when their mtime changes
 
     # Cache TTL (seconds)
     post_summary_ttl: int = 86400  # 24 hours
+    summary_cache_local_ttl: float = 300.0  # in-process tier, kept short
+    summary_stale_ttl: int = 86400  # how long past expiry a stale summary may still be served
+    summary_xfetch_beta: float = 1.0  # >1 refreshes earlier, 0 disables early refresh
+    summary_cache_local_max_entries: int = 2048
     recent_replies_ttl: int = 3600  # 1 hour
+    recent_replies_max: int = 50  # replies kept per account
 
-    # Rate Limiting
+    # Reply cache for repeated comments on the same post
+    reply_cache_enabled: bool = True
+    reply_cache_ttl: int = 3600
+    reply_cache_variants: int = 3  # distinct replies generated before serving from the pool
+    reply_cache_max_comment_chars: int = 80
+
+    # Near-duplicate replies (estimated Jaccard vs the account's recent replies)
+    near_duplicate_enabled: bool = True
+    near_duplicate_threshold: float = 0.6
+
+    # Summary coalescing (cross-worker lease while one worker summarizes a post).
+    # Lease and wait both cover summary_deadline_seconds plus this margin.
+    summary_lock_margin_seconds: float = 5.0
+
+    # Rate Limiting (token bucket per API key)
+    rate_limit_enabled: bool = True
     rate_limit_per_minute: int = 60
+    rate_limit_burst: int = 0  # bucket capacity; 0 means one minute's worth
+    # Per-key overrides keyed by the SHA-256 hex digest of the API key,
+    # e.g. {"<digest>": {"per_minute": 600, "burst": 100}}
+    rate_limit_overrides: dict[str, dict[str, int]] = {}
+
+    # HTTP Client (shared pool for OpenRouter and image downloads)
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 20
+    http_keepalive_expiry: float = 30.0  # seconds
+    http_max_connections_per_host: int = 20  # image hosts; OpenRouter is capped by the upstream limiter
+    http_connect_timeout: float = 5.0
+    openrouter_timeout: float = 60.0
+    image_fetch_timeout: float = 10.0
+
+    # Upstream concurrency (adaptive AIMD limiter around model calls)
+    upstream_initial_limit: int = 16
+    upstream_min_limit: int = 2
+    upstream_max_limit: int = 128
+    upstream_max_queue: int = 256
+    upstream_queue_timeout: float = 10.0  # seconds a call may wait for a slot
+    upstream_latency_target: float = 8.0  # slower calls count as congestion
+    upstream_backoff_ratio: float = 0.7
+
+    # Resilience (deadlines, retries, circuit breaker, hedging for model calls)
+    reply_deadline_seconds: float = 25.0
+    summary_deadline_seconds: float = 45.0
+    retry_max_attempts: int = 3
+    retry_base_delay: float = 0.25
+    retry_max_delay: float = 2.0
+    breaker_failure_threshold: int = 5
+    breaker_reset_seconds: float = 30.0
+    hedge_enabled: bool = False  # fire a second attempt once the first passes p95
+    hedge_min_samples: int = 20  # latencies needed before hedging kicks in
+
+    # Image fetching fan-out
+    image_fetch_concurrency_per_request: int = 4
+    image_fetch_concurrency_global: int = 32
+
+    # Image Cache (in-process LRU in front of Redis)
+    image_cache_ttl: int = 86400  # 24 hours, matches post summaries
+    image_cache_local_max_bytes: int = 64 * 1024 * 1024
+    image_cache_max_entry_bytes: int = 4 * 1024 * 1024  # encoded size
+
+    # Image Preprocessing (downscale + recompress before the vision model)
+    image_preprocessing_enabled: bool = True
+    image_max_edge: int = 1024  # pixels, longest side
+    image_output_format: str = "jpeg"  # jpeg or webp
+    image_output_quality: int = 80
+    image_processing_workers: int = 2
+
+    @property
+    def summary_lock_wait_seconds(self) -> float:
+        """How long a summary may take, retries included, before its lease holder is presumed dead."""
+        return self.summary_deadline_seconds + self.summary_lock_margin_seconds
+
+    @property
+    def summary_lock_ttl_ms(self) -> int:
+        return int(self.summary_lock_wait_seconds * 1000)
 
     class Config:
         env_file = ".env"
@@ -1,21 +1,36 @@
+import time
+import asyncio
 import logging
 from contextlib import asynccontextmanager
+from typing import Optional
 
-from fastapi import FastAPI, HTTPException, Depends, Security
+from fastapi import FastAPI, HTTPException, Depends, Request, Security
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.security import APIKeyHeader
 
 from app.config import get_settings, Settings
 from app.models import (
+    BatchReplyRequest,
+    BatchReplyResponse,
     ReplyRequest,
     ReplyResponse,
+    ReplyStreamEvent,
     SummarizeRequest,
     SummarizeResponse,
     HealthResponse,
+    MetricsResponse,
 )
 from app.services.claude_service import ClaudeService
 from app.services.cache_service import CacheService
 from app.services.reply_generator import ReplyGenerator
+from app.services.rate_limiter import RateLimiter
+from app.services.api_keys import DEV_KEY, ApiKeyInfo, get_api_key_registry
+from app.services.prompt_registry import get_prompt_registry
+from app.services.single_flight import SingleFlight
+from app.services.summary_cache import SummaryCache, SummaryEntry
+from app.services.concurrency_limiter import UpstreamOverloaded
+from app.services.resilience import CircuitOpen, Deadline, DeadlineExceeded
 
 # Configure logging
 logging.basicConfig(
@@ -28,49 +43,124 @@ logger = logging.getLogger(__name__)
 api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
 
 
-async def verify_api_key(api_key: str = Security(api_key_header)) -> str:
-    """Verify the API key from request header."""
+async def verify_api_key(request: Request, api_key: str = Security(api_key_header)) -> ApiKeyInfo:
+    """
+    Verify the API key from request header.
+
+    The caller's identity is also left on ``request.state.client`` for
+    downstream quota and metrics code.
+    """
     if not api_key:
         raise HTTPException(
             status_code=401,
             detail="Missing API key. Include 'X-API-Key' header."
         )
 
-    settings = get_settings()
-    valid_keys = [k.strip() for k in settings.api_keys.split(",") if k.strip()]
-
-    if not valid_keys:
+    registry = get_api_key_registry()
+    if registry.dev_mode:
         # If no API keys configured, allow all requests (dev mode)
         logger.warning("No API keys configured - running in development mode")
-        return "dev_mode"
+        client = DEV_KEY
+    else:
+        client = registry.authenticate(api_key)
+        if client is None:
+            raise HTTPException(
+                status_code=403,
+                detail="Invalid API key"
+            )
+
+    request.state.client = client
+    return client
 
-    if api_key not in valid_keys:
+
+async def verify_admin_key(client: ApiKeyInfo = Depends(verify_api_key)) -> ApiKeyInfo:
+    """Verify the API key and require the admin flag, for cross-tenant endpoints."""
+    if not client.admin:
         raise HTTPException(
             status_code=403,
-            detail="Invalid API key"
+            detail="This endpoint needs an admin API key"
         )
+    return client
+
+
+async def enforce_rate_limit(
+    request: Request,
+    client: ApiKeyInfo = Depends(verify_api_key),
+) -> ApiKeyInfo:
+    """Verify the API key, then charge the request to its token bucket."""
+    await charge_rate_limit(request, client)
+    return client
 
-    return api_key
+
+def speculative_candidates(requested: Optional[int]) -> int:
+    """Model calls a reply may start at once: the request's candidates or the server default."""
+    return requested or get_settings().speculative_candidates
+
+
+async def charge_rate_limit(request: Request, client: ApiKeyInfo, cost: int = 1) -> None:
+    """Charge ``cost`` model calls to the client's token bucket, raising 429 when empty."""
+    if rate_limiter is None or not get_settings().rate_limit_enabled:
+        return
+
+    _, burst = rate_limiter.policy(client)
+    if cost > burst:
+        # Could never be allowed, however long the client waits
+        raise HTTPException(
+            status_code=422,
+            detail=f"Request needs {cost} model calls but this key allows at most {burst} at once"
+        )
+    result = await rate_limiter.check(client, cost=cost)
+    # Picked up by the rate_limit_headers middleware, including for streams
+    request.state.rate_limit = result
+    if not result.allowed:
+        logger.warning(f"Rate limit exceeded for tenant {client.tenant_id} (key {client.key_id})")
+        raise HTTPException(
+            status_code=429,
+            detail="Rate limit exceeded",
+            headers=result.headers(),
+        )
 
 
 # Global service instances
 cache_service: CacheService = None
+summary_cache: SummaryCache = None
 claude_service: ClaudeService = None
 reply_generator: ReplyGenerator = None
+rate_limiter: RateLimiter = None
+
+# Coalesces concurrent summarize calls for the same post within this worker
+summary_flight = SingleFlight()
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan handler for startup/shutdown."""
-    global cache_service, claude_service, reply_generator
+    global cache_service, summary_cache, claude_service, reply_generator, rate_limiter
 
     # Startup
     logger.info("Starting Roborder AI Reply Service...")
 
+    # Load and validate prompt templates up front so a bad file fails the boot
+    get_prompt_registry().load_all()
+
     cache_service = CacheService()
     await cache_service.connect()
+    summary_cache = SummaryCache(cache_service)
+    await summary_cache.start()
+
+    # Parse API keys once; a bad keys file fails the boot, Redis keys are merged in
+    api_keys = get_api_key_registry()
+    api_keys.load()
+    await api_keys.reload(cache_service)
+    key_reloader = None
+    if get_settings().api_keys_reload_seconds > 0:
+        key_reloader = asyncio.create_task(
+            api_keys.run_reloader(cache_service, get_settings().api_keys_reload_seconds)
+        )
+    rate_limiter = RateLimiter(cache_service)
 
-    claude_service = ClaudeService()
+    claude_service = ClaudeService(cache_service)
+    await claude_service.connect()
     reply_generator = ReplyGenerator(claude_service, cache_service)
 
     logger.info("Service started successfully")
@@ -78,6 +168,10 @@ async def lifespan(app: FastAPI):
 
     # Shutdown
     logger.info("Shutting down...")
+    if key_reloader is not None:
+        key_reloader.cancel()
+    await summary_cache.stop()
+    await claude_service.disconnect()
     await cache_service.disconnect()
     logger.info("Service stopped")
 
@@ -105,6 +199,16 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def rate_limit_headers(request: Request, call_next):
+    """Attach X-RateLimit-* headers to responses of rate-limited endpoints."""
+    response = await call_next(request)
+    result = getattr(request.state, "rate_limit", None)
+    if result is not None:
+        response.headers.update(result.headers())
+    return response
+
+
 @app.get("/api/v1/health", response_model=HealthResponse)
 async def health_check():
     """Check service health status."""
@@ -116,10 +220,36 @@ async def health_check():
     )
 
 
+@app.get("/api/v1/metrics", response_model=MetricsResponse)
+async def metrics(client: ApiKeyInfo = Depends(verify_admin_key)):
+    """
+    Expose cache and upstream counters for dashboards.
+
+    Admin keys only: the counters span every tenant and name them.
+    """
+    data = {}
+    if summary_cache:
+        data["post_summary_cache"] = summary_cache.stats()
+    if claude_service:
+        data["image_cache"] = claude_service.image_cache.stats()
+        data["upstream_limiter"] = claude_service.limiter.stats()
+        data["upstream_resilience"] = claude_service.resilience_stats()
+        data["model_routes"] = claude_service.router.stats()
+    data["summary_single_flight"] = summary_flight.stats()
+    if rate_limiter:
+        data["rate_limiter"] = rate_limiter.stats()
+    if reply_generator:
+        data["reply_cache"] = reply_generator.reply_cache.stats()
+        data["reply_fast_path"] = reply_generator.templates.stats()
+    data["api_keys"] = get_api_key_registry().stats()
+    return MetricsResponse(metrics=data)
+
+
 @app.post("/api/v1/generate-reply", response_model=ReplyResponse)
 async def generate_reply(
     request: ReplyRequest,
-    api_key: str = Depends(verify_api_key)
+    http_request: Request,
+    client: ApiKeyInfo = Depends(verify_api_key)
 ):
     """
     Generate a human-like reply to an Instagram comment.
@@ -128,12 +258,17 @@ async def generate_reply(
     culturally-appropriate replies in French, Arabic, or English.
 
     When seller_context is provided, generates highly accurate replies
-    with exact prices, shipping info, and product details.
+    with exact prices, shipping info, and product details. Speculative
+    candidates each count against the key's rate limit. Without a
+    ``language`` the reply follows the comment's detected language.
 
     Requires X-API-Key header for authentication.
     """
+    await charge_rate_limit(http_request, client, cost=speculative_candidates(request.candidates))
     try:
-        response = await reply_generator.generate(request)
+        deadline = Deadline.after(get_settings().reply_deadline_seconds)
+        request = await with_detected_language(request, deadline)
+        response = await reply_generator.generate(request, deadline=deadline, model_tier=client.model_tier)
         has_context = request.seller_context is not None
         logger.info(
             f"Generated reply for post {request.post_id}: "
@@ -141,56 +276,277 @@ async def generate_reply(
             f"context={'full' if has_context else 'fallback'}"
         )
         return response
+    except (UpstreamOverloaded, CircuitOpen) as e:
+        logger.warning(f"Shedding reply request: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except DeadlineExceeded as e:
+        logger.warning(f"Reply deadline exceeded for post {request.post_id}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(f"Error generating reply: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def with_detected_language(request: ReplyRequest, deadline: Deadline) -> ReplyRequest:
+    """The request with its reply language detected from the comment, if the client sent none."""
+    if "language" in request.model_fields_set or claude_service is None:
+        return request
+    language = await claude_service.detect_language(request.comment_text, deadline=deadline)
+    return request.model_copy(update={"language": language})
+
+
+def _sse(event: ReplyStreamEvent) -> str:
+    """Format a stream event as a server-sent event frame."""
+    return f"event: {event.event}\ndata: {event.model_dump_json(exclude_none=True)}\n\n"
+
+
+@app.post("/api/v1/generate-reply/stream")
+async def generate_reply_stream(
+    request: ReplyRequest,
+    client: ApiKeyInfo = Depends(enforce_rate_limit)
+):
+    """
+    Stream a reply to an Instagram comment as server-sent events.
+
+    ``token`` events carry text as it is generated. A ``retry`` event means
+    the text so far broke a reply rule and was abandoned; discard it and
+    keep reading. The stream ends with ``done`` (the full ReplyResponse)
+    or ``error``.
+
+    Requires X-API-Key header for authentication.
+    """
+    deadline = Deadline.after(get_settings().reply_deadline_seconds)
+
+    # Wait for the first event so early failures still get a proper status code
+    try:
+        request = await with_detected_language(request, deadline)
+        events = reply_generator.generate_stream(request, deadline=deadline, model_tier=client.model_tier)
+        first = await anext(events)
+    except (UpstreamOverloaded, CircuitOpen) as e:
+        logger.warning(f"Shedding streamed reply request: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except DeadlineExceeded as e:
+        logger.warning(f"Reply deadline exceeded for post {request.post_id}")
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error streaming reply: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def sse():
+        yield _sse(first)
+        try:
+            async for event in events:
+                yield _sse(event)
+        except Exception as e:
+            logger.error(f"Error streaming reply for post {request.post_id}: {e}")
+            yield _sse(ReplyStreamEvent(event="error", error=str(e)))
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(
+        sse(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/api/v1/generate-replies", response_model=BatchReplyResponse)
+async def generate_replies(
+    request: BatchReplyRequest,
+    http_request: Request,
+    client: ApiKeyInfo = Depends(verify_api_key)
+):
+    """
+    Generate replies for a batch of comments on the same post.
+
+    Post images and seller context are prepared once and shared by every
+    comment. Each result carries either a reply or a per-comment error.
+    With ``stream=true`` results are sent as NDJSON lines as they complete.
+    Every comment is charged to the key's rate limit, once per speculative
+    candidate, so a batch may hold at most ``batch_max_comments`` or as many
+    comments as the key's burst pays for, whichever is smaller. Without a
+    batch ``language``, comments without one follow their detected
+    language (local detection only; unsure comments keep the default).
+
+    Requires X-API-Key header for authentication.
+    """
+    settings = get_settings()
+    per_comment = speculative_candidates(request.candidates)
+    max_comments = settings.batch_max_comments
+    if rate_limiter is not None and settings.rate_limit_enabled:
+        max_comments = min(max_comments, rate_limiter.policy(client)[1] // per_comment)
+    if len(request.comments) > max_comments:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Too many comments in batch (max {max_comments} for this key)"
+        )
+    # One token per model call each comment may start
+    await charge_rate_limit(http_request, client, cost=len(request.comments) * per_comment)
+
+    if "language" not in request.model_fields_set and claude_service is not None:
+        # No model fallback here: a batch could otherwise start one call per comment
+        request.comments = [
+            comment if comment.language else comment.model_copy(
+                update={"language": claude_service.detect_language_local(comment.comment_text, request.language)}
+            )
+            for comment in request.comments
+        ]
+
+    items = reply_generator.generate_batch(request, model_tier=client.model_tier)
+
+    if request.stream:
+        async def ndjson():
+            async for item in items:
+                yield item.model_dump_json() + "\n"
+
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+    try:
+        results = [item async for item in items]
+    except Exception as e:
+        logger.error(f"Error generating batch replies: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    failed = sum(1 for item in results if item.error)
+    logger.info(
+        f"Generated batch for post {request.post_id}: "
+        f"{len(results) - failed} ok, {failed} failed"
+    )
+    return BatchReplyResponse(
+        post_id=request.post_id,
+        results=sorted(results, key=lambda item: item.index),
+    )
+
+
 @app.post("/api/v1/summarize-post", response_model=SummarizeResponse)
 async def summarize_post(
     request: SummarizeRequest,
-    api_key: str = Depends(verify_api_key)
+    client: ApiKeyInfo = Depends(enforce_rate_limit)
 ):
     """
     Generate and cache a summary of an Instagram post.
 
     This summary is used to generate contextual replies to comments.
     The summary is cached to reduce API calls for subsequent comments
-    on the same post.
+    on the same post. Expired summaries are served (``stale=true``) while
+    a fresh one is computed in the background, and hot posts are refreshed
+    shortly before they expire.
 
     Requires X-API-Key header for authentication.
     """
     try:
         # Check cache first
-        cached_summary = await cache_service.get_post_summary(request.post_id)
-        if cached_summary:
-            logger.info(f"Cache hit for post {request.post_id}")
+        entry = await summary_cache.get(request.post_id)
+        if entry:
+            logger.info(f"Cache hit for post {request.post_id}{' (stale)' if entry.stale else ''}")
+            if entry.stale or entry.should_refresh(get_settings().summary_xfetch_beta):
+                _refresh_in_background(request, entry)
             return SummarizeResponse(
                 post_id=request.post_id,
-                summary=cached_summary,
-                cached=True
+                summary=entry.summary,
+                cached=True,
+                stale=entry.stale,
             )
 
-        # Generate new summary
-        summary = await claude_service.summarize_post(
-            caption=request.caption,
-            image_urls=request.image_urls
+        # Concurrent misses for the same post share one model call
+        summary, cached = await summary_flight.do(
+            request.post_id,
+            lambda: _summarize_once(request),
         )
 
-        # Cache the summary
-        await cache_service.set_post_summary(request.post_id, summary)
-        logger.info(f"Generated and cached summary for post {request.post_id}")
-
         return SummarizeResponse(
             post_id=request.post_id,
             summary=summary,
-            cached=False
+            cached=cached
         )
+    except (UpstreamOverloaded, CircuitOpen) as e:
+        logger.warning(f"Shedding summarize request: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except DeadlineExceeded as e:
+        logger.warning(f"Summary deadline exceeded for post {request.post_id}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(f"Error summarizing post: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Strong references to background refreshes so they are not garbage collected
+_background_refreshes: set[asyncio.Task] = set()
+
+
+def _refresh_in_background(request: SummarizeRequest, current: SummaryEntry) -> None:
+    """Recompute a summary off the request path, once per post at a time."""
+    if summary_flight.in_flight(request.post_id):
+        return
+
+    async def refresh() -> None:
+        try:
+            await summary_flight.do(request.post_id, lambda: _summarize_once(request, replacing=current))
+        except Exception as e:
+            logger.warning(f"Background refresh failed for post {request.post_id}: {e}")
+
+    task = asyncio.create_task(refresh())
+    _background_refreshes.add(task)
+    task.add_done_callback(_background_refreshes.discard)
+
+
+async def _summarize_once(
+    request: SummarizeRequest,
+    replacing: Optional[SummaryEntry] = None,
+) -> tuple[str, bool]:
+    """
+    Summarize a post at most once across workers.
+
+    A Redis lease elects one worker to call the model; the others wait for
+    the summary to land in the cache. Returns the summary and whether it
+    came from the cache. With ``replacing`` set this is a background
+    refresh of that entry: if another worker holds the lease it is already
+    refreshing, so nothing is done.
+    """
+    settings = get_settings()
+    lock_name = f"post_summary:{request.post_id}"
+    token = await cache_service.acquire_lock(lock_name, settings.summary_lock_ttl_ms)
+
+    if token is None:
+        if replacing is not None:
+            return replacing.summary, True
+        entry = await summary_cache.wait(
+            request.post_id,
+            timeout=settings.summary_lock_wait_seconds,
+        )
+        if entry:
+            logger.info(f"Summary for post {request.post_id} computed by another worker")
+            return entry.summary, True
+        # Lease holder failed or timed out: do it ourselves
+        logger.warning(f"Timed out waiting for summary of post {request.post_id}")
+
+    try:
+        # The previous holder may have finished between our miss and the lease
+        entry = await summary_cache.get(request.post_id)
+        if replacing is not None:
+            done = entry is not None and entry.created_at > replacing.created_at
+        else:
+            done = entry is not None and not entry.stale
+        if done:
+            return entry.summary, True
+
+        # Generate new summary
+        started = time.monotonic()
+        summary = await claude_service.summarize_post(
+            caption=request.caption,
+            image_urls=request.image_urls,
+            deadline=Deadline.after(settings.summary_deadline_seconds),
+        )
+
+        # Cache the summary, remembering how long it took for early refresh
+        await summary_cache.set(request.post_id, summary, compute_seconds=time.monotonic() - started)
+        logger.info(f"Generated and cached summary for post {request.post_id}")
+        return summary, False
+    finally:
+        if token is not None:
+            await cache_service.release_lock(lock_name, token)
+
+
 @app.get("/")
 def root():
     return {"status": "ok", "service": "roborder_comment_reply"}
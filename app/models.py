@@ -113,6 +113,12 @@ class ReplyRequest(BaseModel):
         default=None,
         description="Optional seller context for highly accurate replies"
     )
+    candidates: Optional[int] = Field(
+        default=None,
+        ge=1,
+        le=5,
+        description="Parallel candidates to request; overrides the server default when set"
+    )
 
 
 class ContextUsed(BaseModel):
@@ -134,6 +140,63 @@ class ReplyResponse(BaseModel):
     language_used: Language = Field(..., description="Language used in the reply")
     context_used: ContextUsed = Field(default_factory=ContextUsed, description="Context sources used")
     fallback_used: bool = Field(default=False, description="Whether fallback mode was used")
+    candidates_generated: int = Field(default=1, description="Model calls issued for this reply")
+    speculative_used: bool = Field(default=False, description="Whether parallel candidates were requested")
+    cached: bool = Field(default=False, description="Whether the reply came from the reply cache")
+    fast_path: bool = Field(default=False, description="Whether the reply was rendered from a template")
+
+
+class BatchComment(BaseModel):
+    """One comment in a batch reply request."""
+    comment_id: str = Field(..., description="Caller's identifier for the comment")
+    comment_text: str = Field(..., description="The comment to reply to")
+    language: Optional[Language] = Field(
+        default=None,
+        description="Reply language for this comment; defaults to the batch language"
+    )
+
+
+class BatchReplyRequest(BaseModel):
+    """Request payload for replying to many comments on one post."""
+    post_id: str = Field(..., description="Unique identifier for the Instagram post")
+    post_summary: str = Field(..., description="Summary of the post content")
+    image_urls: list[str] = Field(default_factory=list, description="URLs of post images")
+    language: Language = Field(default=Language.FRENCH, description="Default reply language")
+    brand_voice: BrandVoice = Field(
+        default=BrandVoice.PROFESSIONAL_FRIENDLY,
+        description="Tone and style of the replies"
+    )
+    cta_allowed: bool = Field(default=False, description="Whether call-to-action is allowed")
+    seller_context: Optional[SellerContext] = Field(
+        default=None,
+        description="Optional seller context shared by every comment"
+    )
+    candidates: Optional[int] = Field(default=None, ge=1, le=5, description="Parallel candidates per comment")
+    comments: list[BatchComment] = Field(..., min_length=1, description="Comments to reply to")
+    stream: bool = Field(default=False, description="Stream results as NDJSON as they complete")
+
+
+class BatchReplyItem(BaseModel):
+    """Outcome for one comment of a batch."""
+    index: int = Field(..., description="Position of the comment in the request")
+    comment_id: str = Field(..., description="Caller's identifier for the comment")
+    result: Optional[ReplyResponse] = Field(default=None, description="Generated reply, if successful")
+    error: Optional[str] = Field(default=None, description="Error message, if generation failed")
+
+
+class BatchReplyResponse(BaseModel):
+    """Response payload for a batch reply request, in request order."""
+    post_id: str = Field(..., description="Unique identifier for the Instagram post")
+    results: list[BatchReplyItem] = Field(default_factory=list)
+
+
+class ReplyStreamEvent(BaseModel):
+    """One server-sent event of a streamed reply."""
+    event: str = Field(..., description="token, retry, done or error")
+    text: Optional[str] = Field(default=None, description="Text delta for token events")
+    violations: list[str] = Field(default_factory=list, description="Rules that aborted an attempt")
+    result: Optional[ReplyResponse] = Field(default=None, description="Final reply for the done event")
+    error: Optional[str] = Field(default=None, description="Error message for the error event")
 
 
 class SummarizeRequest(BaseModel):
@@ -148,6 +211,7 @@ class SummarizeResponse(BaseModel):
     post_id: str = Field(..., description="Unique identifier for the Instagram post")
     summary: str = Field(..., description="Generated summary of the post")
     cached: bool = Field(default=False, description="Whether the result was from cache")
+    stale: bool = Field(default=False, description="Whether a stale summary was served while it refreshes")
 
 
 class HealthResponse(BaseModel):
@@ -155,3 +219,8 @@ class HealthResponse(BaseModel):
     status: str = "healthy"
     version: str = "2.0.0"
     services: dict = Field(default_factory=dict)
+
+
+class MetricsResponse(BaseModel):
+    """Runtime counters for caches and upstream calls."""
+    metrics: dict = Field(default_factory=dict)
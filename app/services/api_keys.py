@@ -0,0 +1,173 @@
+import hashlib
+import hmac
+import json
+import time
+import asyncio
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+from app.config import get_settings
+from app.services.cache_service import CacheService
+
+logger = logging.getLogger(__name__)
+
+
+def api_key_digest(api_key: str) -> str:
+    """SHA-256 hex digest identifying an API key without storing it."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+@dataclass(frozen=True)
+class ApiKeyInfo:
+    """Identity and limits attached to one client API key."""
+
+    digest: str
+    tenant_id: str
+    rate_limit: Optional[int] = None  # requests per minute; None uses the default
+    burst: Optional[int] = None
+    model_tier: str = "standard"
+    admin: bool = False  # may read cross-tenant operational metrics
+
+    @property
+    def key_id(self) -> str:
+        """Short digest prefix that is safe to log."""
+        return self.digest[:12]
+
+
+# Identity used for every request when no keys are configured
+DEV_KEY = ApiKeyInfo(digest=api_key_digest("dev_mode"), tenant_id="dev", admin=True)
+
+
+def parse_key_entry(entry: dict, digest: Optional[str] = None) -> ApiKeyInfo:
+    """
+    Build an ApiKeyInfo from a file or Redis entry.
+
+    The key is given either in clear (``key``) or already hashed
+    (``key_sha256``); only the digest is kept.
+    """
+    if digest is None:
+        digest = entry.get("key_sha256") or api_key_digest(entry["key"])
+    digest = digest.lower()
+    return ApiKeyInfo(
+        digest=digest,
+        tenant_id=entry.get("tenant_id") or f"key-{digest[:8]}",
+        rate_limit=entry.get("rate_limit"),
+        burst=entry.get("burst"),
+        model_tier=entry.get("model_tier", "standard"),
+        admin=bool(entry.get("admin", False)),
+    )
+
+
+class ApiKeyRegistry:
+    """
+    Client API keys, parsed once into a digest-keyed table.
+
+    Keys come from the ``api_keys`` setting, an optional JSON file and an
+    optional Redis hash (field: key digest, value: JSON metadata). Lookups
+    hash the presented key, so the table never holds secrets and a probe
+    can only time a lookup on a digest it cannot choose; the final match is
+    still checked with ``hmac.compare_digest``. Reloads build a new table
+    and swap it in, so requests never see a partial state.
+    """
+
+    def __init__(self):
+        self.settings = get_settings()
+        self._keys: Optional[dict[str, ApiKeyInfo]] = None
+        self._redis_keys: dict[str, ApiKeyInfo] = {}
+        self.reloads = 0
+        self.reload_errors = 0
+        self.loaded_at = 0.0
+
+    def _static_keys(self) -> dict[str, ApiKeyInfo]:
+        """Keys from settings and the keys file."""
+        keys = {}
+        for raw in self.settings.api_keys.split(","):
+            if raw.strip():
+                info = parse_key_entry({"key": raw.strip()})
+                keys[info.digest] = info
+        if self.settings.api_keys_file:
+            entries = json.loads(Path(self.settings.api_keys_file).read_text(encoding="utf-8"))
+            for entry in entries:
+                info = parse_key_entry(entry)
+                keys[info.digest] = info
+        return keys
+
+    def _swap(self, keys: dict[str, ApiKeyInfo]) -> None:
+        self._keys = keys
+        self.loaded_at = time.time()
+
+    def load(self) -> None:
+        """Load keys from settings and the keys file."""
+        self._swap({**self._static_keys(), **self._redis_keys})
+        logger.info(f"Loaded {len(self._keys)} API keys")
+
+    async def reload(self, cache_service: Optional[CacheService] = None) -> None:
+        """
+        Rebuild the table from every source and swap it in.
+
+        On any error the current table keeps serving.
+        """
+        try:
+            keys = self._static_keys()
+            if cache_service is not None and self.settings.api_keys_redis_hash:
+                entries = await cache_service.get_api_keys(self.settings.api_keys_redis_hash)
+                if entries is not None:
+                    self._redis_keys = {
+                        digest.lower(): parse_key_entry(json.loads(value), digest)
+                        for digest, value in entries.items()
+                    }
+            keys.update(self._redis_keys)
+        except Exception as e:
+            self.reload_errors += 1
+            logger.error(f"API key reload failed, keeping {len(self._keys or {})} keys: {e}")
+            return
+        self._swap(keys)
+        self.reloads += 1
+        if not keys and not self.dev_mode:
+            logger.warning("No API keys loaded; every request will be rejected")
+
+    async def run_reloader(self, cache_service: Optional[CacheService], interval: float) -> None:
+        """Reload every ``interval`` seconds until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            await self.reload(cache_service)
+
+    @property
+    def dev_mode(self) -> bool:
+        """
+        True when no key source is configured and every request is allowed.
+
+        Decided from configuration alone: with a Redis source configured, an
+        empty or failed load rejects requests instead of opening the API.
+        """
+        settings = self.settings
+        has_env_keys = any(raw.strip() for raw in settings.api_keys.split(","))
+        return not (has_env_keys or settings.api_keys_file or settings.api_keys_redis_hash)
+
+    def authenticate(self, api_key: str) -> Optional[ApiKeyInfo]:
+        """Return the key's metadata, or None if it is not a valid key."""
+        if self._keys is None:
+            self.load()
+        digest = api_key_digest(api_key)
+        info = self._keys.get(digest)
+        if info is None or not hmac.compare_digest(info.digest, digest):
+            return None
+        return info
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self._keys or {}),
+            "redis_keys": len(self._redis_keys),
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+            "loaded_at": self.loaded_at,
+        }
+
+
+@lru_cache()
+def get_api_key_registry() -> ApiKeyRegistry:
+    """Get the shared API key registry."""
+    return ApiKeyRegistry()
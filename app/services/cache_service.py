@@ -1,103 +1,406 @@
 import redis.asyncio as redis
 import json
+import time
+import uuid
+import asyncio
 import logging
-from typing import Optional
+from typing import Awaitable, Callable, Iterable, Optional, TypeVar
 
 from app.config import get_settings
+from app.services.reply_similarity import StoredSignature, decode_signature, encode_signature, signature
+from app.services.resilience import CircuitBreaker, RetryPolicy
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# Delete a lock only if we still own it
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+# Token bucket refilled at ARGV[1] tokens/ms up to ARGV[2], charged ARGV[3].
+# Uses the server clock so every worker sees the same time. Returns
+# {allowed, tokens left, ms until enough tokens, ms until full}.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call("TIME")
+local now = clock[1] * 1000 + math.floor(clock[2] / 1000)
+local state = redis.call("HMGET", KEYS[1], "tokens", "ts")
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    wait = math.ceil((cost - tokens) / rate)
+end
+local full_in = math.ceil((capacity - tokens) / rate)
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "ts", now)
+redis.call("PEXPIRE", KEYS[1], full_in + 1000)
+return {allowed, math.floor(tokens), wait, full_in}
+"""
+
+# Recent replies live in Redis lists, newest first. The old JSON-string
+# values sit under "recent_replies:" and simply expire.
+RECENT_REPLIES_PREFIX = "recent_replies_list:"
+# Near-duplicate signatures, kept in a list parallel to the replies
+RECENT_SIGNATURES_PREFIX = "recent_reply_sigs:"
+
 
 class CacheService:
-    """Redis cache service for post summaries and recent replies."""
+    """
+    Redis cache service for post summaries, recent replies and post images.
+
+    Every operation goes through ``_run``: it has a time budget, failures
+    feed a circuit breaker that skips Redis for a cooldown, and any error
+    degrades to the caller's default (usually a cache miss). Image records
+    are bulk operations with their own budget and breaker, so slow
+    multi-megabyte transfers never switch off summaries, leases or rate
+    limiting. If Redis is
+    unreachable at startup a background task keeps reconnecting with backoff.
+    """
 
     def __init__(self):
         self.settings = get_settings()
         self._client: Optional[redis.Redis] = None
+        self._token_bucket = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self.breaker = CircuitBreaker(
+            "redis",
+            failure_threshold=self.settings.redis_breaker_failure_threshold,
+            reset_timeout=self.settings.redis_breaker_reset_seconds,
+        )
+        self.bulk_breaker = CircuitBreaker(
+            "redis-bulk",
+            failure_threshold=self.settings.redis_breaker_failure_threshold,
+            reset_timeout=self.settings.redis_breaker_reset_seconds,
+        )
+        self.reconnect_policy = RetryPolicy(
+            max_attempts=0,  # unbounded; the loop runs until Redis answers
+            base_delay=self.settings.redis_reconnect_base_delay,
+            max_delay=self.settings.redis_reconnect_max_delay,
+        )
+        self.reconnect_attempts = 0
+        self.skipped = 0
+        self.errors = 0
 
-    async def connect(self) -> None:
-        """Establish Redis connection."""
+    def _new_client(self) -> redis.Redis:
+        return redis.from_url(
+            self.settings.redis_url,
+            encoding="utf-8",
+            decode_responses=True,
+            socket_connect_timeout=self.settings.redis_connect_timeout,
+        )
+
+    async def _try_connect(self) -> bool:
+        client = self._new_client()
         try:
-            self._client = redis.from_url(
-                self.settings.redis_url,
-                encoding="utf-8",
-                decode_responses=True
-            )
-            await self._client.ping()
-            logger.info("Redis connection established")
+            await client.ping()
         except Exception as e:
-            logger.warning(f"Redis connection failed: {e}. Caching disabled.")
-            self._client = None
+            await client.close()
+            logger.warning(f"Redis connection failed: {e}")
+            return False
+        self._client = client
+        self._token_bucket = None
+        self.breaker.record_success()
+        self.bulk_breaker.record_success()
+        logger.info("Redis connection established")
+        return True
+
+    async def connect(self) -> None:
+        """Establish Redis connection, reconnecting in the background on failure."""
+        if not await self._try_connect():
+            logger.warning("Caching disabled until Redis is reachable")
+            self._reconnect_task = asyncio.create_task(self._reconnect_loop())
+
+    async def _reconnect_loop(self) -> None:
+        attempt = 0
+        while True:
+            attempt += 1
+            self.reconnect_attempts += 1
+            await asyncio.sleep(self.reconnect_policy.backoff(min(attempt, 16)))
+            if await self._try_connect():
+                self._reconnect_task = None
+                return
 
     async def disconnect(self) -> None:
         """Close Redis connection."""
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
         if self._client:
             await self._client.close()
             logger.info("Redis connection closed")
 
     @property
     def is_connected(self) -> bool:
-        """Check if Redis is connected."""
-        return self._client is not None
+        """Check if Redis is connected and not being skipped by the breaker."""
+        return self._client is not None and self.breaker.state != CircuitBreaker.OPEN
 
-    async def get_post_summary(self, post_id: str) -> Optional[str]:
-        """Retrieve cached post summary."""
-        if not self._client:
-            return None
+    async def _run(
+        self,
+        op: str,
+        fn: Callable[[redis.Redis], Awaitable[T]],
+        default: T,
+        bulk: bool = False,
+    ) -> T:
+        """
+        Run one Redis operation within the timeout budget, or return ``default``.
+
+        ``bulk`` operations use ``redis_bulk_op_timeout`` and ``bulk_breaker``.
+        """
+        client = self._client
+        breaker = self.bulk_breaker if bulk else self.breaker
+        timeout = self.settings.redis_bulk_op_timeout if bulk else self.settings.redis_op_timeout
+        if client is None or not breaker.allow():
+            self.skipped += 1
+            return default
         try:
-            return await self._client.get(f"post_summary:{post_id}")
+            async with asyncio.timeout(timeout):
+                result = await fn(client)
+        except asyncio.CancelledError:
+            breaker.abandon()
+            raise
         except Exception as e:
-            logger.error(f"Cache get error: {e}")
-            return None
+            self.errors += 1
+            breaker.record_failure()
+            logger.error(f"Cache {op} error: {e!r}")
+            return default
+        breaker.record_success()
+        return result
 
-    async def set_post_summary(self, post_id: str, summary: str) -> None:
-        """Cache post summary."""
-        if not self._client:
-            return
-        try:
-            await self._client.setex(
-                f"post_summary:{post_id}",
-                self.settings.post_summary_ttl,
-                summary
+    async def get_post_summary(self, post_id: str) -> Optional[str]:
+        """Retrieve cached post summary."""
+        return await self._run("get", lambda r: r.get(f"post_summary:{post_id}"), None)
+
+    async def set_post_summary(self, post_id: str, summary: str, ttl: Optional[int] = None) -> None:
+        """Cache post summary (``ttl`` defaults to ``post_summary_ttl``)."""
+        await self._run(
+            "set",
+            lambda r: r.setex(f"post_summary:{post_id}", ttl or self.settings.post_summary_ttl, summary),
+            None,
+        )
+
+    async def wait_for_post_summary(
+        self,
+        post_id: str,
+        timeout: float,
+        poll_interval: float = 0.1,
+    ) -> Optional[str]:
+        """Poll for a summary another worker is computing, up to ``timeout`` seconds."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            summary = await self.get_post_summary(post_id)
+            if summary:
+                return summary
+            if not self.is_connected:
+                return None
+            await asyncio.sleep(poll_interval)
+        return None
+
+    async def acquire_lock(self, name: str, ttl_ms: int) -> Optional[str]:
+        """
+        Take a cross-worker lease.
+
+        Returns the lease token, or None when another worker holds it. Without
+        Redis there is nobody to coordinate with, so the lease is always granted.
+        """
+        token = uuid.uuid4().hex
+
+        async def acquire(r: redis.Redis) -> Optional[str]:
+            acquired = await r.set(f"lock:{name}", token, nx=True, px=ttl_ms)
+            return token if acquired else None
+
+        return await self._run("lock", acquire, token)
+
+    async def release_lock(self, name: str, token: str) -> None:
+        """Release a lease if it is still ours."""
+        await self._run("lock", lambda r: r.eval(RELEASE_LOCK_SCRIPT, 1, f"lock:{name}", token), None)
+
+    async def take_tokens(
+        self,
+        name: str,
+        rate_per_ms: float,
+        capacity: int,
+        cost: int = 1,
+    ) -> Optional[tuple[bool, int, int, int]]:
+        """
+        Charge a shared token bucket in one round trip.
+
+        Returns (allowed, tokens left, ms until allowed, ms until full), or
+        None when Redis cannot answer so the caller can fall back.
+        """
+        async def take(r: redis.Redis) -> tuple[bool, int, int, int]:
+            if self._token_bucket is None:
+                # EVALSHA after the first call; redis-py reloads on NOSCRIPT
+                self._token_bucket = r.register_script(TOKEN_BUCKET_SCRIPT)
+            allowed, tokens, wait_ms, full_ms = await self._token_bucket(
+                keys=[f"ratelimit:{name}"],
+                args=[rate_per_ms, capacity, cost],
             )
-        except Exception as e:
-            logger.error(f"Cache set error: {e}")
+            return bool(allowed), int(tokens), int(wait_ms), int(full_ms)
 
-    async def get_recent_replies(self, account_id: str) -> list[str]:
-        """Get recent replies for an account to prevent repetition."""
-        if not self._client:
-            return []
-        try:
-            data = await self._client.get(f"recent_replies:{account_id}")
-            return json.loads(data) if data else []
-        except Exception as e:
-            logger.error(f"Cache get error: {e}")
-            return []
+        return await self._run("rate limit", take, None)
+
+    async def get_api_keys(self, hash_name: str) -> Optional[dict[str, str]]:
+        """All entries of the API key hash, or None when Redis cannot answer."""
+        return await self._run("get", lambda r: r.hgetall(hash_name), None)
+
+    async def get_recent_replies(self, account_id: str, limit: Optional[int] = None) -> list[str]:
+        """Get up to ``limit`` most recent replies for an account, oldest first."""
+        limit = min(limit or self.settings.recent_replies_max, self.settings.recent_replies_max)
+        replies = await self._run(
+            "get", lambda r: r.lrange(f"{RECENT_REPLIES_PREFIX}{account_id}", 0, limit - 1), []
+        )
+        return replies[::-1]
+
+    async def get_recent_signatures(self, account_id: str) -> list[StoredSignature]:
+        """Near-duplicate signatures of an account's recent replies, decoded once here."""
+        encoded = await self._run(
+            "get",
+            lambda r: r.lrange(
+                f"{RECENT_SIGNATURES_PREFIX}{account_id}", 0, self.settings.recent_replies_max - 1
+            ),
+            [],
+        )
+        return [decode_signature(sig) for sig in encoded]
 
     async def add_recent_reply(self, account_id: str, reply: str) -> None:
         """Add a reply to the recent replies list."""
-        if not self._client:
+        await self.add_recent_replies([(account_id, reply)])
+
+    async def add_recent_replies(self, entries: Iterable[tuple[str, str]]) -> None:
+        """
+        Record replies for one or more accounts in a single round trip.
+
+        Each account's reply and signature lists are pushed, trimmed and
+        re-armed inside one MULTI/EXEC, so concurrent writers never lose
+        each other's replies and the two lists stay aligned.
+        """
+        by_account: dict[str, list[str]] = {}
+        for account_id, reply in entries:
+            by_account.setdefault(account_id, []).append(reply)
+        if not by_account:
             return
-        try:
-            key = f"recent_replies:{account_id}"
-            replies = await self.get_recent_replies(account_id)
-            replies.append(reply)
-            # Keep only last 50 replies
-            replies = replies[-50:]
-            await self._client.setex(
-                key,
-                self.settings.recent_replies_ttl,
-                json.dumps(replies)
-            )
-        except Exception as e:
-            logger.error(f"Cache set error: {e}")
+
+        async def write(r: redis.Redis) -> None:
+            async with r.pipeline(transaction=True) as pipe:
+                for account_id, replies in by_account.items():
+                    signatures = [encode_signature(signature(reply)) for reply in replies]
+                    for key, values in (
+                        (f"{RECENT_REPLIES_PREFIX}{account_id}", replies),
+                        (f"{RECENT_SIGNATURES_PREFIX}{account_id}", signatures),
+                    ):
+                        pipe.lpush(key, *values)
+                        pipe.ltrim(key, 0, self.settings.recent_replies_max - 1)
+                        pipe.expire(key, self.settings.recent_replies_ttl)
+                await pipe.execute()
+
+        await self._run("set", write, None)
+
+    async def get_reply_variants(self, key: str, limit: int) -> list[str]:
+        """Stored reply variants for a repeated comment."""
+        return await self._run("get", lambda r: r.lrange(f"reply_cache:{key}", 0, limit - 1), [])
+
+    async def add_reply_variant(self, key: str, reply: str, max_variants: int, ttl: int) -> None:
+        """Add a distinct reply to a comment's variant pool, keeping the newest ``max_variants``."""
+        async def write(r: redis.Redis) -> None:
+            name = f"reply_cache:{key}"
+            async with r.pipeline(transaction=True) as pipe:
+                pipe.lrem(name, 0, reply)
+                pipe.lpush(name, reply)
+                pipe.ltrim(name, 0, max_variants - 1)
+                pipe.expire(name, ttl)
+                await pipe.execute()
+
+        await self._run("set", write, None)
+
+    async def get_image_by_url(self, url_key: str) -> Optional[dict]:
+        """Retrieve a cached image record through its URL -> content-hash pointer."""
+        content_hash = await self._run("get", lambda r: r.get(f"image_url:{url_key}"), None, bulk=True)
+        if not content_hash:
+            return None
+        return await self.get_image_by_hash(content_hash)
+
+    async def get_image_by_hash(self, content_hash: str) -> Optional[dict]:
+        """Retrieve a cached image record by the hash of its content."""
+        data = await self._run("get", lambda r: r.get(f"image:{content_hash}"), None, bulk=True)
+        return json.loads(data) if data else None
+
+    async def set_image(self, url_key: str, content_hash: str, record: dict, ttl: int) -> None:
+        """Cache an image record under its content hash and point the URL at it."""
+        async def write(r: redis.Redis) -> None:
+            async with r.pipeline(transaction=False) as pipe:
+                pipe.setex(f"image:{content_hash}", ttl, json.dumps(record))
+                pipe.setex(f"image_url:{url_key}", ttl, content_hash)
+                await pipe.execute()
+
+        await self._run("set", write, None, bulk=True)
+
+    async def publish(self, channel: str, message: str) -> None:
+        """Publish a message to other workers; dropped if Redis is unavailable."""
+        await self._run("publish", lambda r: r.publish(channel, message), None)
+
+    async def listen(
+        self,
+        channel: str,
+        on_message: Callable[[str], None],
+        on_subscribe: Callable[[], None],
+    ) -> None:
+        """
+        Deliver messages published on ``channel`` until cancelled.
+
+        The subscription is re-established after errors and once Redis comes
+        back. ``on_subscribe`` runs after every (re)subscription: anything
+        published before it was missed, so the caller can drop state that
+        relied on those messages.
+        """
+        attempt = 0
+        while True:
+            client = self._client
+            if client is None:
+                await asyncio.sleep(self.settings.redis_reconnect_base_delay)
+                continue
+            pubsub = client.pubsub()
+            try:
+                await pubsub.subscribe(channel)
+                on_subscribe()
+                attempt = 0
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        on_message(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                attempt += 1
+                logger.warning(f"Cache subscription to {channel} lost: {e!r}")
+                await asyncio.sleep(self.reconnect_policy.backoff(min(attempt, 16)))
+            finally:
+                await pubsub.aclose()
 
     async def health_check(self) -> dict:
-        """Check Redis health status."""
+        """Check Redis health status, including reconnect and breaker state."""
+        details = {
+            "redis_circuit": self.breaker.state,
+            "redis_bulk_circuit": self.bulk_breaker.state,
+            "redis_reconnect_attempts": self.reconnect_attempts,
+            "redis_errors": self.errors,
+            "redis_skipped_ops": self.skipped,
+        }
         if not self._client:
-            return {"redis": "disconnected"}
+            status = "reconnecting" if self._reconnect_task is not None else "disconnected"
+            return {"redis": status, **details}
         try:
-            await self._client.ping()
-            return {"redis": "healthy"}
+            async with asyncio.timeout(self.settings.redis_op_timeout):
+                await self._client.ping()
+            return {"redis": "healthy", **details}
         except Exception:
-            return {"redis": "unhealthy"}
+            return {"redis": "unhealthy", **details}
@@ -1,27 +1,56 @@
 import httpx
+import json
+import time
 import base64
+import asyncio
 import logging
-from typing import Optional
-from pathlib import Path
+from contextlib import aclosing, asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+from urllib.parse import urlsplit
 
 from app.config import get_settings
-from app.models import Language, SellerContext
+from app.models import CommentIntent, Language, SellerContext
+from app.services.cache_service import CacheService
+from app.services.concurrency_limiter import AdaptiveLimiter
+from app.services.model_router import CALL_LANGUAGE, CALL_REPLY, CALL_SUMMARY, ModelRoute, ModelRouter
+from app.services.resilience import (
+    CircuitBreaker,
+    CircuitOpen,
+    Deadline,
+    DeadlineExceeded,
+    LatencyTracker,
+    RetryPolicy,
+)
+from app.services.image_cache import CachedImage, ImageCache, content_hash
+from app.services.image_processor import ImageProcessor
+from app.services.prompt_registry import get_prompt_registry
+from app.services.language_detector import LanguageDetector
 
 logger = logging.getLogger(__name__)
 
-# Load prompts from files
-PROMPTS_DIR = Path(__file__).parent.parent / "prompts"
-
 # OpenRouter API configuration
 OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1/chat/completions"
 
+# Server-sent event sentinel marking the end of a streamed completion
+STREAM_DONE = "[DONE]"
+
+
+def parse_stream_line(line: str) -> Optional[str]:
+    """Text delta carried by one SSE line of a streamed completion, if any."""
+    if not line.startswith("data:"):
+        # Blank separators and ": keep-alive" comments
+        return None
+    data = line[5:].strip()
+    if not data or data == STREAM_DONE:
+        return None
+    choices = json.loads(data).get("choices") or [{}]
+    return choices[0].get("delta", {}).get("content") or None
+
 
 def load_prompt(filename: str) -> str:
-    """Load a prompt template from file."""
-    filepath = PROMPTS_DIR / filename
-    if filepath.exists():
-        return filepath.read_text(encoding="utf-8")
-    raise FileNotFoundError(f"Prompt file not found: {filepath}")
+    """Return the raw text of a preloaded prompt template."""
+    return get_prompt_registry().get(filename).text
 
 
 def build_seller_context_string(ctx: Optional[SellerContext], language: Language = Language.FRENCH) -> str:
@@ -141,10 +170,51 @@ def build_seller_context_string(ctx: Optional[SellerContext], language: Language
     return "\n".join(parts)
 
 
+@dataclass
+class PostContext:
+    """Per-post parts of a reply request, shared by every comment on the post."""
+    language: Language
+    seller_context: str
+    image_parts: list[dict]
+
+
+@dataclass
+class Completion:
+    """Text of a chat completion and the token usage the provider reported."""
+    text: str
+    usage: Optional[dict] = None
+
+
+@dataclass
+class PreparedReply:
+    """A fully built reply request that can be re-submitted without rebuilding it."""
+    system_prompt: str
+    image_parts: list[dict]
+    language: Language
+    route: Optional[ModelRoute] = None
+
+    @property
+    def user_text(self) -> str:
+        # Use language-appropriate user message
+        if self.language in (Language.ARABIC, Language.TUNISIAN):
+            return "ولّد جواب على التعليق بناءً على الصورة والكونتكست."
+        return "Génère une réponse à ce commentaire basée sur l'image et le contexte fourni."
+
+    def messages(self, retry_hint: Optional[str] = None) -> list[dict]:
+        """Chat messages for this payload (OpenAI format for vision)."""
+        content = [*self.image_parts, {"type": "text", "text": self.user_text}]
+        if retry_hint:
+            content.append({"type": "text", "text": retry_hint})
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": content}
+        ]
+
+
 class ClaudeService:
     """Service for interacting with Claude via OpenRouter API."""
 
-    def __init__(self):
+    def __init__(self, cache_service: Optional[CacheService] = None):
         self.settings = get_settings()
         self.api_key = self.settings.anthropic_api_key
         self.headers = {
@@ -153,137 +223,569 @@ class ClaudeService:
             "HTTP-Referer": "https://app.roborder.ai",
             "X-Title": "Roborder AI Reply Service"
         }
+        self._http: Optional[httpx.AsyncClient] = None
+        self._host_slots: dict[str, asyncio.Semaphore] = {}
+        self._image_fetch_slots = asyncio.Semaphore(self.settings.image_fetch_concurrency_global)
+        self.image_processor = ImageProcessor()
+        self.image_cache = ImageCache(cache_service, profile=self.image_processor.profile)
+        self.prompts = get_prompt_registry()
+        self.limiter = AdaptiveLimiter()
+        self.router = ModelRouter()
+        # One breaker per model, so a failing model does not block its fallbacks
+        self.breakers: dict[str, CircuitBreaker] = {}
+        self.retry_policy = RetryPolicy(
+            max_attempts=self.settings.retry_max_attempts,
+            base_delay=self.settings.retry_base_delay,
+            max_delay=self.settings.retry_max_delay,
+        )
+        self.latency = LatencyTracker()
+        self.language_detector = LanguageDetector()
+        self.retries = 0
+        self.hedges = 0
+
+    async def connect(self) -> None:
+        """Open the shared, pooled HTTP/2 client used for all outbound traffic."""
+        if self._http is not None:
+            return
+        self._http = self._build_http_client()
+        logger.info(
+            f"HTTP client pool ready (max_connections={self.settings.http_max_connections}, "
+            f"per_host={self.settings.http_max_connections_per_host})"
+        )
 
-    def _get_system_prompt(self, language: Language) -> str:
-        """Get the appropriate system prompt for the language."""
+    async def disconnect(self) -> None:
+        """Close the shared HTTP client and release pooled connections."""
+        self.image_processor.shutdown()
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+            logger.info("HTTP client pool closed")
+
+    def _build_http_client(self) -> httpx.AsyncClient:
+        """Create a keep-alive HTTP/2 client with configured pool limits."""
+        limits = httpx.Limits(
+            max_connections=self.settings.http_max_connections,
+            max_keepalive_connections=self.settings.http_max_keepalive_connections,
+            keepalive_expiry=self.settings.http_keepalive_expiry,
+        )
+        timeout = httpx.Timeout(
+            self.settings.openrouter_timeout,
+            connect=self.settings.http_connect_timeout,
+        )
+        return httpx.AsyncClient(http2=True, limits=limits, timeout=timeout)
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        """Shared HTTP client, created lazily if the lifespan did not open it."""
+        if self._http is None:
+            self._http = self._build_http_client()
+        return self._http
+
+    @asynccontextmanager
+    async def _host_slot(self, url: str) -> AsyncIterator[None]:
+        """Cap concurrent requests to a single image host (httpx only limits the whole pool)."""
+        host = urlsplit(url).netloc
+        slot = self._host_slots.get(host)
+        if slot is None:
+            slot = asyncio.Semaphore(self.settings.http_max_connections_per_host)
+            self._host_slots[host] = slot
+        async with slot:
+            yield
+
+    def breaker_for(self, model: str) -> CircuitBreaker:
+        """Circuit breaker tracking one upstream model."""
+        breaker = self.breakers.get(model)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                model,
+                failure_threshold=self.settings.breaker_failure_threshold,
+                reset_timeout=self.settings.breaker_reset_seconds,
+            )
+            self.breakers[model] = breaker
+        return breaker
+
+    @staticmethod
+    def _settle_breaker(breaker: CircuitBreaker, error: Exception) -> None:
+        """
+        Give the breaker its verdict on a non-retryable error.
+
+        A 4xx means the upstream answered, so it counts as healthy. Local
+        errors (limiter full, deadline spent) never reached it and give no
+        verdict, so a half-open breaker keeps waiting for a real probe.
+        """
+        if isinstance(error, httpx.HTTPStatusError):
+            breaker.record_success()
+        else:
+            breaker.abandon()
+
+    def _system_prompt_name(self, language: Language) -> str:
+        """Get the system prompt template name for the language."""
         prompt_files = {
             Language.FRENCH: "system_prompt_fr.txt",
             Language.ENGLISH: "system_prompt_en.txt",
             Language.TUNISIAN: "system_prompt_tn.txt",
             Language.ARABIC: "system_prompt_tn.txt",  # Use Tunisian for Arabic
         }
-        filename = prompt_files.get(language, "system_prompt_fr.txt")
-        return load_prompt(filename)
+        return prompt_files.get(language, "system_prompt_fr.txt")
+
+    async def _download_image(self, url: str) -> tuple[bytes, str]:
+        """Download raw image bytes and infer the media type."""
+        async with self._host_slot(url):
+            response = await self.http_client.get(
+                url,
+                follow_redirects=True,
+                timeout=self.settings.image_fetch_timeout,
+            )
+        response.raise_for_status()
+
+        content_type = response.headers.get("content-type", "image/jpeg")
+        if "png" in content_type:
+            media_type = "image/png"
+        elif "gif" in content_type:
+            media_type = "image/gif"
+        elif "webp" in content_type:
+            media_type = "image/webp"
+        else:
+            media_type = "image/jpeg"
+        return response.content, media_type
+
+    async def fetch_image(self, url: str) -> CachedImage:
+        """Fetch a preprocessed image as a data URI, going through the image cache."""
+        cached = await self.image_cache.get(url)
+        if cached is not None:
+            return cached
+
+        raw, media_type = await self._download_image(url)
+        # Key on the source bytes plus output profile (as URL keys are) so a config change re-processes
+        digest = f"{content_hash(raw)}:{self.image_processor.profile}"
+        image = await self.image_cache.get_by_hash(digest)
+        if image is None:
+            data, media_type = await self.image_processor.process(raw, media_type)
+            image_data = base64.standard_b64encode(data).decode("utf-8")
+            image = CachedImage(
+                data_uri=f"data:{media_type};base64,{image_data}",
+                media_type=media_type,
+                content_hash=digest,
+            )
+        await self.image_cache.put(url, image)
+        return image
 
     async def fetch_image_as_base64(self, url: str) -> tuple[str, str]:
         """Fetch image from URL and convert to base64."""
-        async with httpx.AsyncClient() as http_client:
-            response = await http_client.get(url, follow_redirects=True)
-            response.raise_for_status()
-
-            content_type = response.headers.get("content-type", "image/jpeg")
-            if "png" in content_type:
-                media_type = "image/png"
-            elif "gif" in content_type:
-                media_type = "image/gif"
-            elif "webp" in content_type:
-                media_type = "image/webp"
-            else:
-                media_type = "image/jpeg"
+        image = await self.fetch_image(url)
+        return image.base64_data, image.media_type
+
+    async def _fetch_image_part(self, url: str, request_slots: asyncio.Semaphore) -> Optional[dict]:
+        """Fetch one image as an OpenAI-style content part, or None on failure."""
+        try:
+            async with request_slots, self._image_fetch_slots:
+                image = await self.fetch_image(url)
+        except Exception as e:
+            logger.warning(f"Failed to fetch image {url}: {e}")
+            return None
+        return {
+            "type": "image_url",
+            "image_url": {
+                "url": image.data_uri
+            }
+        }
 
-            image_data = base64.standard_b64encode(response.content).decode("utf-8")
-            return image_data, media_type
+    async def _fetch_image_parts(self, image_urls: list[str]) -> list[dict]:
+        """Fetch all images concurrently, keeping input order and skipping failures."""
+        if not image_urls:
+            return []
+        request_slots = asyncio.Semaphore(self.settings.image_fetch_concurrency_per_request)
+        parts = await asyncio.gather(
+            *(self._fetch_image_part(url, request_slots) for url in image_urls)
+        )
+        return [part for part in parts if part is not None]
+
+    async def _post_completion(self, payload: dict, deadline: Deadline) -> Completion:
+        """One attempt at a chat completion, bounded by the deadline."""
+        timeout = deadline.timeout(self.settings.openrouter_timeout)
+        # The adaptive limiter is the only cap on OpenRouter: a second, fixed
+        # cap inside it would queue callers outside its bounded, deadline-aware queue
+        async with self.limiter.slot(timeout):
+            started = time.monotonic()
+            response = await self.http_client.post(
+                OPENROUTER_BASE_URL,
+                headers=self.headers,
+                json=payload,
+                timeout=deadline.timeout(self.settings.openrouter_timeout),
+            )
+            response.raise_for_status()
+        self.latency.record(time.monotonic() - started)
+        data = response.json()
+        return Completion(data["choices"][0]["message"]["content"].strip(), data.get("usage"))
+
+    async def _post_completion_hedged(self, payload: dict, deadline: Deadline) -> Completion:
+        """
+        Attempt a completion, firing a second copy if the first runs past p95.
+
+        Whichever finishes first wins; the other is cancelled.
+        """
+        hedge_after = None
+        if len(self.latency) >= self.settings.hedge_min_samples:
+            hedge_after = self.latency.percentile(0.95)
+        if hedge_after is None or hedge_after >= deadline.remaining():
+            return await self._post_completion(payload, deadline)
+
+        tasks = {asyncio.ensure_future(self._post_completion(payload, deadline))}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done:
+                self.hedges += 1
+                tasks.add(asyncio.ensure_future(self._post_completion(payload, deadline)))
+            error: Optional[BaseException] = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
 
     async def _call_openrouter(
         self,
         model: str,
         messages: list[dict],
-        max_tokens: int = 150
+        max_tokens: int = 150,
+        deadline: Optional[Deadline] = None,
+        temperature: Optional[float] = None,
     ) -> str:
-        """Make a request to OpenRouter API."""
+        """Make a request to OpenRouter API with retries and a circuit breaker."""
+        completion = await self._request_completion(model, messages, max_tokens, deadline, temperature)
+        return completion.text
+
+    async def _request_completion(
+        self,
+        model: str,
+        messages: list[dict],
+        max_tokens: int = 150,
+        deadline: Optional[Deadline] = None,
+        temperature: Optional[float] = None,
+    ) -> Completion:
+        """One model's completion with retries and its circuit breaker."""
         payload = {
             "model": model,
             "messages": messages,
             "max_tokens": max_tokens
         }
+        if temperature is not None:
+            payload["temperature"] = temperature
+        deadline = deadline or Deadline.after(self.settings.openrouter_timeout)
+        attempt = self._post_completion_hedged if self.settings.hedge_enabled else self._post_completion
+        breaker = self.breaker_for(model)
+
+        for attempt_number in range(1, self.retry_policy.max_attempts + 1):
+            breaker.check()
+            try:
+                result = await attempt(payload, deadline)
+            except asyncio.CancelledError:
+                # Cancelled callers (e.g. losing speculative candidates) give no verdict
+                breaker.abandon()
+                raise
+            except Exception as e:
+                if not RetryPolicy.is_retryable(e):
+                    self._settle_breaker(breaker, e)
+                    raise
+                breaker.record_failure()
+                if attempt_number == self.retry_policy.max_attempts:
+                    raise
+                delay = self.retry_policy.backoff(attempt_number, e)
+                if delay >= deadline.remaining():
+                    raise DeadlineExceeded("No time left to retry model call") from e
+                self.retries += 1
+                logger.warning(f"Model call failed ({e}); retry {attempt_number} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+            else:
+                breaker.record_success()
+                return result
 
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
+    @staticmethod
+    def _should_fall_back(error: Exception) -> bool:
+        """Whether the next model in a route may succeed where this one failed."""
+        return isinstance(error, (CircuitOpen, DeadlineExceeded)) or RetryPolicy.is_retryable(error)
+
+    async def _call_route(
+        self,
+        route: ModelRoute,
+        messages: list[dict],
+        max_tokens: int,
+        deadline: Optional[Deadline] = None,
+    ) -> str:
+        """
+        Complete a call on a route, falling back along its model chain.
+
+        A model that errors, has an open breaker or runs past the route's
+        ``attempt_timeout`` hands over to the next one; the last model gets
+        whatever remains of the deadline.
+        """
+        deadline = deadline or Deadline.after(self.settings.openrouter_timeout)
+        for index, model in enumerate(route.models):
+            last = index == len(route.models) - 1
+            started = time.monotonic()
+            try:
+                # A slow model is cancelled, which leaves its breaker untouched
+                async with asyncio.timeout(None if last else route.attempt_timeout):
+                    completion = await self._request_completion(
+                        model, messages, route.max_tokens or max_tokens, deadline, route.temperature
+                    )
+            except TimeoutError:
+                if last:
+                    raise
+                self.router.record_failure(route, model, DeadlineExceeded(f"No answer within {route.attempt_timeout}s"))
+                continue
+            except Exception as e:
+                self.router.record_failure(route, model, e)
+                if last or not self._should_fall_back(e):
+                    raise
+                continue
+            self.router.record_success(route, model, time.monotonic() - started, completion.usage)
+            return completion.text
+
+    async def _stream_attempt(self, payload: dict, deadline: Deadline) -> AsyncIterator[str]:
+        """One streamed completion attempt, yielding text deltas."""
+        timeout = deadline.timeout(self.settings.openrouter_timeout)
+        # Only the limiter caps OpenRouter, as in _post_completion
+        async with self.limiter.slot(timeout):
+            async with self.http_client.stream(
+                "POST",
                 OPENROUTER_BASE_URL,
                 headers=self.headers,
-                json=payload
+                json=payload,
+                timeout=timeout,
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if deadline.expired:
+                        raise DeadlineExceeded("Model stream ran past the request deadline")
+                    if line.startswith("data:") and line[5:].strip() == STREAM_DONE:
+                        return
+                    delta = parse_stream_line(line)
+                    if delta:
+                        yield delta
+
+    async def _stream_openrouter(
+        self,
+        model: str,
+        messages: list[dict],
+        max_tokens: int = 150,
+        deadline: Optional[Deadline] = None,
+        temperature: Optional[float] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream a completion from OpenRouter as text deltas.
+
+        Failures before the first delta are retried like ``_call_openrouter``;
+        after that they propagate. Closing the iterator closes the upstream
+        response, which stops generation and token billing.
+        """
+        payload = {
+            "model": model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "stream": True,
+        }
+        if temperature is not None:
+            payload["temperature"] = temperature
+        deadline = deadline or Deadline.after(self.settings.openrouter_timeout)
+        breaker = self.breaker_for(model)
+
+        for attempt_number in range(1, self.retry_policy.max_attempts + 1):
+            breaker.check()
+            started = False
+            try:
+                async for delta in self._stream_attempt(payload, deadline):
+                    if not started:
+                        # Upstream answered; what happens to the text is not its health
+                        started = True
+                        breaker.record_success()
+                    yield delta
+            except (asyncio.CancelledError, GeneratorExit):
+                if not started:
+                    breaker.abandon()
+                raise
+            except Exception as e:
+                if started:
+                    raise
+                if not RetryPolicy.is_retryable(e):
+                    self._settle_breaker(breaker, e)
+                    raise
+                breaker.record_failure()
+                if attempt_number == self.retry_policy.max_attempts:
+                    raise
+                delay = self.retry_policy.backoff(attempt_number, e)
+                if delay >= deadline.remaining():
+                    raise DeadlineExceeded("No time left to retry model stream") from e
+                self.retries += 1
+                logger.warning(f"Model stream failed ({e}); retry {attempt_number} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+            else:
+                if not started:
+                    breaker.record_success()
+                return
+
+    async def _stream_route(
+        self,
+        route: ModelRoute,
+        messages: list[dict],
+        max_tokens: int,
+        deadline: Optional[Deadline] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream a completion on a route, falling back only before the first delta.
+
+        ``attempt_timeout`` does not apply: a stream that has started is
+        already answering, so it keeps the whole deadline.
+        """
+        for index, model in enumerate(route.models):
+            last = index == len(route.models) - 1
+            started = time.monotonic()
+            produced = False
+            deltas = self._stream_openrouter(model, messages, route.max_tokens or max_tokens, deadline, route.temperature)
+            try:
+                async with aclosing(deltas):
+                    async for delta in deltas:
+                        produced = True
+                        yield delta
+            except Exception as e:
+                self.router.record_failure(route, model, e)
+                if produced or last or not self._should_fall_back(e):
+                    raise
+                continue
+            self.router.record_success(route, model, time.monotonic() - started)
+            return
+
+    def resilience_stats(self) -> dict:
+        """Breaker states and retry/hedge counters for metrics."""
+        return {
+            "breakers": {model: breaker.stats() for model, breaker in self.breakers.items()},
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "latency_p95": self.latency.percentile(0.95),
+        }
+
+    async def prepare_post_context(
+        self,
+        image_urls: list[str],
+        language: Language = Language.FRENCH,
+        seller_context: Optional[SellerContext] = None,
+    ) -> PostContext:
+        """Render the seller context and fetch the post images once."""
+        contexts = await self.prepare_post_contexts(image_urls, {language}, seller_context)
+        return contexts[language]
+
+    async def prepare_post_contexts(
+        self,
+        image_urls: list[str],
+        languages: set[Language],
+        seller_context: Optional[SellerContext] = None,
+    ) -> dict[Language, PostContext]:
+        """Fetch the post images once and render the seller context per language."""
+        image_parts = await self._fetch_image_parts(image_urls)
+        return {
+            language: PostContext(
+                language=language,
+                seller_context=build_seller_context_string(seller_context, language),
+                image_parts=image_parts,
             )
-            response.raise_for_status()
-            data = response.json()
-            return data["choices"][0]["message"]["content"].strip()
+            for language in languages
+        }
 
-    async def generate_reply(
+    def prepare_reply(
+        self,
+        post_context: PostContext,
+        post_summary: str,
+        comment_text: str,
+        intents: tuple[CommentIntent, ...] = (),
+        model_tier: Optional[str] = None,
+    ) -> PreparedReply:
+        """Build the system prompt for one comment on top of a post context."""
+        system_prompt = self.prompts.render(
+            self._system_prompt_name(post_context.language),
+            SELLER_CONTEXT=post_context.seller_context,
+            POST_SUMMARY=post_summary,
+            COMMENT_TEXT=comment_text,
+        )
+        return PreparedReply(
+            system_prompt=system_prompt,
+            image_parts=post_context.image_parts,
+            language=post_context.language,
+            route=self.router.route(CALL_REPLY, intents, model_tier),
+        )
+
+    async def prepare_reply_request(
         self,
         post_summary: str,
         comment_text: str,
         image_urls: list[str],
         language: Language = Language.FRENCH,
         seller_context: Optional[SellerContext] = None,
+        intents: tuple[CommentIntent, ...] = (),
+        model_tier: Optional[str] = None,
+    ) -> PreparedReply:
+        """Build a reusable reply payload for a single comment."""
+        post_context = await self.prepare_post_context(image_urls, language, seller_context)
+        return self.prepare_reply(post_context, post_summary, comment_text, intents, model_tier)
+
+    async def generate_from_prepared(
+        self,
+        prepared: PreparedReply,
+        retry_hint: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
     ) -> str:
-        """Generate a reply to a comment using Claude Vision via OpenRouter."""
-        # Build seller context string
-        seller_context_str = build_seller_context_string(seller_context, language)
-
-        # Build system prompt with placeholders replaced
-        system_prompt = self._get_system_prompt(language)
-        system_prompt = system_prompt.replace("{{SELLER_CONTEXT}}", seller_context_str)
-        system_prompt = system_prompt.replace("{{POST_SUMMARY}}", post_summary)
-        system_prompt = system_prompt.replace("{{COMMENT_TEXT}}", comment_text)
-
-        # Prepare content with images (OpenAI format for vision)
-        content = []
-        for url in image_urls:
-            try:
-                image_data, media_type = await self.fetch_image_as_base64(url)
-                content.append({
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:{media_type};base64,{image_data}"
-                    }
-                })
-            except Exception as e:
-                logger.warning(f"Failed to fetch image {url}: {e}")
-
-        # Use language-appropriate user message
-        if language in (Language.ARABIC, Language.TUNISIAN):
-            user_text = "ولّد جواب على التعليق بناءً على الصورة والكونتكست."
-        else:
-            user_text = "Génère une réponse à ce commentaire basée sur l'image et le contexte fourni."
-
-        content.append({
-            "type": "text",
-            "text": user_text
-        })
+        """Submit a prepared reply payload, optionally with a correction hint."""
+        return await self._call_route(
+            prepared.route or self.router.route(CALL_REPLY),
+            messages=prepared.messages(retry_hint),
+            max_tokens=self.settings.max_tokens_per_reply,
+            deadline=deadline,
+        )
 
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": content}
-        ]
+    def stream_from_prepared(
+        self,
+        prepared: PreparedReply,
+        retry_hint: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
+    ) -> AsyncIterator[str]:
+        """Stream a reply for a prepared payload as text deltas."""
+        return self._stream_route(
+            prepared.route or self.router.route(CALL_REPLY),
+            messages=prepared.messages(retry_hint),
+            max_tokens=self.settings.max_tokens_per_reply,
+            deadline=deadline,
+        )
 
-        # Use Claude 3.5 Sonnet via OpenRouter for better quality
-        return await self._call_openrouter(
-            model="openai/gpt-4.1-nano",
-            messages=messages,
-            max_tokens=self.settings.max_tokens_per_reply
+    async def generate_reply(
+        self,
+        post_summary: str,
+        comment_text: str,
+        image_urls: list[str],
+        language: Language = Language.FRENCH,
+        seller_context: Optional[SellerContext] = None,
+        deadline: Optional[Deadline] = None,
+    ) -> str:
+        """Generate a reply to a comment using Claude Vision via OpenRouter."""
+        prepared = await self.prepare_reply_request(
+            post_summary, comment_text, image_urls, language, seller_context
         )
+        return await self.generate_from_prepared(prepared, deadline=deadline)
 
     async def summarize_post(
         self,
         caption: str,
         image_urls: list[str],
+        deadline: Optional[Deadline] = None,
     ) -> str:
         """Generate a summary of a post for caching."""
-        summary_prompt = load_prompt("summary_prompt.txt")
-        summary_prompt = summary_prompt.replace("{{CAPTION}}", caption)
+        summary_prompt = self.prompts.render("summary_prompt.txt", CAPTION=caption)
 
         # Prepare content with images
-        content = []
-        for url in image_urls:
-            try:
-                image_data, media_type = await self.fetch_image_as_base64(url)
-                content.append({
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:{media_type};base64,{image_data}"
-                    }
-                })
-            except Exception as e:
-                logger.warning(f"Failed to fetch image {url}: {e}")
+        content = await self._fetch_image_parts(image_urls)
 
         content.append({
             "type": "text",
@@ -294,26 +796,47 @@ class ClaudeService:
             {"role": "user", "content": content}
         ]
 
-        return await self._call_openrouter(
-            model="openai/gpt-4.1-nano",
+        return await self._call_route(
+            self.router.route(CALL_SUMMARY),
             messages=messages,
-            max_tokens=200
+            max_tokens=200,
+            deadline=deadline,
         )
 
-    async def detect_language(self, comment_text: str) -> Language:
-        """Detect the language of a comment."""
-        detection_prompt = load_prompt("language_detection_prompt.txt")
-        detection_prompt = detection_prompt.replace("{{COMMENT_TEXT}}", comment_text)
+    async def detect_language(
+        self,
+        comment_text: str,
+        deadline: Optional[Deadline] = None,
+    ) -> Language:
+        """Detect the language of a comment, asking the model only when unsure."""
+        language, confidence = self.language_detector.detect(comment_text)
+        if confidence >= self.settings.language_detection_min_confidence:
+            return language
+        logger.debug(f"Local language detection unsure ({language.value}, {confidence:.2f}); asking model")
+        return await self.detect_language_llm(comment_text, deadline)
+
+    def detect_language_local(self, comment_text: str, default: Language) -> Language:
+        """Detect the language of a comment without a model call, keeping ``default`` when unsure."""
+        language, confidence = self.language_detector.detect(comment_text)
+        return language if confidence >= self.settings.language_detection_min_confidence else default
+
+    async def detect_language_llm(
+        self,
+        comment_text: str,
+        deadline: Optional[Deadline] = None,
+    ) -> Language:
+        """Detect the language of a comment with a model call."""
+        detection_prompt = self.prompts.render("language_detection_prompt.txt", COMMENT_TEXT=comment_text)
 
         messages = [
             {"role": "user", "content": detection_prompt}
         ]
 
-        # Use Haiku for fast, cheap language detection
-        code = await self._call_openrouter(
-            model="openai/gpt-4.1-nano",
+        code = await self._call_route(
+            self.router.route(CALL_LANGUAGE),
             messages=messages,
-            max_tokens=10
+            max_tokens=10,
+            deadline=deadline,
         )
 
         code = code.lower().strip()
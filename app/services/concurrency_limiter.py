@@ -0,0 +1,155 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+import httpx
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Upstream statuses that mean "back off", as opposed to a bad request
+CONGESTION_STATUSES = {429, 500, 502, 503, 504}
+
+
+class UpstreamOverloaded(Exception):
+    """Raised when the upstream wait queue is full or a queued call waited too long."""
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limiter for model calls with AIMD (additive-increase,
+    multiplicative-decrease) control.
+
+    Each successful call under the latency target grows the limit by
+    1/limit, i.e. about +1 per full window. A 429/5xx, a timeout or a call
+    slower than the target shrinks it by ``backoff_ratio``, at most once per
+    target interval so one burst of failures does not collapse it to the
+    floor. Cancelled calls leave the limit unchanged. Callers over the limit wait in a bounded FIFO queue; when that is
+    full they are rejected immediately.
+    """
+
+    def __init__(
+        self,
+        initial_limit: Optional[int] = None,
+        min_limit: Optional[int] = None,
+        max_limit: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        queue_timeout: Optional[float] = None,
+        latency_target: Optional[float] = None,
+        backoff_ratio: Optional[float] = None,
+    ):
+        settings = get_settings()
+        self.min_limit = min_limit or settings.upstream_min_limit
+        self.max_limit = max_limit or settings.upstream_max_limit
+        self.limit = float(initial_limit or settings.upstream_initial_limit)
+        self.max_queue = settings.upstream_max_queue if max_queue is None else max_queue
+        self.queue_timeout = queue_timeout or settings.upstream_queue_timeout
+        self.latency_target = latency_target or settings.upstream_latency_target
+        self.backoff_ratio = backoff_ratio or settings.upstream_backoff_ratio
+
+        self._in_flight = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._last_decrease = 0.0
+        self.rejected = 0
+        self.decreases = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def _has_capacity(self) -> bool:
+        return self._in_flight < int(self.limit)
+
+    def _wake(self) -> None:
+        while self._waiters and self._has_capacity():
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._in_flight += 1
+                waiter.set_result(None)
+
+    async def acquire(self, timeout: Optional[float] = None) -> None:
+        """Take a slot, queueing at most ``timeout`` (or queue_timeout) seconds."""
+        if self._has_capacity() and not self._waiters:
+            self._in_flight += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise UpstreamOverloaded("Upstream queue is full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, min(timeout, self.queue_timeout) if timeout else self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._discard(waiter)
+            self.rejected += 1
+            raise UpstreamOverloaded("Timed out waiting for an upstream slot")
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Slot was granted just as we were cancelled: hand it back
+                self._in_flight -= 1
+                self._wake()
+            self._discard(waiter)
+            raise
+
+    def _discard(self, waiter: asyncio.Future) -> None:
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def release(self, latency: float, congested: bool) -> None:
+        """Return a slot and adjust the limit from the call's outcome."""
+        self._in_flight -= 1
+        if congested or latency > self.latency_target:
+            now = time.monotonic()
+            if now - self._last_decrease >= self.latency_target:
+                self._last_decrease = now
+                self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+                self.decreases += 1
+                logger.warning(f"Upstream congestion, concurrency limit -> {int(self.limit)}")
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self._wake()
+
+    def abandon(self) -> None:
+        """Return a slot without adjusting the limit, for calls that never reported back."""
+        self._in_flight -= 1
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, timeout: Optional[float] = None) -> AsyncIterator[None]:
+        """Hold a slot for the duration of one upstream call."""
+        await self.acquire(timeout)
+        started = time.monotonic()
+        try:
+            yield
+        except httpx.HTTPStatusError as e:
+            self.release(time.monotonic() - started, e.response.status_code in CONGESTION_STATUSES)
+            raise
+        except (httpx.TimeoutException, httpx.TransportError):
+            self.release(time.monotonic() - started, True)
+            raise
+        except BaseException:
+            # Cancelled (a losing hedge or candidate, an attempt timeout) or
+            # failed locally: no verdict on upstream, so no increase either
+            self.abandon()
+            raise
+        self.release(time.monotonic() - started, False)
+
+    def stats(self) -> dict:
+        return {
+            "limit": int(self.limit),
+            "in_flight": self._in_flight,
+            "queue_depth": len(self._waiters),
+            "rejected": self.rejected,
+            "decreases": self.decreases,
+        }
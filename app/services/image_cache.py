@@ -0,0 +1,125 @@
+import hashlib
+import logging
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from app.config import get_settings
+from app.services.cache_service import CacheService
+from app.services.local_cache import LocalCache
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CachedImage:
+    """An image already encoded for the vision payload."""
+    data_uri: str
+    media_type: str
+    content_hash: str
+
+    @property
+    def base64_data(self) -> str:
+        return self.data_uri.split(",", 1)[1]
+
+
+def url_key(url: str, profile: str = "") -> str:
+    """Stable, bounded-length cache key for an image URL under a processing profile."""
+    return hashlib.sha256(f"{profile}|{url}".encode("utf-8")).hexdigest()
+
+
+def content_hash(data: bytes) -> str:
+    """Content address of raw image bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class ImageCache:
+    """
+    Two-tier cache of encoded post images.
+
+    Entries are keyed by URL with a secondary key on the content hash, so the
+    same picture served from different CDN URLs is only encoded once. Both
+    keys include the processing profile, so renditions made under other
+    output settings are never served. The in-process LRU is bounded by
+    bytes; Redis is reached through CacheService.
+    """
+
+    def __init__(self, cache_service: Optional[CacheService] = None, profile: str = ""):
+        self.settings = get_settings()
+        self.cache = cache_service
+        self.profile = profile
+        self._images: LocalCache[CachedImage] = LocalCache(
+            max_bytes=self.settings.image_cache_local_max_bytes,
+            ttl=self.settings.image_cache_ttl,
+            sizeof=lambda image: len(image.data_uri),
+        )
+        self._urls: LocalCache[str] = LocalCache(
+            max_entries=10_000,
+            ttl=self.settings.image_cache_ttl,
+        )
+        self.hits = {"local": 0, "redis": 0}
+        self.misses = 0
+
+    def _local_get(self, content_hash: str) -> Optional[CachedImage]:
+        return self._images.get(content_hash)
+
+    def _local_put(self, url: Optional[str], image: CachedImage) -> None:
+        self._images.set(image.content_hash, image)
+        if url is not None:
+            self._urls.set(url_key(url, self.profile), image.content_hash)
+
+    async def get(self, url: str) -> Optional[CachedImage]:
+        """Look up an image by URL, checking the local tier before Redis."""
+        key = url_key(url, self.profile)
+        digest = self._urls.get(key)
+        if digest is not None:
+            image = self._local_get(digest)
+            if image is not None:
+                self.hits["local"] += 1
+                return image
+
+        if self.cache is not None:
+            record = await self.cache.get_image_by_url(key)
+            if record:
+                image = CachedImage(**record)
+                self._local_put(url, image)
+                self.hits["redis"] += 1
+                return image
+
+        self.misses += 1
+        return None
+
+    async def get_by_hash(self, digest: str) -> Optional[CachedImage]:
+        """Look up an already-encoded image by content hash."""
+        image = self._local_get(digest)
+        if image is None and self.cache is not None:
+            record = await self.cache.get_image_by_hash(digest)
+            if record:
+                image = CachedImage(**record)
+                self._images.set(digest, image)
+        return image
+
+    async def put(self, url: str, image: CachedImage) -> None:
+        """Store an encoded image in both tiers, skipping oversized entries."""
+        if len(image.data_uri) > self.settings.image_cache_max_entry_bytes:
+            logger.debug(f"Image {url} too large to cache ({len(image.data_uri)} bytes)")
+            return
+        self._local_put(url, image)
+        if self.cache is not None:
+            await self.cache.set_image(
+                url_key(url, self.profile),
+                image.content_hash,
+                asdict(image),
+                self.settings.image_cache_ttl,
+            )
+
+    def stats(self) -> dict:
+        """Hit/miss counters and local tier occupancy."""
+        lookups = self.hits["local"] + self.hits["redis"] + self.misses
+        return {
+            "hits_local": self.hits["local"],
+            "hits_redis": self.hits["redis"],
+            "misses": self.misses,
+            "hit_ratio": round((lookups - self.misses) / lookups, 4) if lookups else 0.0,
+            "local_entries": len(self._images),
+            "local_bytes": self._images.total_bytes,
+        }
@@ -0,0 +1,106 @@
+from collections import deque
+from typing import Hashable, Iterable, Mapping
+
+from app.services.text_normalization import is_word_char, normalize_text
+
+ARABIC_RANGE = ("\u0600", "\u06ff")
+# Attached prefixes (the, and, with, so, for) and pronoun suffixes in Arabic/Darija
+ARABIC_PREFIXES = ("", "ال", "و", "ب", "ف", "ل", "وال", "بال", "فال", "لل")
+ARABIC_SUFFIXES = ("", "ها", "ه", "و", "ك", "كم", "هم", "نا", "ي")
+
+
+def _is_arabic(word: str) -> bool:
+    return any(ARABIC_RANGE[0] <= ch <= ARABIC_RANGE[1] for ch in word)
+
+
+def keyword_variants(keyword: str) -> set[str]:
+    """
+    Normalized surface forms of a keyword, including Arabic clitic forms.
+
+    A trailing ``*`` marks a stem ("rembours*") and is kept on every variant.
+    """
+    stem = keyword.endswith("*")
+    base = normalize_text(keyword.rstrip("*"))
+    if stem:
+        return {base + "*"} if base else set()
+    if not base or not _is_arabic(base) or " " in base:
+        return {base} if base else set()
+    # Suffixes only on 3+ letter stems, so short words like كم stay strict
+    suffixes = ARABIC_SUFFIXES if len(base) >= 3 else ("",)
+    return {prefix + base + suffix for prefix in ARABIC_PREFIXES for suffix in suffixes}
+
+
+class IntentMatcher:
+    """
+    Aho-Corasick automaton over every intent keyword.
+
+    Built once; ``match`` makes one pass over the normalized comment and
+    reports each label whose keyword occurs as a whole word (or, for stems
+    written "rembours*", at the start of a word). Keyword edges that are not
+    word characters (emoji, punctuation) match anywhere, so "🔥🔥" still
+    counts as praise.
+    """
+
+    def __init__(self, keywords: Mapping[Hashable, Iterable[str]]):
+        self.labels: list[Hashable] = list(keywords)
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        # Per node: (label index, pattern length, needs left boundary, needs right boundary)
+        self._out: list[list[tuple[int, int, bool, bool]]] = [[]]
+
+        for label_index, label in enumerate(self.labels):
+            for keyword in keywords[label]:
+                for pattern in keyword_variants(keyword):
+                    self._add(pattern, label_index)
+        self._build_failure_links()
+
+    def _add(self, pattern: str, label_index: int) -> None:
+        stem = pattern.endswith("*")
+        pattern = pattern.rstrip("*")
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._goto[node][ch] = nxt
+            node = nxt
+        entry = (label_index, len(pattern), is_word_char(pattern[0]), is_word_char(pattern[-1]) and not stem)
+        if entry not in self._out[node]:
+            self._out[node].append(entry)
+
+    def _build_failure_links(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(ch, 0)
+                self._out[child].extend(self._out[self._fail[child]])
+
+    def match(self, text: str) -> list[Hashable]:
+        """Labels found in ``text``, in the order they were registered."""
+        text = normalize_text(text)
+        found: set[int] = set()
+        goto, fail, out = self._goto, self._fail, self._out
+        last = len(text) - 1
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for label_index, length, left, right in out[node]:
+                if label_index in found:
+                    continue
+                start = i - length + 1
+                if left and start > 0 and is_word_char(text[start - 1]):
+                    continue
+                if right and i < last and is_word_char(text[i + 1]):
+                    continue
+                found.add(label_index)
+        return [self.labels[i] for i in sorted(found)]
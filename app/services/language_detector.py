@@ -0,0 +1,169 @@
+import re
+import math
+from collections import Counter
+from typing import Iterable
+
+from app.models import Language
+from app.services.text_normalization import normalize_text as normalize
+
+ARABIC_CHAR_RE = re.compile(r"[\u0600-\u06FF\u0750-\u077F\uFB50-\uFDFF\uFE70-\uFEFF]")
+LATIN_CHAR_RE = re.compile(r"[a-z]")
+TOKEN_RE = re.compile(r"[^\W_]+(?:'[^\W_]+)?")
+# Arabizi: Latin words using 2/3/5/7/9 for Arabic sounds (3andek, 7aja, 9adech, ya5i)
+ARABIZI_RE = re.compile(r"^(?=.*[a-z])(?=.*[235679])[a-z235679]{2,}$")
+
+# Words that only show up in Tunisian Darija, in Arabic script and in Latin (arabizi or not)
+DARIJA_WORDS = {
+    # Arabic script
+    "بشحال", "قداش", "بقداش", "شنوة", "شنية", "برشا", "برشة", "فما", "مافماش", "ماكانش",
+    "باهي", "ياسر", "توا", "كيفاش", "علاش", "وقتاش", "شكون", "نجم", "تنجم", "نحب",
+    "تحب", "يعيشك", "عسلامة", "برك", "هاذي", "هاذا", "متاع", "متاعك", "متاعها", "نكومندي",
+    "ابعثلي", "ابعثلنا", "زادة", "موش", "مش", "بلاهي", "نشري", "نوخذ", "خويا", "اختي",
+    "كيفما", "ديما", "فيسع", "مزيان", "مريقل", "بربي", "ولا", "فمة",
+    # Latin script
+    "chnowa", "chnoua", "chneya", "chnia", "kadech", "9adech", "9addech", "bkadech", "b9adech",
+    "bch", "bech", "bach", "famma", "fama", "famech", "barcha", "barsha", "behi", "bahi",
+    "mte3", "mta3", "mtaa", "3andek", "andek", "3andkom", "nheb", "n7eb", "n7ib", "nhib",
+    "t7eb", "ya3tik", "yaatik", "saha", "sa7a", "sahit", "ena", "enti", "inti", "chkoun",
+    "wa9tech", "waktech", "mouch", "mich", "moch", "taw", "tawa", "tawwa", "5ouya", "khouya",
+    "o5ti", "okhti", "ya5i", "yakhi", "3aslema", "aslema", "brabi", "ye3aychek", "y3aychek",
+    "yaychek", "ya3aychek", "kifech", "kifeh", "3lech", "alech", "zeda", "zada", "lezem",
+    "najem", "najjem", "tnajem", "mezyen", "mrigel", "bahia", "mela", "yesser", "yasser",
+    "nchri", "ncheri", "nekhou", "nokhou", "lel", "ken", "kan", "mta", "chkon", "3la",
+    "5ater", "khater", "walla", "inchallah", "nchallah", "ahla", "3sal", "hedha", "hedhi",
+    "hetha", "hethi", "bellehi", "bla", "chwaya", "chwaia", "fil", "mte", "tounes",
+}
+
+# Modern Standard Arabic markers that Tunisians rarely write
+MSA_WORDS = {
+    "هل", "ماذا", "لماذا", "أريد", "اريد", "كيف", "هذا", "هذه", "الذي", "التي", "لديكم",
+    "يوجد", "أين", "متى", "جدا", "ممكن", "المنتج", "متوفر", "متوفرة", "فضلك", "لكم",
+    "أود", "اود", "الشحن", "كم", "بكم", "رائع", "الطلب", "أحتاج", "احتاج", "قد", "لدي",
+    "ليس", "سوف", "يمكن", "يمكنني", "أرجو", "ارجو", "الآن", "أيضا", "لقد",
+}
+
+# Small labelled seed corpus for the character n-gram naive Bayes model
+TRAINING_DATA: dict[Language, list[str]] = {
+    Language.FRENCH: [
+        "c'est combien le prix svp", "quel est le prix de cette robe", "vous livrez à sousse ?",
+        "est-ce que c'est disponible en noir", "je veux commander deux pièces", "trop beau j'adore",
+        "magnifique la couleur", "vous avez la taille m", "la livraison c'est combien",
+        "on peut payer à la livraison", "merci pour votre réponse", "c'est encore dispo",
+        "je suis intéressée, envoyez moi les détails", "bonjour, quels sont les délais",
+        "c'est trop cher pour moi", "il reste des pièces en stock", "super qualité bravo",
+        "comment faire pour commander", "vous faites des réductions", "envoyez-moi le prix en privé",
+        "elle est en quelle matière", "les retours sont possibles", "j'aime beaucoup ce modèle",
+        "c'est la même que sur la photo", "où se trouve votre boutique", "je peux échanger la taille",
+        "très joli, c'est pour quand la nouvelle collection", "j'ai déjà commandé chez vous",
+        "vous acceptez la carte bancaire", "ça coûte combien avec la livraison",
+    ],
+    Language.ENGLISH: [
+        "how much is this", "what is the price please", "do you ship to the us",
+        "is this still available", "i want to order two", "so beautiful i love it",
+        "amazing color", "do you have it in size medium", "how much is delivery",
+        "can i pay cash on delivery", "thanks for your reply", "is it still in stock",
+        "i'm interested, send me the details", "hello, how long does shipping take",
+        "that's too expensive for me", "any pieces left", "great quality well done",
+        "how do i place an order", "do you have any discounts", "please send me the price in dm",
+        "what material is it made of", "can i return it", "i really like this model",
+        "is it the same as in the picture", "where is your shop located", "can i exchange the size",
+        "so pretty, when is the new collection coming", "i already ordered from you",
+        "do you accept credit cards", "how much with shipping",
+    ],
+    Language.TUNISIAN: [
+        "9adech soum", "bkadech hedhi", "chnowa soumha", "famma taille m", "n7eb nchri zouz",
+        "3andkom livraison l sfax", "ya3tik saha behi barcha", "mezyena barcha", "kifech nkomandi",
+        "taw tousel wala le", "mouch ghalia chwaya", "famech promo", "ena n7ebha bel k7el",
+        "9adech el livraison", "ahla, mazelet famma", "b9adech el robe", "barcha 7lowa",
+        "nheb na3ref soum", "wa9tech tousel", "3aslema, n7eb ncommandi",
+        "بشحال", "قداش الثمن", "فما مقاس كبير", "نحب نكومندي", "برشا باهية",
+        "يعيشك قداش التوصيل", "شنوة السوم", "توا توصل ولا لا", "ابعثلي السوم في الخاص",
+        "فما لون اكحل", "مازالت موجودة", "باهي برشا يعطيك الصحة", "كيفاش نخلص", "وقتاش توصل",
+        "قداش متاع التوصيل لصفاقس",
+    ],
+    Language.ARABIC: [
+        "كم السعر من فضلك", "هل هذا متوفر", "أريد أن أطلب قطعتين", "جميل جدا أحببته",
+        "هل يوجد مقاس كبير", "كم تكلفة الشحن", "هل يمكن الدفع عند الاستلام", "شكرا على الرد",
+        "هل ما زال متوفرا", "أنا مهتمة أرسلوا لي التفاصيل", "متى يصل الطلب", "السعر مرتفع جدا",
+        "ما هي المادة المصنوعة منها", "هل يمكن إرجاع المنتج", "أين يقع متجركم",
+        "هل يمكنني تبديل المقاس", "رائع متى المجموعة الجديدة", "هل تقبلون البطاقة البنكية",
+        "كم الثمن مع التوصيل", "أود معرفة الألوان المتاحة",
+    ],
+}
+
+SCRIPT_LANGUAGES = {
+    "arabic": (Language.TUNISIAN, Language.ARABIC),
+    "latin": (Language.FRENCH, Language.ENGLISH, Language.TUNISIAN),
+}
+
+# Log-odds added per lexical marker; n-gram evidence alone decides the rest
+MARKER_WEIGHT = 3.0
+
+
+def char_ngrams(text: str, n: int = 3) -> Iterable[str]:
+    """Character n-grams of each token, padded with spaces."""
+    for token in TOKEN_RE.findall(text):
+        padded = f" {token} "
+        for i in range(len(padded) - n + 1):
+            yield padded[i:i + n]
+
+
+class LanguageDetector:
+    """
+    In-process language classifier for short Instagram comments.
+
+    Script detection narrows the candidates (Arabic script: ar/tn; Latin:
+    fr/en/tn), then a character-trigram naive Bayes model scores them, with
+    extra weight for Darija markers, arabizi digits and MSA function words.
+    Returns the language and a confidence in [0, 1].
+    """
+
+    def __init__(self, training_data: dict[Language, list[str]] = TRAINING_DATA):
+        self._log_probs: dict[Language, dict[str, float]] = {}
+        self._unseen: dict[Language, float] = {}
+        vocabulary: set[str] = set()
+        counts: dict[Language, Counter] = {}
+        for language, samples in training_data.items():
+            counts[language] = Counter(g for s in samples for g in char_ngrams(normalize(s)))
+            vocabulary.update(counts[language])
+        for language, counter in counts.items():
+            # Laplace smoothing over the shared vocabulary
+            total = sum(counter.values()) + len(vocabulary) + 1
+            self._log_probs[language] = {g: math.log((c + 1) / total) for g, c in counter.items()}
+            self._unseen[language] = math.log(1 / total)
+        self._darija = {normalize(w) for w in DARIJA_WORDS}
+        self._msa = {normalize(w) for w in MSA_WORDS}
+
+    def detect(self, text: str) -> tuple[Language, float]:
+        """Classify a comment; confidence is the posterior of the winning language."""
+        text = normalize(text)
+        arabic = len(ARABIC_CHAR_RE.findall(text))
+        latin = len(LATIN_CHAR_RE.findall(text))
+        if not arabic and not latin:
+            # Emoji-only or digits: nothing to go on
+            return Language.FRENCH, 0.0
+        if arabic and latin and min(arabic, latin) / (arabic + latin) >= 0.2:
+            # Heavy script mixing is typical of Tunisian comments
+            return Language.TUNISIAN, 0.9
+
+        candidates = SCRIPT_LANGUAGES["arabic" if arabic > latin else "latin"]
+        tokens = TOKEN_RE.findall(text)
+        grams = list(char_ngrams(text))
+        scores = {}
+        for language in candidates:
+            log_probs = self._log_probs[language]
+            unseen = self._unseen[language]
+            # Average per n-gram so long and short comments are comparable
+            score = sum(log_probs.get(g, unseen) for g in grams) / max(len(grams), 1) * 4
+            scores[language] = score
+
+        darija_hits = sum(1 for t in tokens if t in self._darija or ARABIZI_RE.match(t))
+        scores[Language.TUNISIAN] += MARKER_WEIGHT * darija_hits
+        if Language.ARABIC in scores:
+            msa_hits = sum(1 for t in tokens if t in self._msa)
+            scores[Language.ARABIC] += MARKER_WEIGHT * msa_hits
+
+        best = max(scores, key=scores.get)
+        top = scores[best]
+        norm = sum(math.exp(s - top) for s in scores.values())
+        return best, 1 / norm
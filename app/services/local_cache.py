@@ -0,0 +1,84 @@
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, Optional, TypeVar
+
+V = TypeVar("V")
+
+
+class LocalCache(Generic[V]):
+    """
+    Bounded in-process LRU cache with optional TTL and byte budget.
+
+    Not thread-safe; meant to be used from the event loop only.
+    """
+
+    def __init__(
+        self,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[float] = None,
+        sizeof: Optional[Callable[[V], int]] = None,
+    ):
+        if max_bytes is not None and sizeof is None:
+            raise ValueError("max_bytes requires a sizeof function")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._sizeof = sizeof
+        self._entries: OrderedDict[Hashable, tuple[V, Optional[float], int]] = OrderedDict()
+        self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    @property
+    def total_bytes(self) -> int:
+        """Bytes currently held, as reported by ``sizeof``."""
+        return self._bytes
+
+    def get(self, key: Hashable) -> Optional[V]:
+        """Return a live entry and mark it most recently used."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at, _ = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            self.delete(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: V, ttl: Optional[float] = None) -> bool:
+        """Store an entry, evicting least recently used ones to stay in budget."""
+        size = self._sizeof(value) if self._sizeof else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return False
+        self.delete(key)
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        self._entries[key] = (value, expires_at, size)
+        self._bytes += size
+        self._evict()
+        return True
+
+    def delete(self, key: Hashable) -> None:
+        """Remove an entry if present."""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def clear(self) -> None:
+        """Drop every entry."""
+        self._entries.clear()
+        self._bytes = 0
+
+    def _evict(self) -> None:
+        while (
+            (self.max_entries is not None and len(self._entries) > self.max_entries)
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            _, (_, _, size) = self._entries.popitem(last=False)
+            self._bytes -= size
@@ -0,0 +1,167 @@
+import logging
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+from app.config import get_settings
+from app.models import CommentIntent
+from app.services.resilience import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+# Call types, the first part of every route name
+CALL_REPLY = "reply"
+CALL_SUMMARY = "summary"
+CALL_LANGUAGE = "language_detection"
+
+FAST_MODEL = "openai/gpt-4.1-nano"
+STRONG_MODEL = "openai/gpt-4.1-mini"
+
+# Route name -> spec. Names are "<call type>[:<intent>][@<tier>]". When a
+# comment has several intents with routes of their own, the one listed
+# first here wins, so escalations come before cheap routes.
+DEFAULT_ROUTES: dict[str, dict] = {
+    "reply:negative": {"models": [STRONG_MODEL, FAST_MODEL], "attempt_timeout": 8.0},
+    "reply:negotiation": {"models": [STRONG_MODEL, FAST_MODEL], "attempt_timeout": 8.0},
+    "reply:praise": {"models": [FAST_MODEL], "max_tokens": 80},
+    "reply@premium": {"models": [STRONG_MODEL, FAST_MODEL], "attempt_timeout": 8.0},
+    "reply": {"models": [FAST_MODEL]},
+    "summary": {"models": [FAST_MODEL], "max_tokens": 200},
+    "language_detection": {"models": [FAST_MODEL], "max_tokens": 10, "temperature": 0.0},
+}
+
+
+@dataclass(frozen=True)
+class ModelRoute:
+    """Models and generation parameters for one kind of call."""
+
+    name: str
+    models: tuple[str, ...]  # primary first, then fallbacks in order
+    max_tokens: Optional[int] = None  # None keeps the caller's default
+    temperature: Optional[float] = None  # None leaves it to the provider
+    attempt_timeout: Optional[float] = None  # seconds before a slow model is abandoned for the next
+
+    @classmethod
+    def from_spec(cls, name: str, spec: dict) -> "ModelRoute":
+        models = tuple(spec.get("models") or ())
+        if not models:
+            raise ValueError(f"Model route '{name}' lists no models")
+        return cls(
+            name=name,
+            models=models,
+            max_tokens=spec.get("max_tokens"),
+            temperature=spec.get("temperature"),
+            attempt_timeout=spec.get("attempt_timeout"),
+        )
+
+
+@dataclass
+class RouteStats:
+    """Counters for one route."""
+
+    calls: int = 0
+    failures: int = 0
+    fallbacks: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost_usd: float = 0.0
+    models: Counter = field(default_factory=Counter)
+    latency: LatencyTracker = field(default_factory=LatencyTracker)
+
+
+class ModelRouter:
+    """
+    Chooses model, token budget and temperature for each model call.
+
+    Replies are routed by detected intent and the API key's model tier,
+    trying ``reply:<intent>@<tier>``, ``reply:<intent>``, ``reply@<tier>``
+    and ``reply`` in that order; summaries and language detection by call
+    type. ``model_routes`` entries replace the default route of the same
+    name. Every route records latency, token usage and cost, priced from
+    ``model_prices`` unless the provider reports the cost itself.
+    """
+
+    def __init__(self):
+        self.settings = get_settings()
+        specs = {**DEFAULT_ROUTES, **self.settings.model_routes}
+        self.routes = {name: ModelRoute.from_spec(name, spec) for name, spec in specs.items()}
+        # Table order decides between several intents that have routes
+        self._intent_rank: dict[str, int] = {}
+        for name in specs:
+            call_type, _, rest = name.partition(":")
+            if rest:
+                self._intent_rank.setdefault(f"{call_type}:{rest.partition('@')[0]}", len(self._intent_rank))
+        self._stats: dict[str, RouteStats] = {}
+
+    def route(
+        self,
+        call_type: str,
+        intents: Iterable[CommentIntent] = (),
+        tier: Optional[str] = None,
+    ) -> ModelRoute:
+        """The most specific route for a call."""
+        names = {f"{call_type}:{intent.value}" for intent in intents}
+        routed = sorted(names & self._intent_rank.keys(), key=self._intent_rank.__getitem__)
+        for prefix in (*routed, call_type):
+            if tier and f"{prefix}@{tier}" in self.routes:
+                return self.routes[f"{prefix}@{tier}"]
+            if prefix in self.routes:
+                return self.routes[prefix]
+        raise KeyError(f"No model route for '{call_type}'")
+
+    def _route_stats(self, route: ModelRoute) -> RouteStats:
+        stats = self._stats.get(route.name)
+        if stats is None:
+            stats = self._stats[route.name] = RouteStats()
+        return stats
+
+    def cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        """USD cost of a call from the configured per-million-token prices."""
+        prices = self.settings.model_prices.get(model)
+        if not prices:
+            return 0.0
+        return (prompt_tokens * prices.get("input", 0.0) + completion_tokens * prices.get("output", 0.0)) / 1_000_000
+
+    def record_success(
+        self,
+        route: ModelRoute,
+        model: str,
+        seconds: float,
+        usage: Optional[dict] = None,
+    ) -> None:
+        """Record a completed call on a route."""
+        stats = self._route_stats(route)
+        stats.calls += 1
+        stats.models[model] += 1
+        stats.latency.record(seconds)
+        if model != route.models[0]:
+            stats.fallbacks += 1
+        if usage:
+            prompt_tokens = usage.get("prompt_tokens", 0)
+            completion_tokens = usage.get("completion_tokens", 0)
+            stats.prompt_tokens += prompt_tokens
+            stats.completion_tokens += completion_tokens
+            reported = usage.get("cost")
+            stats.cost_usd += reported if reported is not None else self.cost(model, prompt_tokens, completion_tokens)
+
+    def record_failure(self, route: ModelRoute, model: str, error: Exception) -> None:
+        """Record a model in a route's chain failing, before any fallback."""
+        self._route_stats(route).failures += 1
+        logger.warning(f"Model {model} failed on route '{route.name}': {error}")
+
+    def stats(self) -> dict:
+        """Per-route call, latency, token and cost counters."""
+        return {
+            name: {
+                "calls": stats.calls,
+                "failures": stats.failures,
+                "fallbacks": stats.fallbacks,
+                "models": dict(stats.models),
+                "latency_p50": stats.latency.percentile(0.5),
+                "latency_p95": stats.latency.percentile(0.95),
+                "prompt_tokens": stats.prompt_tokens,
+                "completion_tokens": stats.completion_tokens,
+                "cost_usd": round(stats.cost_usd, 6),
+            }
+            for name, stats in self._stats.items()
+        }
@@ -0,0 +1,123 @@
+import re
+import time
+import logging
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+PROMPTS_DIR = Path(__file__).parent.parent / "prompts"
+
+PLACEHOLDER_RE = re.compile(r"\{\{([A-Z_]+)\}\}")
+
+# Placeholders each shipped template must contain; checked at load time
+REQUIRED_PLACEHOLDERS = {
+    "system_prompt_fr.txt": {"SELLER_CONTEXT", "POST_SUMMARY", "COMMENT_TEXT"},
+    "system_prompt_en.txt": {"SELLER_CONTEXT", "POST_SUMMARY", "COMMENT_TEXT"},
+    "system_prompt_tn.txt": {"SELLER_CONTEXT", "POST_SUMMARY", "COMMENT_TEXT"},
+    "summary_prompt.txt": {"CAPTION"},
+    "language_detection_prompt.txt": {"COMMENT_TEXT"},
+    "quality_check_prompt.txt": {"COMMENT_TEXT", "REPLY_TEXT"},
+}
+
+
+class PromptTemplate:
+    """A prompt pre-split on its {{PLACEHOLDER}} markers, rendered with one join."""
+
+    def __init__(self, name: str, text: str, mtime: float = 0.0):
+        self.name = name
+        self.text = text
+        self.mtime = mtime
+        pieces = PLACEHOLDER_RE.split(text)
+        # split() alternates literal, name, literal, name, ..., literal
+        self._literals = pieces[0::2]
+        self._names = pieces[1::2]
+        self.placeholders = frozenset(self._names)
+
+    def render(self, **values: str) -> str:
+        """Fill every placeholder; missing values raise instead of leaking {{...}}."""
+        missing = self.placeholders - values.keys()
+        if missing:
+            raise KeyError(f"Missing values for {self.name}: {', '.join(sorted(missing))}")
+        parts = [self._literals[0]]
+        for name, literal in zip(self._names, self._literals[1:]):
+            parts.append(values[name])
+            parts.append(literal)
+        return "".join(parts)
+
+
+class PromptRegistry:
+    """Loads and validates every prompt template once, with optional hot reload."""
+
+    def __init__(
+        self,
+        prompts_dir: Path = PROMPTS_DIR,
+        hot_reload: bool = False,
+        reload_interval: float = 1.0,
+    ):
+        self.prompts_dir = prompts_dir
+        self.hot_reload = hot_reload
+        self.reload_interval = reload_interval
+        self._templates: dict[str, PromptTemplate] = {}
+        self._last_check = 0.0
+
+    def _load(self, path: Path) -> PromptTemplate:
+        template = PromptTemplate(
+            path.name,
+            path.read_text(encoding="utf-8"),
+            path.stat().st_mtime,
+        )
+        required = REQUIRED_PLACEHOLDERS.get(path.name, set())
+        missing = required - template.placeholders
+        if missing:
+            raise ValueError(f"Prompt {path.name} is missing placeholders: {', '.join(sorted(missing))}")
+        return template
+
+    def load_all(self) -> None:
+        """Load every template in the prompts directory, failing fast on errors."""
+        templates = {path.name: self._load(path) for path in sorted(self.prompts_dir.glob("*.txt"))}
+        absent = REQUIRED_PLACEHOLDERS.keys() - templates.keys()
+        if absent:
+            raise FileNotFoundError(f"Prompt files not found: {', '.join(sorted(absent))}")
+        self._templates = templates
+        self._last_check = time.monotonic()
+        logger.info(f"Loaded {len(templates)} prompt templates")
+
+    def _reload_changed(self) -> None:
+        now = time.monotonic()
+        if now - self._last_check < self.reload_interval:
+            return
+        self._last_check = now
+        for name, template in list(self._templates.items()):
+            path = self.prompts_dir / name
+            try:
+                if path.stat().st_mtime != template.mtime:
+                    self._templates[name] = self._load(path)
+                    logger.info(f"Reloaded prompt template {name}")
+            except Exception as e:
+                # Keep serving the last good version
+                logger.error(f"Failed to reload prompt {name}: {e}")
+
+    def get(self, name: str) -> PromptTemplate:
+        """Return a loaded template by file name."""
+        if not self._templates:
+            self.load_all()
+        elif self.hot_reload:
+            self._reload_changed()
+        template: Optional[PromptTemplate] = self._templates.get(name)
+        if template is None:
+            raise FileNotFoundError(f"Prompt file not found: {self.prompts_dir / name}")
+        return template
+
+    def render(self, name: str, **values: str) -> str:
+        """Render a template by file name."""
+        return self.get(name).render(**values)
+
+
+@lru_cache()
+def get_prompt_registry() -> PromptRegistry:
+    """Get the shared prompt registry."""
+    return PromptRegistry(hot_reload=get_settings().prompt_hot_reload)
@@ -0,0 +1,123 @@
+import math
+import time
+import logging
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from app.config import get_settings
+from app.services.api_keys import ApiKeyInfo
+from app.services.cache_service import CacheService
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RateLimitResult:
+    """Outcome of charging one request to a key's bucket."""
+
+    allowed: bool
+    limit: int  # requests per minute
+    remaining: int
+    retry_after: float  # seconds until the request would be allowed
+    reset_after: float  # seconds until the bucket is full again
+
+    def headers(self) -> dict[str, str]:
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(math.ceil(self.reset_after)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+
+class LocalTokenBuckets:
+    """
+    In-process token buckets, used while Redis is unavailable.
+
+    Limits are then per worker rather than global, which is the best we can
+    do without shared state. The number of tracked keys is bounded.
+    """
+
+    def __init__(self, max_keys: int = 10_000):
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def take(self, name: str, rate_per_ms: float, capacity: int, cost: int = 1) -> tuple[bool, int, int, int]:
+        """Same contract as ``CacheService.take_tokens``."""
+        now = time.monotonic() * 1000
+        tokens, ts = self._buckets.pop(name, (capacity, now))
+        tokens = min(capacity, tokens + max(0.0, now - ts) * rate_per_ms)
+        allowed = tokens >= cost
+        wait_ms = 0
+        if allowed:
+            tokens -= cost
+        else:
+            wait_ms = math.ceil((cost - tokens) / rate_per_ms)
+        self._buckets[name] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return allowed, math.floor(tokens), wait_ms, math.ceil((capacity - tokens) / rate_per_ms)
+
+
+class RateLimiter:
+    """
+    Token-bucket rate limiting per API key.
+
+    Buckets live in Redis and are charged by a single Lua script, so the
+    limit holds across workers at one round trip per request. Buckets are
+    keyed by the key digest. A key's own ``rate_limit``/``burst`` win over
+    ``rate_limit_overrides``, which win over the defaults.
+    """
+
+    def __init__(self, cache_service: Optional[CacheService] = None):
+        self.settings = get_settings()
+        self.cache = cache_service
+        self.local = LocalTokenBuckets()
+        self.allowed = 0
+        self.limited = 0
+        self.limited_by_tenant: Counter[str] = Counter()
+        self.fallbacks = 0
+
+    def policy(self, client: ApiKeyInfo) -> tuple[int, int]:
+        """(requests per minute, burst capacity) for a client key."""
+        override = self.settings.rate_limit_overrides.get(client.digest, {})
+        per_minute = client.rate_limit or override.get("per_minute", self.settings.rate_limit_per_minute)
+        burst = client.burst or override.get("burst", self.settings.rate_limit_burst) or per_minute
+        return per_minute, burst
+
+    async def check(self, client: ApiKeyInfo, cost: int = 1) -> RateLimitResult:
+        """Charge ``cost`` requests to the key's bucket."""
+        per_minute, burst = self.policy(client)
+        rate_per_ms = per_minute / 60_000
+
+        outcome = None
+        if self.cache is not None:
+            outcome = await self.cache.take_tokens(client.digest, rate_per_ms, burst, cost)
+        if outcome is None:
+            self.fallbacks += 1
+            outcome = self.local.take(client.digest, rate_per_ms, burst, cost)
+        allowed, remaining, wait_ms, full_ms = outcome
+
+        if allowed:
+            self.allowed += 1
+        else:
+            self.limited += 1
+            self.limited_by_tenant[client.tenant_id] += 1
+        return RateLimitResult(
+            allowed=allowed,
+            limit=per_minute,
+            remaining=remaining,
+            retry_after=wait_ms / 1000,
+            reset_after=full_ms / 1000,
+        )
+
+    def stats(self) -> dict:
+        return {
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "limited_by_tenant": dict(self.limited_by_tenant),
+            "local_fallbacks": self.fallbacks,
+        }
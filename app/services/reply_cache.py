@@ -0,0 +1,113 @@
+import re
+import hashlib
+import random
+import logging
+from typing import Callable, Optional
+
+from app.config import get_settings
+from app.models import ReplyRequest
+from app.services.cache_service import CacheService
+from app.services.text_normalization import normalize_text
+
+logger = logging.getLogger(__name__)
+
+PUNCTUATION_RE = re.compile(r"[.,;:!?¿¡…]+")
+# "priiiix" -> "prix"; real words rarely triple a letter
+LETTER_RUN_RE = re.compile(r"(\w)\1{2,}")
+# "🔥🔥🔥", "🔥 🔥", "👍🏻👍🏻" -> one copy (lazy so multi-code-point emoji repeat as a unit)
+SYMBOL_RUN_RE = re.compile(r"([^\w\s]+?)(?:\s*\1)+")
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def canonical_comment(text: str) -> str:
+    """
+    Fold a comment so trivially different duplicates share a cache entry.
+
+    On top of ``normalize_text`` (case, accents, Arabic letter variants,
+    whitespace) this drops punctuation and collapses repeated letters and
+    repeated emoji.
+    """
+    text = PUNCTUATION_RE.sub(" ", normalize_text(text))
+    text = LETTER_RUN_RE.sub(r"\1", text)
+    text = SYMBOL_RUN_RE.sub(r"\1", text)
+    return WHITESPACE_RE.sub(" ", text).strip()
+
+
+def context_fingerprint(request: ReplyRequest) -> str:
+    """Hash of everything besides the comment that shapes the reply."""
+    parts = [
+        request.post_summary,
+        request.brand_voice.value,
+        str(request.cta_allowed),
+        request.seller_context.model_dump_json() if request.seller_context else "",
+    ]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class ReplyCache:
+    """
+    Cache of replies for repeated comments on the same post.
+
+    Entries are keyed by post, canonical comment text, language and a
+    fingerprint of the seller context, so any context change starts a new
+    entry and old ones age out with their TTL. Each entry is a small pool
+    of distinct replies: until it holds ``reply_cache_variants`` replies a
+    lookup misses so a new variant gets generated; afterwards a random
+    variant the caller accepts is served, and a pool with none left misses
+    too.
+    """
+
+    def __init__(self, cache_service: CacheService):
+        self.settings = get_settings()
+        self.cache = cache_service
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.exhausted = 0
+
+    def key(self, request: ReplyRequest) -> Optional[str]:
+        """Cache key for a request, or None if the comment is not worth caching."""
+        if not self.settings.reply_cache_enabled:
+            return None
+        comment = canonical_comment(request.comment_text)
+        if not comment or len(comment) > self.settings.reply_cache_max_comment_chars:
+            # Long comments are almost never repeated verbatim
+            self.skipped += 1
+            return None
+        raw = "\x1f".join([request.post_id, comment, request.language.value, context_fingerprint(request)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+    async def get(self, key: str, accept: Optional[Callable[[str], bool]] = None) -> Optional[str]:
+        """A stored variant that ``accept`` allows once the pool is full, else None."""
+        variants = await self.cache.get_reply_variants(key, self.settings.reply_cache_variants)
+        if len(variants) < self.settings.reply_cache_variants:
+            self.misses += 1
+            return None
+        random.shuffle(variants)
+        for reply in variants:
+            if accept is None or accept(reply):
+                self.hits += 1
+                return reply
+        # Every variant was refused (e.g. all repeat recent replies): generate a new one
+        self.exhausted += 1
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, reply: str) -> None:
+        """Add a reply to the variant pool."""
+        await self.cache.add_reply_variant(
+            key,
+            reply,
+            max_variants=self.settings.reply_cache_variants,
+            ttl=self.settings.reply_cache_ttl,
+        )
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "uncacheable": self.skipped,
+            "exhausted": self.exhausted,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
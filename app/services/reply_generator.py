@@ -1,16 +1,35 @@
-import re
+import asyncio
 import logging
-from typing import Optional
+from contextlib import aclosing
+from typing import AsyncIterator, Optional
 
 from app.models import (
+    BatchComment,
+    BatchReplyItem,
+    BatchReplyRequest,
     ReplyRequest,
     ReplyResponse,
+    ReplyStreamEvent,
     CommentIntent,
     Language,
     ContextUsed,
 )
-from app.services.claude_service import ClaudeService
+from app.config import get_settings
+from app.services.claude_service import ClaudeService, PreparedReply
 from app.services.cache_service import CacheService
+from app.services.intent_matcher import IntentMatcher
+from app.services.reply_validator import (
+    RULE_FORBIDDEN,
+    RULE_HASHTAG,
+    RULE_LENGTH,
+    RULE_LINK,
+    RULE_SENTENCES,
+    ReplyValidator,
+)
+from app.services.reply_cache import ReplyCache
+from app.services.reply_similarity import RULE_REPEATED, NearDuplicateChecker
+from app.services.reply_templates import TemplateEngine
+from app.services.resilience import Deadline
 
 logger = logging.getLogger(__name__)
 
@@ -25,15 +44,51 @@ FORBIDDEN_PATTERNS = [
     r"(?i)أنا (روبوت|بوت)",
 ]
 
+# Correction hints sent with the regeneration request, keyed by validation error
+RETRY_HINTS = {
+    RULE_FORBIDDEN: {
+        "fr": "Ta réponse précédente mentionnait l'IA ou l'automatisation. Réponds comme le propriétaire, sans jamais en parler.",
+        "en": "Your previous reply mentioned AI or automation. Answer as the owner and never mention it.",
+        "tn": "الجواب اللي قبل ذكر الذكاء الاصطناعي ولا bot. جاوب كصاحب البزنس وما تذكرهمش.",
+    },
+    RULE_SENTENCES: {
+        "fr": "Ta réponse précédente était trop longue. Maximum 2 phrases courtes.",
+        "en": "Your previous reply was too long. Use at most 2 short sentences.",
+        "tn": "الجواب اللي قبل طويل برشا. Maximum جملتين قصار.",
+    },
+    RULE_LINK: {
+        "fr": "Ta réponse précédente contenait un lien. Aucun lien, invite plutôt en DM.",
+        "en": "Your previous reply contained a link. No links, invite to DM instead.",
+        "tn": "الجواب اللي قبل فيه رابط. بلا روابط، قول ابعثلنا DM.",
+    },
+    RULE_HASHTAG: {
+        "fr": "Ta réponse précédente contenait des hashtags. Aucun hashtag.",
+        "en": "Your previous reply contained hashtags. Do not use hashtags.",
+        "tn": "الجواب اللي قبل فيه هاشتاقات. بلا هاشتاقات.",
+    },
+    RULE_LENGTH: {
+        "fr": "Ta réponse précédente dépassait 300 caractères. Fais plus court.",
+        "en": "Your previous reply was over 300 characters. Make it shorter.",
+        "tn": "الجواب اللي قبل فات 300 حرف. قصّر.",
+    },
+    RULE_REPEATED: {
+        "fr": "Ta réponse précédente répétait mot pour mot une réponse récente. Varie la formulation.",
+        "en": "Your previous reply repeated a recent reply almost word for word. Vary the wording.",
+        "tn": "الجواب اللي قبل يشبه برشا لجواب قديم. بدّل الكلمات.",
+    },
+}
+
 # Enhanced intent detection keywords (matching CLAUDE.md intent categories)
 INTENT_KEYWORDS = {
     CommentIntent.PRICE_INQUIRY: [
         "combien", "prix", "price", "how much", "كم", "بشحال", "قداش",
-        "cout", "coute", "tarif", "سعر", "ثمن", "cost", "coûte"
+        "cout", "coute", "tarif", "سعر", "ثمن", "cost", "coûte",
+        "9adech", "kadech", "b9adech", "bkadech", "soum"
     ],
     CommentIntent.AVAILABILITY: [
         "stock", "disponible", "available", "dispo", "موجود", "فما",
-        "avez-vous", "reste", "en stock", "still have", "فيه", "عندكم"
+        "avez-vous", "reste", "en stock", "still have", "فيه", "عندكم",
+        "famma", "fama"
     ],
     CommentIntent.SIZE_QUESTION: [
         "taille", "size", "قياس", "مقاس", "mesure", "s", "m", "l", "xl",
@@ -52,12 +107,13 @@ INTENT_KEYWORDS = {
         "d17", "نخلص", "كيفاش نخلص", "how to pay", "دفع"
     ],
     CommentIntent.RETURN_QUESTION: [
-        "retour", "échange", "return", "ترجيع", "exchange", "rembours",
+        "retour", "échang*", "return", "ترجيع", "exchange", "rembours*",
         "نرجع", "تبديل", "changer", "refund"
     ],
     CommentIntent.ORDER_INTENT: [
         "commander", "acheter", "order", "buy", "نشري", "نحب",
-        "je veux", "i want", "intéressé", "نكومندي", "نوخذ", "take"
+        "je veux", "i want", "intéressé", "نكومندي", "نوخذ", "take",
+        "nkomandi", "ncommandi"
     ],
     CommentIntent.PRAISE: [
         "beau", "magnifique", "superbe", "love", "beautiful", "amazing",
@@ -69,8 +125,8 @@ INTENT_KEYWORDS = {
         "curieux", "je veux savoir"
     ],
     CommentIntent.CONFUSION: [
-        "comprends pas", "don't understand", "ما فهمت", "comment",
-        "how", "كيفاش", "explain", "explique", "c'est quoi", "شنو هذا"
+        "comprends pas", "don't understand", "ما فهمت", "comment ça", "comment faire",
+        "how does", "كيفاش", "explain", "explique", "c'est quoi", "شنو هذا"
     ],
     CommentIntent.NEGATIVE: [
         "cher", "expensive", "غالي", "nul", "mauvais", "bad",
@@ -83,6 +139,13 @@ INTENT_KEYWORDS = {
 }
 
 
+# Built once at import: finds every intent in a single pass over the comment
+INTENT_MATCHER = IntentMatcher(INTENT_KEYWORDS)
+
+# Built once at import: checks every quality rule in a single pass over the reply
+REPLY_VALIDATOR = ReplyValidator(FORBIDDEN_PATTERNS)
+
+
 class ReplyGenerator:
     """Service for generating and validating Instagram replies."""
 
@@ -91,16 +154,16 @@ class ReplyGenerator:
         claude_service: ClaudeService,
         cache_service: CacheService,
     ):
+        self.settings = get_settings()
         self.claude = claude_service
         self.cache = cache_service
+        self.near_duplicates = NearDuplicateChecker(self.settings.near_duplicate_threshold)
+        self.reply_cache = ReplyCache(cache_service)
+        self.templates = TemplateEngine()
 
     def detect_intents(self, comment_text: str) -> list[CommentIntent]:
         """Detect all matching intents from a comment."""
-        comment_lower = comment_text.lower()
-        detected = []
-        for intent, keywords in INTENT_KEYWORDS.items():
-            if any(keyword in comment_lower for keyword in keywords):
-                detected.append(intent)
+        detected = INTENT_MATCHER.match(comment_text)
         return detected if detected else [CommentIntent.GENERAL]
 
     def detect_intent(self, comment_text: str) -> CommentIntent:
@@ -125,64 +188,389 @@ class ReplyGenerator:
 
     def validate_reply(self, reply: str) -> tuple[bool, Optional[str]]:
         """Validate a generated reply against quality rules."""
-        # Check for forbidden patterns
-        for pattern in FORBIDDEN_PATTERNS:
-            if re.search(pattern, reply):
-                return False, "Contains AI/automation reference"
+        return REPLY_VALIDATOR.validate(reply)
+
+    def check_reply(self, reply: str) -> list[str]:
+        """Return every quality rule a reply violates."""
+        return REPLY_VALIDATOR.check(reply)
+
+    def retry_hint(self, errors: list[str], language: Language) -> Optional[str]:
+        """Correction hint covering every validation rule that rejected a reply."""
+        key = "tn" if language in (Language.ARABIC, Language.TUNISIAN) else language.value
+        hints = [
+            RETRY_HINTS[error].get(key, RETRY_HINTS[error]["fr"])
+            for error in errors
+            if error in RETRY_HINTS
+        ]
+        return " ".join(hints) if hints else None
+
+    def account_id(self, request: ReplyRequest) -> Optional[str]:
+        """Account whose recent replies a new reply must not repeat."""
+        ctx = request.seller_context
+        if ctx is None or not self.settings.near_duplicate_enabled:
+            return None
+        return ctx.instagram_handle or ctx.company_id
 
-        # Check sentence count (max 2)
-        sentences = [s.strip() for s in re.split(r'[.!?]', reply) if s.strip()]
-        if len(sentences) > 2:
-            return False, "Too many sentences"
+    async def _avoid_repetition(
+        self,
+        request: ReplyRequest,
+        prepared: PreparedReply,
+        reply: str,
+        is_valid: bool,
+        account_id: str,
+        deadline: Optional[Deadline] = None,
+    ) -> tuple[str, bool, int]:
+        """
+        Regenerate once if the reply nearly repeats one of the account's recent replies.
+
+        Returns the reply to keep, its validity and the extra calls made.
+        """
+        signatures = await self.cache.get_recent_signatures(account_id)
+        score = self.near_duplicates.is_duplicate(reply, signatures)
+        if score is None:
+            return reply, is_valid, 0
 
-        # Check for links
-        if "http" in reply.lower() or "www." in reply.lower():
-            return False, "Contains link"
+        logger.info(f"Reply repeats a recent reply for {account_id} (similarity {score:.2f}). Regenerating...")
+        varied = await self.claude.generate_from_prepared(
+            prepared,
+            retry_hint=self.retry_hint([RULE_REPEATED], request.language),
+            deadline=deadline,
+        )
+        varied_valid, _ = self.validate_reply(varied)
+        # A repeated but valid reply still beats a fresh one that breaks the rules
+        if varied_valid or not is_valid:
+            return varied, varied_valid, 1
+        return reply, is_valid, 1
+
+    async def _generate_serial(
+        self,
+        prepared: PreparedReply,
+        language: Language,
+        deadline: Optional[Deadline] = None,
+    ) -> tuple[str, bool, int]:
+        """Generate, validate, and regenerate once with a hint on failure."""
+        reply = await self.claude.generate_from_prepared(prepared, deadline=deadline)
+
+        # Validate the reply
+        errors = self.check_reply(reply)
+        if errors:
+            logger.warning(f"Reply validation failed: {', '.join(errors)}. Regenerating...")
+            # Try once more with a regeneration hint
+            reply = await self.claude.generate_from_prepared(
+                prepared,
+                retry_hint=self.retry_hint(errors, language),
+                deadline=deadline,
+            )
+            # Re-validate
+            is_valid, _ = self.validate_reply(reply)
+            return reply, is_valid, 2
+        return reply, True, 1
 
-        # Check for hashtags
-        if "#" in reply:
-            return False, "Contains hashtag"
+    async def _generate_speculative(
+        self,
+        prepared: PreparedReply,
+        candidates: int,
+        deadline: Optional[Deadline] = None,
+    ) -> tuple[str, bool, int]:
+        """
+        Request several candidates at once and keep the first valid one.
 
-        # Check character limit
-        if len(reply) > 300:
-            return False, "Exceeds character limit"
+        Remaining in-flight calls are cancelled as soon as a valid reply
+        arrives. If none validates, the first completed reply is returned.
+        """
+        tasks = [
+            asyncio.create_task(self.claude.generate_from_prepared(prepared, deadline=deadline))
+            for _ in range(candidates)
+        ]
+        first_reply: Optional[str] = None
+        last_error: Optional[Exception] = None
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    reply = await next_done
+                except Exception as e:
+                    logger.warning(f"Speculative candidate failed: {e}")
+                    last_error = e
+                    continue
+                is_valid, error = self.validate_reply(reply)
+                if is_valid:
+                    return reply, True, candidates
+                logger.info(f"Speculative candidate rejected: {error}")
+                if first_reply is None:
+                    first_reply = reply
+        finally:
+            for task in tasks:
+                task.cancel()
 
-        return True, None
+        if first_reply is None:
+            raise last_error
+        return first_reply, False, candidates
 
-    async def generate(self, request: ReplyRequest) -> ReplyResponse:
-        """Generate a reply for a comment."""
-        # Detect all intents
+    async def generate(
+        self,
+        request: ReplyRequest,
+        deadline: Optional[Deadline] = None,
+        model_tier: Optional[str] = None,
+    ) -> ReplyResponse:
+        """Generate a reply for a comment within an optional deadline."""
+        # Matched once and passed down to the template, routing and response steps
         intents = self.detect_intents(request.comment_text)
-        primary_intent = intents[0]
-        logger.info(f"Detected intents: {intents} for comment: {request.comment_text[:50]}...")
+        templated = self._fast_path(request, intents)
+        if templated is not None:
+            return templated
 
-        # Build context tracking
-        context_used = self.build_context_used(request)
-        has_seller_context = request.seller_context is not None
+        # Repeated comments on the same post are answered from the variant pool
+        cache_key, cached = await self._from_cache(request, intents)
+        if cached is not None:
+            return cached
 
-        # Generate reply using Claude with seller context
-        reply = await self.claude.generate_reply(
+        # Build the payload once (prompt + images) so a retry can reuse it
+        prepared = await self.claude.prepare_reply_request(
             post_summary=request.post_summary,
             comment_text=request.comment_text,
             image_urls=request.image_urls,
             language=request.language,
             seller_context=request.seller_context,
+            intents=tuple(intents),
+            model_tier=model_tier,
         )
+        return await self._complete(request, prepared, intents, deadline, cache_key)
 
-        # Validate the reply
+    async def generate_batch(
+        self,
+        batch: BatchReplyRequest,
+        model_tier: Optional[str] = None,
+    ) -> AsyncIterator[BatchReplyItem]:
+        """
+        Generate replies for many comments on one post.
+
+        Images and the seller context are prepared once for the whole batch;
+        comments run with bounded concurrency and results are yielded as they
+        complete. A failing comment yields an item with ``error`` set.
+        """
+        requests = [self._comment_request(batch, comment) for comment in batch.comments]
+        post_contexts = await self.claude.prepare_post_contexts(
+            image_urls=batch.image_urls,
+            languages={r.language for r in requests},
+            seller_context=batch.seller_context,
+        )
+        slots = asyncio.Semaphore(self.settings.batch_concurrency)
+
+        async def run(index: int, request: ReplyRequest) -> BatchReplyItem:
+            comment_id = batch.comments[index].comment_id
+            try:
+                async with slots:
+                    intents = self.detect_intents(request.comment_text)
+                    result = self._fast_path(request, intents)
+                    cache_key = None
+                    if result is None:
+                        cache_key, result = await self._from_cache(request, intents)
+                    if result is None:
+                        prepared = self.claude.prepare_reply(
+                            post_contexts[request.language],
+                            request.post_summary,
+                            request.comment_text,
+                            tuple(intents),
+                            model_tier,
+                        )
+                        deadline = Deadline.after(self.settings.reply_deadline_seconds)
+                        result = await self._complete(request, prepared, intents, deadline, cache_key)
+                return BatchReplyItem(index=index, comment_id=comment_id, result=result)
+            except Exception as e:
+                logger.error(f"Batch reply failed for comment {comment_id}: {e}")
+                return BatchReplyItem(index=index, comment_id=comment_id, error=str(e))
+
+        tasks = [asyncio.create_task(run(i, r)) for i, r in enumerate(requests)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Client went away mid-stream: stop paying for the rest
+            for task in tasks:
+                task.cancel()
+
+    def _comment_request(self, batch: BatchReplyRequest, comment: BatchComment) -> ReplyRequest:
+        """Single-comment request view of a batch entry."""
+        return ReplyRequest(
+            post_id=batch.post_id,
+            post_summary=batch.post_summary,
+            comment_text=comment.comment_text,
+            image_urls=batch.image_urls,
+            language=comment.language or batch.language,
+            brand_voice=batch.brand_voice,
+            cta_allowed=batch.cta_allowed,
+            seller_context=batch.seller_context,
+            candidates=batch.candidates,
+        )
+
+    async def generate_stream(
+        self,
+        request: ReplyRequest,
+        deadline: Optional[Deadline] = None,
+        model_tier: Optional[str] = None,
+    ) -> AsyncIterator[ReplyStreamEvent]:
+        """
+        Stream a reply as it is generated, validating every delta.
+
+        The first attempt is cut off at its first violation (a third
+        sentence, a link, a hashtag, a forbidden phrase or the length cap):
+        the upstream stream is closed, a ``retry`` event tells the client to
+        discard the text so far, and a second attempt streams with a
+        correction hint. That attempt runs to completion. The first reply
+        streamed to the end is also checked against the account's recent
+        replies; a near repeat gets one more ``retry`` and a fresh attempt
+        asking for new wording. A ``done`` event carries the response for
+        the text streamed last.
+        """
+        intents = self.detect_intents(request.comment_text)
+        templated = self._fast_path(request, intents)
+        if templated is not None:
+            yield ReplyStreamEvent(event="token", text=templated.reply)
+            yield ReplyStreamEvent(event="done", result=templated)
+            return
+
+        prepared = await self.claude.prepare_reply_request(
+            post_summary=request.post_summary,
+            comment_text=request.comment_text,
+            image_urls=request.image_urls,
+            language=request.language,
+            seller_context=request.seller_context,
+            intents=tuple(intents),
+            model_tier=model_tier,
+        )
+
+        account_id = self.account_id(request)
+        check_repetition = account_id is not None
+        retry_hint = None
+        calls = 0
+        while True:
+            calls += 1
+            cut_off = calls == 1
+            check = REPLY_VALIDATOR.stream()
+            violations: list[str] = []
+            deltas = self.claude.stream_from_prepared(prepared, retry_hint=retry_hint, deadline=deadline)
+            async with aclosing(deltas):
+                async for delta in deltas:
+                    violations = check.feed(delta)
+                    if violations and cut_off:
+                        # Closing the iterator cancels the upstream request
+                        break
+                    yield ReplyStreamEvent(event="token", text=delta)
+            if violations and cut_off:
+                logger.warning(f"Streamed reply aborted: {', '.join(violations)}. Regenerating...")
+            elif check_repetition:
+                check_repetition = False
+                signatures = await self.cache.get_recent_signatures(account_id)
+                score = self.near_duplicates.is_duplicate(check.text.strip(), signatures)
+                if score is None:
+                    break
+                logger.info(
+                    f"Streamed reply repeats a recent reply for {account_id} (similarity {score:.2f}). Regenerating..."
+                )
+                violations = [RULE_REPEATED]
+            else:
+                break
+            yield ReplyStreamEvent(event="retry", violations=violations)
+            retry_hint = self.retry_hint(violations, request.language)
+
+        reply = check.text.strip()
+        is_valid, _ = self.validate_reply(reply)
+        if account_id:
+            await self.cache.add_recent_reply(account_id, reply)
+        result = self._build_response(request, intents, reply, is_valid, calls, speculative_used=False)
+        yield ReplyStreamEvent(event="done", result=result)
+
+    def _fast_path(
+        self,
+        request: ReplyRequest,
+        intents: Optional[list[CommentIntent]] = None,
+    ) -> Optional[ReplyResponse]:
+        """Templated response for trivially answerable comments, if the policy allows."""
+        if intents is None:
+            intents = self.detect_intents(request.comment_text)
+        reply = self.templates.render(request, intents)
+        if reply is None:
+            return None
         is_valid, error = self.validate_reply(reply)
         if not is_valid:
-            logger.warning(f"Reply validation failed: {error}. Regenerating...")
-            # Try once more with a regeneration hint
-            reply = await self.claude.generate_reply(
-                post_summary=request.post_summary,
-                comment_text=request.comment_text,
-                image_urls=request.image_urls,
-                language=request.language,
-                seller_context=request.seller_context,
+            # Only a misconfigured bank or an odd currency gets here; let the model answer
+            logger.warning(f"Template reply rejected ({error}): {reply}")
+            return None
+        return self._build_response(request, intents, reply, True, 0, speculative_used=False, fast_path=True)
+
+    async def _from_cache(
+        self,
+        request: ReplyRequest,
+        intents: list[CommentIntent],
+    ) -> tuple[Optional[str], Optional[ReplyResponse]]:
+        """
+        Reply cache key for a request and the cached response, if any.
+
+        Variants that repeat one of the account's recent replies are not
+        served, and a served variant is recorded like a generated reply.
+        """
+        cache_key = self.reply_cache.key(request)
+        if cache_key is None:
+            return None, None
+        account_id = self.account_id(request)
+        signatures = await self.cache.get_recent_signatures(account_id) if account_id else []
+
+        def is_new(variant: str) -> bool:
+            return self.near_duplicates.is_duplicate(variant, signatures) is None
+
+        reply = await self.reply_cache.get(cache_key, is_new)
+        if reply is None:
+            return cache_key, None
+        logger.info(f"Reply cache hit for post {request.post_id}: {request.comment_text[:50]}")
+        if account_id:
+            await self.cache.add_recent_reply(account_id, reply)
+        return cache_key, self._build_response(request, intents, reply, True, 0, speculative_used=False, cached=True)
+
+    async def _complete(
+        self,
+        request: ReplyRequest,
+        prepared: PreparedReply,
+        intents: list[CommentIntent],
+        deadline: Optional[Deadline] = None,
+        cache_key: Optional[str] = None,
+    ) -> ReplyResponse:
+        """Run generation and validation for a prepared comment payload."""
+        # Generate reply using Claude with seller context
+        candidates = request.candidates or self.settings.speculative_candidates
+        if candidates > 1:
+            reply, is_valid, calls = await self._generate_speculative(prepared, candidates, deadline)
+        else:
+            reply, is_valid, calls = await self._generate_serial(prepared, request.language, deadline)
+
+        account_id = self.account_id(request)
+        if account_id:
+            reply, is_valid, extra_calls = await self._avoid_repetition(
+                request, prepared, reply, is_valid, account_id, deadline
             )
-            # Re-validate
-            is_valid, _ = self.validate_reply(reply)
+            calls += extra_calls
+            await self.cache.add_recent_reply(account_id, reply)
+        if cache_key is not None and is_valid:
+            await self.reply_cache.put(cache_key, reply)
+        return self._build_response(request, intents, reply, is_valid, calls, speculative_used=candidates > 1)
+
+    def _build_response(
+        self,
+        request: ReplyRequest,
+        intents: list[CommentIntent],
+        reply: str,
+        is_valid: bool,
+        calls: int,
+        speculative_used: bool,
+        cached: bool = False,
+        fast_path: bool = False,
+    ) -> ReplyResponse:
+        """Attach intents, context usage and confidence to a generated reply."""
+        primary_intent = intents[0]
+        logger.info(f"Detected intents: {intents} for comment: {request.comment_text[:50]}...")
+
+        # Build context tracking
+        context_used = self.build_context_used(request)
+        has_seller_context = request.seller_context is not None
 
         # Calculate confidence based on context availability and validation
         base_confidence = 0.95 if is_valid else 0.75
@@ -201,4 +589,8 @@ class ReplyGenerator:
             language_used=request.language,
             context_used=context_used,
             fallback_used=not has_seller_context,
+            candidates_generated=calls,
+            speculative_used=speculative_used,
+            cached=cached,
+            fast_path=fast_path,
         )
@@ -0,0 +1,121 @@
+import base64
+import heapq
+import struct
+import zlib
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Iterable, Iterator, NamedTuple, Optional, Sequence
+
+from app.services.text_normalization import normalize_text
+
+# Error string used when a reply repeats one of the account's recent replies
+RULE_REPEATED = "Too similar to a recent reply"
+
+# Character shingle width; 4 keeps short replies distinguishable without
+# making a single changed word look like a different reply
+SHINGLE_SIZE = 4
+
+# Hashes kept per signature (bottom-k sketch)
+SIGNATURE_SIZE = 64
+
+# Lowest hashes of a signature used as its LSH band. Two replies at
+# Jaccard J share one with probability about 1 - (1 - J)^8, so a pair at
+# the 0.6 threshold is skipped less than once in a thousand times
+BAND_SIZE = 8
+
+# Decoded signatures memoised per process (about 3 KB each)
+DECODED_SIGNATURES_MAX = 2048
+
+
+class StoredSignature(NamedTuple):
+    """A decoded signature with its band precomputed."""
+
+    hashes: tuple[int, ...]
+    band: frozenset[int]
+
+
+def shingle_hashes(text: str, size: int = SHINGLE_SIZE) -> set[int]:
+    """32-bit hashes of the character shingles of the normalised text."""
+    normalized = normalize_text(text)
+    if len(normalized) <= size:
+        return {zlib.crc32(normalized.encode("utf-8"))} if normalized else set()
+    # Shingle over code points, not bytes, so Arabic is never split mid-character
+    return {
+        zlib.crc32(normalized[i : i + size].encode("utf-8"))
+        for i in range(len(normalized) - size + 1)
+    }
+
+
+def signature(text: str, k: int = SIGNATURE_SIZE) -> list[int]:
+    """Bottom-k MinHash sketch: the k smallest shingle hashes, sorted."""
+    # A full sort beats heapq.nsmallest at reply sizes (a few hundred shingles at most)
+    return sorted(shingle_hashes(text))[:k]
+
+
+def encode_signature(sig: list[int]) -> str:
+    """Compact text form for Redis (4 bytes per hash, base64)."""
+    return base64.b64encode(struct.pack(f"<{len(sig)}I", *sig)).decode("ascii")
+
+
+@lru_cache(maxsize=DECODED_SIGNATURES_MAX)
+def decode_signature(encoded: str) -> StoredSignature:
+    """
+    Sorted hashes and band of an encoded signature.
+
+    Memoised: an account's window moves by one reply per request, so all
+    but the newest signature were already decoded by the previous check.
+    """
+    raw = base64.b64decode(encoded)
+    hashes = struct.unpack(f"<{len(raw) // 4}I", raw)
+    return StoredSignature(hashes, frozenset(hashes[:BAND_SIZE]))
+
+
+def estimate_jaccard(a: Sequence[int], a_set: set[int], b: Sequence[int], k: int = SIGNATURE_SIZE) -> float:
+    """
+    Jaccard similarity estimated from two sorted bottom-k sketches.
+
+    Only hashes up to the smaller of the two truncation points are known for
+    both texts, so the comparison is restricted to those. A sketch with
+    fewer than k hashes holds every shingle and imposes no limit; two such
+    sketches give the exact similarity.
+    """
+    if not a or not b:
+        return 0.0
+    limits = [sketch[-1] for sketch in (a, b) if len(sketch) >= k]
+    cutoff = min(limits) if limits else max(a[-1], b[-1])
+    in_a = bisect_right(a, cutoff)
+    in_b = bisect_right(b, cutoff)
+    shared = len(a_set.intersection(b[:in_b]))
+    return shared / (in_a + in_b - shared)
+
+
+class NearDuplicateChecker:
+    """
+    Scores a candidate reply against an account's recent reply signatures.
+
+    Only stored signatures whose band shares a hash with the candidate's
+    are scored; the rest are too dissimilar to matter and count as 0.
+    """
+
+    def __init__(self, threshold: float, k: int = SIGNATURE_SIZE):
+        self.threshold = threshold
+        self.k = k
+
+    def _scores(self, reply: str, signatures: Iterable[StoredSignature]) -> Iterator[float]:
+        candidate = signature(reply, self.k)
+        candidate_set = set(candidate)
+        band = set(candidate[:BAND_SIZE])
+        for stored in signatures:
+            if not band.isdisjoint(stored.band):
+                yield estimate_jaccard(candidate, candidate_set, stored.hashes, self.k)
+
+    def max_similarity(self, reply: str, signatures: Iterable[StoredSignature]) -> float:
+        """Highest estimated Jaccard similarity to any stored signature."""
+        return max(self._scores(reply, signatures), default=0.0)
+
+    def is_duplicate(self, reply: str, signatures: Iterable[StoredSignature]) -> Optional[float]:
+        """The first similarity score at or above the threshold, or None if the reply is new."""
+        for score in self._scores(reply, signatures):
+            if score >= self.threshold:
+                return score
+        return None
@@ -0,0 +1,263 @@
+import random
+import logging
+from collections import Counter, OrderedDict
+from typing import Optional
+
+from app.config import get_settings
+from app.models import BrandVoice, CommentIntent, ProductContext, ReplyRequest
+
+logger = logging.getLogger(__name__)
+
+# When the fast path may answer without a model call
+FAST_PATH_OFF = "off"
+FAST_PATH_PRAISE = "praise"  # comments that are only praise
+FAST_PATH_SAFE = "safe"  # praise, plus price/stock questions the product context answers exactly
+
+PF = BrandVoice.PROFESSIONAL_FRIENDLY
+CASUAL = BrandVoice.CASUAL
+FORMAL = BrandVoice.FORMAL
+
+# kind -> language -> brand voice -> interchangeable replies. Every reply is
+# one sentence so an optional CTA keeps it within the two-sentence rule.
+TEMPLATES: dict[str, dict[str, dict[BrandVoice, list[str]]]] = {
+    "praise": {
+        "fr": {
+            PF: ["Merci beaucoup, ça nous fait très plaisir!", "Merci pour ce gentil message!", "Merci, ravis que ça te plaise!"],
+            CASUAL: ["Merci beaucoup, trop contents que ça te plaise!", "Merci, t'es adorable!", "Merci à toi, ça fait plaisir!"],
+            FORMAL: ["Merci beaucoup pour votre message.", "Nous vous remercions pour ce compliment.", "Merci, nous sommes ravis que cela vous plaise."],
+        },
+        "en": {
+            PF: ["Thank you so much, we're glad you like it!", "Thanks a lot for the kind words!", "Thank you, that means a lot to us!"],
+            CASUAL: ["Thanks so much, glad you love it!", "Aww, thank you!", "Thanks, you made our day!"],
+            FORMAL: ["Thank you very much for your kind message.", "We truly appreciate your compliment.", "Thank you, we are delighted you like it."],
+        },
+        "tn": {
+            PF: ["يعيشك، فرحتنا اللي عجبك!", "شكرا برشا على الكلام الباهي!", "يعطيك الصحة، فرحتنا!"],
+            CASUAL: ["يعيشك برشا!", "ميرسي، فرحتنا برشا!", "يعطيك الصحة على الكلمة الباهية!"],
+            FORMAL: ["شكرا جزيلا على كلامك الطيب.", "نشكروك برشا على التعليق.", "يسعدنا اللي المنتوج عجبك."],
+        },
+        "ar": {
+            PF: ["شكرا جزيلا، يسعدنا أنه أعجبك!", "شكرا على كلماتك الجميلة!", "شكرا لك، هذا يعني لنا الكثير!"],
+            CASUAL: ["شكرا كثيرا!", "شكرا لك، أسعدتنا!", "ممتنون لك، شكرا!"],
+            FORMAL: ["نشكرك جزيل الشكر على رسالتك.", "نقدر إطراءك كثيرا.", "يسعدنا أن المنتج نال إعجابك."],
+        },
+    },
+    "price": {
+        "fr": {
+            PF: ["C'est {price}!", "Le prix est de {price}.", "Il est à {price}!"],
+            CASUAL: ["C'est {price}!", "Seulement {price}!", "Il est à {price}!"],
+            FORMAL: ["Le prix est de {price}.", "Cet article est proposé à {price}."],
+        },
+        "en": {
+            PF: ["It's {price}!", "The price is {price}."],
+            CASUAL: ["It's {price}!", "Just {price}!"],
+            FORMAL: ["The price is {price}.", "This item is priced at {price}."],
+        },
+        "tn": {
+            PF: ["السوم {price}!", "الثمن متاعو {price}."],
+            CASUAL: ["بـ {price} برك!", "السوم {price}!"],
+            FORMAL: ["الثمن {price}.", "سعر المنتوج {price}."],
+        },
+        "ar": {
+            PF: ["السعر {price}!", "ثمنه {price}."],
+            CASUAL: ["فقط {price}!", "السعر {price}!"],
+            FORMAL: ["سعر المنتج {price}.", "يبلغ سعر هذا المنتج {price}."],
+        },
+    },
+    "in_stock": {
+        "fr": {
+            PF: ["Oui, il est disponible!", "Oui, toujours en stock!"],
+            CASUAL: ["Oui, il est dispo!", "Oui, on l'a en stock!"],
+            FORMAL: ["Oui, cet article est disponible.", "Oui, l'article est actuellement en stock."],
+        },
+        "en": {
+            PF: ["Yes, it's available!", "Yes, still in stock!"],
+            CASUAL: ["Yep, it's available!", "Yes, we have it in stock!"],
+            FORMAL: ["Yes, this item is available.", "Yes, this item is currently in stock."],
+        },
+        "tn": {
+            PF: ["إيه، موجود!", "إيه، مازال متوفر!"],
+            CASUAL: ["إيه موجود!", "إيه، عندنا منو!"],
+            FORMAL: ["نعم، المنتوج متوفر.", "نعم، المنتوج موجود حاليا."],
+        },
+        "ar": {
+            PF: ["نعم، متوفر!", "نعم، ما زال متوفرا!"],
+            CASUAL: ["نعم متوفر!", "أكيد، موجود!"],
+            FORMAL: ["نعم، المنتج متوفر.", "نعم، المنتج متوفر حاليا في المخزون."],
+        },
+    },
+    "low_stock": {
+        "fr": {
+            PF: ["Oui, mais il en reste très peu!", "Encore disponible, mais les quantités sont limitées."],
+            CASUAL: ["Oui, mais il en reste presque plus!", "Dispo, mais fais vite, il en reste peu!"],
+            FORMAL: ["Oui, mais les quantités restantes sont limitées.", "Cet article est disponible en quantité limitée."],
+        },
+        "en": {
+            PF: ["Yes, but only a few are left!", "Still available, but stock is limited."],
+            CASUAL: ["Yes, but hurry, only a few left!", "Yep, but it's almost gone!"],
+            FORMAL: ["Yes, though only limited stock remains.", "This item is available in limited quantities."],
+        },
+        "tn": {
+            PF: ["إيه، أما بقات كمية صغيرة!", "موجود، أما الكمية محدودة."],
+            CASUAL: ["إيه، أما باقي شوية برك!", "موجود، أما أعمل بالزربة!"],
+            FORMAL: ["نعم، أما الكمية المتبقية محدودة.", "المنتوج متوفر بكمية محدودة."],
+        },
+        "ar": {
+            PF: ["نعم، لكن الكمية قليلة!", "متوفر، لكن الكمية محدودة."],
+            CASUAL: ["نعم، لكن بقيت قطع قليلة فقط!", "متوفر، أسرع قبل نفاده!"],
+            FORMAL: ["نعم، لكن الكمية المتبقية محدودة.", "المنتج متوفر بكمية محدودة."],
+        },
+    },
+    "out_of_stock": {
+        "fr": {
+            PF: ["Désolé, il n'est plus disponible pour le moment.", "Malheureusement, il est en rupture de stock pour l'instant."],
+            CASUAL: ["Désolé, plus dispo pour le moment!", "Oups, il est en rupture pour l'instant!"],
+            FORMAL: ["Nous sommes désolés, cet article n'est plus disponible pour le moment.", "Cet article est malheureusement en rupture de stock."],
+        },
+        "en": {
+            PF: ["Sorry, it's not available right now.", "Unfortunately, it's out of stock for the moment."],
+            CASUAL: ["Sorry, it's sold out for now!", "Oops, it's out of stock right now!"],
+            FORMAL: ["We are sorry, this item is currently unavailable.", "Unfortunately, this item is out of stock at the moment."],
+        },
+        "tn": {
+            PF: ["سامحنا، مش موجود توة.", "للأسف، وفى من الستوك توة."],
+            CASUAL: ["سامحنا، وفى توة!", "للأسف مش متوفر توة!"],
+            FORMAL: ["نعتذر، المنتوج غير متوفر حاليا.", "للأسف، المنتوج نفد من المخزون حاليا."],
+        },
+        "ar": {
+            PF: ["عذرا، غير متوفر حاليا.", "للأسف، نفد من المخزون حاليا."],
+            CASUAL: ["عذرا، نفد حاليا!", "للأسف غير متوفر الآن!"],
+            FORMAL: ["نعتذر، المنتج غير متوفر حاليا.", "للأسف، نفد هذا المنتج من المخزون حاليا."],
+        },
+    },
+}
+
+# Second sentence added when the request allows a call to action
+CTA_TEMPLATES: dict[str, dict[BrandVoice, list[str]]] = {
+    "fr": {
+        PF: ["Écris-nous en DM pour commander!"],
+        CASUAL: ["Envoie-nous un DM pour commander!"],
+        FORMAL: ["Contactez-nous en message privé pour commander."],
+    },
+    "en": {
+        PF: ["Send us a DM to order!"],
+        CASUAL: ["DM us to grab yours!"],
+        FORMAL: ["Please send us a private message to order."],
+    },
+    "tn": {
+        PF: ["ابعثلنا DM باش تكومندي!"],
+        CASUAL: ["ابعثلنا ميساج باش تكومندي!"],
+        FORMAL: ["راسلنا في الخاص باش تكومندي."],
+    },
+    "ar": {
+        PF: ["راسلنا في الخاص للطلب!"],
+        CASUAL: ["راسلنا للطلب!"],
+        FORMAL: ["يرجى مراسلتنا في الخاص لإتمام الطلب."],
+    },
+}
+
+# Kinds that never end with an invitation to order
+NO_CTA_KINDS = {"out_of_stock"}
+
+STOCK_KINDS = {"in_stock", "low_stock", "out_of_stock"}
+
+# Stock statuses under which a price can be quoted with an invitation to order
+ORDERABLE_STOCK = {"in_stock", "low_stock"}
+
+# Currency symbols used in replies; other currencies show their code
+CURRENCY_SYMBOLS = {"TND": "DT"}
+
+
+def format_price(product: ProductContext) -> Optional[str]:
+    """The product's current price as shown to customers, if known."""
+    value = product.sale_price if product.sale_price is not None else product.regular_price
+    if value is None or value <= 0:
+        return None
+    currency = CURRENCY_SYMBOLS.get(product.currency.upper(), product.currency.upper())
+    if value == int(value):
+        amount = str(int(value))
+    else:
+        # Decimal comma: a dot would read as a sentence end to the validator
+        decimals = 3 if product.currency.upper() == "TND" else 2
+        amount = f"{value:.{decimals}f}".replace(".", ",")
+    return f"{amount} {currency}"
+
+
+class TemplateEngine:
+    """
+    Deterministic replies for comments a model call cannot improve on.
+
+    Pure praise is thanked, and under the ``safe`` policy a lone price or
+    availability question is answered when the product context holds the
+    exact price and stock status, or the stock status respectively; a price
+    question about an out-of-stock product gets the out-of-stock reply. Replies come from per-language,
+    per-brand-voice banks. Each post rotates through its bank from a random
+    starting point, so consecutive commenters on a post get different
+    wording and workers do not all start on the same entry.
+    """
+
+    def __init__(self, max_rotations: int = 10_000):
+        self.settings = get_settings()
+        self.max_rotations = max_rotations
+        self._turns: OrderedDict[tuple, int] = OrderedDict()
+        self.rendered: Counter[str] = Counter()
+
+    def kind(self, request: ReplyRequest, intents: list[CommentIntent]) -> Optional[str]:
+        """Which bank can answer the comment under the current policy, if any."""
+        policy = self.settings.reply_fast_path
+        if policy == FAST_PATH_OFF or len(intents) != 1:
+            return None
+        intent = intents[0]
+        if intent == CommentIntent.PRAISE:
+            return "praise" if policy in (FAST_PATH_PRAISE, FAST_PATH_SAFE) else None
+        if policy != FAST_PATH_SAFE or request.seller_context is None:
+            return None
+        product = request.seller_context.product_context
+        if product is None:
+            return None
+        if intent == CommentIntent.PRICE_INQUIRY:
+            # Quoting a price invites an order, so it needs a known stock status too
+            if product.stock_status == "out_of_stock":
+                return "out_of_stock"
+            if product.stock_status in ORDERABLE_STOCK and format_price(product):
+                return "price"
+            return None
+        if intent == CommentIntent.AVAILABILITY and product.stock_status in STOCK_KINDS:
+            return product.stock_status
+        return None
+
+    def _pick(self, rotation_key: tuple, options: list[str]) -> str:
+        """Next entry of a bank for this rotation key."""
+        turn = self._turns.pop(rotation_key, None)
+        if turn is None:
+            turn = random.randrange(len(options))
+        self._turns[rotation_key] = turn + 1
+        if len(self._turns) > self.max_rotations:
+            self._turns.popitem(last=False)
+        return options[turn % len(options)]
+
+    def render(self, request: ReplyRequest, intents: list[CommentIntent]) -> Optional[str]:
+        """A templated reply for the comment, or None if it needs the model."""
+        kind = self.kind(request, intents)
+        if kind is None:
+            return None
+        language = request.language.value
+        voice = request.brand_voice
+        bank = TEMPLATES[kind].get(language, TEMPLATES[kind]["fr"])
+        options = bank.get(voice) or bank[PF]
+
+        reply = self._pick((request.post_id, kind, language, voice), options)
+        if kind == "price":
+            reply = reply.format(price=format_price(request.seller_context.product_context))
+        if request.cta_allowed and kind not in NO_CTA_KINDS:
+            cta_bank = CTA_TEMPLATES.get(language, CTA_TEMPLATES["fr"])
+            reply = f"{reply} {self._pick((request.post_id, 'cta', language, voice), cta_bank.get(voice) or cta_bank[PF])}"
+        self.rendered[kind] += 1
+        return reply
+
+    def stats(self) -> dict:
+        return {
+            "policy": self.settings.reply_fast_path,
+            "rendered": dict(self.rendered),
+            "rendered_total": sum(self.rendered.values()),
+        }
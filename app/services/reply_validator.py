@@ -0,0 +1,196 @@
+import re
+from typing import Iterable, Optional
+
+# Rule names double as the error strings returned to callers
+RULE_FORBIDDEN = "Contains AI/automation reference"
+RULE_SENTENCES = "Too many sentences"
+RULE_LINK = "Contains link"
+RULE_HASHTAG = "Contains hashtag"
+RULE_LENGTH = "Exceeds character limit"
+
+# Order in which violations are reported; the first one is the "main" error
+RULE_ORDER = (RULE_FORBIDDEN, RULE_SENTENCES, RULE_LINK, RULE_HASHTAG, RULE_LENGTH)
+
+# Longest text a single flag match can span; streaming re-scans this much overlap
+STREAM_OVERLAP = 64
+
+TERMINATOR_RE = re.compile(r"[.!?]")
+NON_SPACE_RE = re.compile(r"\S")
+
+# Characters that would make a pattern's first character ambiguous
+_NON_LITERAL = set("\\[.^$*+?{|)")
+
+
+def _split_alternatives(pattern: str) -> list[str]:
+    """Split a pattern on its top-level ``|``."""
+    branches, depth, current, i = [], 0, [], 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "\\":
+            current.append(pattern[i : i + 2])
+            i += 2
+            continue
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "|" and depth == 0:
+            branches.append("".join(current))
+            current = []
+            i += 1
+            continue
+        current.append(ch)
+        i += 1
+    branches.append("".join(current))
+    return branches
+
+
+def _leading_chars(pattern: str) -> Optional[set[str]]:
+    """
+    Characters a match of ``pattern`` can start with, or None if unknown.
+
+    Only understands literals, groups and alternation, which covers the
+    forbidden phrase list; anything else disables the prefilter.
+    """
+    chars: set[str] = set()
+    for branch in _split_alternatives(pattern):
+        if not branch:
+            return None
+        if branch[0] == "(":
+            depth = 0
+            for end, ch in enumerate(branch):
+                depth += ch == "("
+                depth -= ch == ")"
+                if depth == 0:
+                    break
+            else:
+                return None
+            if branch[end + 1 : end + 2] in ("?", "*", "{"):
+                return None
+            inner = branch[1:end]
+            if inner.startswith("?:"):
+                inner = inner[2:]
+            elif inner.startswith("?"):
+                return None
+            nested = _leading_chars(inner)
+            if nested is None:
+                return None
+            chars |= nested
+        elif branch[0] in _NON_LITERAL or branch[1:2] in ("?", "*", "{"):
+            return None
+        else:
+            chars.add(branch[0])
+    return chars
+
+
+class ReplyValidator:
+    """
+    Compiled, single-pass reply validator.
+
+    All forbidden patterns are merged into one case-insensitive alternation
+    together with the link, hashtag and sentence-terminator checks, so a
+    reply is scanned once and every violated rule is reported.
+    """
+
+    def __init__(
+        self,
+        forbidden_patterns: Iterable[str],
+        max_sentences: int = 2,
+        max_chars: int = 300,
+    ):
+        self.max_sentences = max_sentences
+        self.max_chars = max_chars
+        # Patterns carry their own (?i); the combined regex is compiled case-insensitive instead
+        forbidden = "|".join(f"(?:{p.removeprefix('(?i)')})" for p in forbidden_patterns)
+        # "www" stops before the dot so the dot still ends a sentence, like the old split did
+        flags = rf"(?P<forbidden>{forbidden})|(?P<link>http|www(?=\.))|(?P<hashtag>#)"
+        scanner = rf"{flags}|(?P<end>[.!?])"
+        # A first-character lookahead lets the engine skip most positions
+        # without trying every branch of the alternation
+        leading = _leading_chars(forbidden)
+        if leading is not None:
+            first = "".join(sorted(re.escape(c) for c in leading | set("hw#")))
+            flags = rf"(?=[{first}])(?:{flags})"
+            scanner = rf"(?=[{first}.!?])(?:{scanner})"
+        self._flags = re.compile(flags, re.IGNORECASE)
+        self._scanner = re.compile(scanner, re.IGNORECASE)
+
+    def check(self, reply: str) -> list[str]:
+        """Return every rule the reply violates, in RULE_ORDER."""
+        found = set()
+        sentences = 0
+        segment_start = 0
+        for match in self._scanner.finditer(reply):
+            kind = match.lastgroup
+            if kind == "end":
+                if NON_SPACE_RE.search(reply, segment_start, match.start()):
+                    sentences += 1
+                segment_start = match.end()
+            elif kind == "forbidden":
+                found.add(RULE_FORBIDDEN)
+            elif kind == "link":
+                found.add(RULE_LINK)
+            else:
+                found.add(RULE_HASHTAG)
+        if NON_SPACE_RE.search(reply, segment_start):
+            sentences += 1
+
+        if sentences > self.max_sentences:
+            found.add(RULE_SENTENCES)
+        if len(reply) > self.max_chars:
+            found.add(RULE_LENGTH)
+        return [rule for rule in RULE_ORDER if rule in found]
+
+    def validate(self, reply: str) -> tuple[bool, Optional[str]]:
+        """(is_valid, first violated rule) for callers that need one error."""
+        violations = self.check(reply)
+        return (False, violations[0]) if violations else (True, None)
+
+    def stream(self) -> "StreamingCheck":
+        """Start an incremental check for a reply that arrives in chunks."""
+        return StreamingCheck(self)
+
+
+class StreamingCheck:
+    """
+    Incremental validation of streamed output.
+
+    Each ``feed`` only scans the new chunk (plus a small overlap for
+    patterns split across chunks). Every rule is monotonic as text grows,
+    so a violation reported here is final and generation can be aborted.
+    """
+
+    def __init__(self, validator: ReplyValidator):
+        self.validator = validator
+        self.text = ""
+        self.violations: set[str] = set()
+        self._sentences = 0
+        self._segment_start = 0
+
+    def feed(self, chunk: str) -> list[str]:
+        """Add a chunk and return every rule violated so far."""
+        start = len(self.text)
+        self.text += chunk
+        text = self.text
+
+        for match in self.validator._flags.finditer(text, max(0, start - STREAM_OVERLAP)):
+            kind = match.lastgroup
+            self.violations.add(
+                RULE_FORBIDDEN if kind == "forbidden" else RULE_LINK if kind == "link" else RULE_HASHTAG
+            )
+
+        for match in TERMINATOR_RE.finditer(text, start):
+            if NON_SPACE_RE.search(text, self._segment_start, match.start()):
+                self._sentences += 1
+            self._segment_start = match.end()
+        open_sentence = 1 if NON_SPACE_RE.search(text, self._segment_start) else 0
+        if self._sentences + open_sentence > self.validator.max_sentences:
+            self.violations.add(RULE_SENTENCES)
+
+        if len(text) > self.validator.max_chars:
+            self.violations.add(RULE_LENGTH)
+        return [rule for rule in RULE_ORDER if rule in self.violations]
+
+    @property
+    def ok(self) -> bool:
+        return not self.violations
@@ -0,0 +1,159 @@
+import time
+import random
+import logging
+from collections import deque
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Statuses worth another attempt; anything else is the caller's problem
+RETRYABLE_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request's time budget is spent."""
+
+
+class CircuitOpen(Exception):
+    """Raised when the circuit breaker is refusing calls."""
+
+
+class Deadline:
+    """Absolute time budget for one request, passed down through every call."""
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    @classmethod
+    def after(cls, seconds: float) -> "Deadline":
+        return cls(seconds)
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, cap: Optional[float] = None) -> float:
+        """Seconds the next operation may take, raising if none are left."""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded("Request deadline exceeded")
+        return min(remaining, cap) if cap is not None else remaining
+
+
+class CircuitBreaker:
+    """
+    Classic closed / open / half-open breaker.
+
+    Opens after ``failure_threshold`` consecutive failures, refuses calls for
+    ``reset_timeout`` seconds, then lets a single probe through; the probe's
+    outcome closes or re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        """Whether a call may go through right now."""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def check(self) -> None:
+        """Raise CircuitOpen if the call must not go through."""
+        if not self.allow():
+            raise CircuitOpen(f"Circuit '{self.name}' is open")
+
+    def abandon(self) -> None:
+        """Forget an allowed call that ended without a verdict, e.g. cancelled."""
+        self._probe_in_flight = False
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info(f"Circuit '{self.name}' closed")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+                logger.warning(f"Circuit '{self.name}' opened after {self.failures} failures")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "times_opened": self.times_opened,
+        }
+
+
+class RetryPolicy:
+    """Capped exponential backoff with full jitter, for retryable errors only."""
+
+    def __init__(self, max_attempts: int, base_delay: float, max_delay: float):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @staticmethod
+    def is_retryable(error: Exception) -> bool:
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code in RETRYABLE_STATUSES
+        return isinstance(error, (httpx.TimeoutException, httpx.TransportError))
+
+    def backoff(self, attempt: int, error: Optional[Exception] = None) -> float:
+        """Delay before retry number ``attempt`` (1-based), honouring Retry-After."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if isinstance(error, httpx.HTTPStatusError):
+            retry_after = error.response.headers.get("retry-after", "")
+            if retry_after.replace(".", "", 1).isdigit():
+                delay = max(delay, float(retry_after))
+        return delay
+
+
+class LatencyTracker:
+    """Rolling window of call latencies for percentile estimates."""
+
+    def __init__(self, window: int = 200):
+        self._samples: deque[float] = deque(maxlen=window)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
@@ -0,0 +1,51 @@
+import asyncio
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key into one in-flight task.
+
+    Later callers await the first caller's result instead of repeating the
+    work. The shared task is shielded, so a disconnecting caller does not
+    cancel it for everyone else.
+    """
+
+    def __init__(self):
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    def in_flight(self, key: Hashable) -> bool:
+        """Whether a call for ``key`` is currently running."""
+        return key in self._inflight
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run ``fn`` once per key at a time and share its result."""
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(fn())
+        self._inflight[key] = task
+        self.leaders += 1
+
+        def _forget(done: asyncio.Task) -> None:
+            if self._inflight.get(key) is done:
+                del self._inflight[key]
+
+        task.add_done_callback(_forget)
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._inflight),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
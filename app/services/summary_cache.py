@@ -0,0 +1,172 @@
+import json
+import math
+import time
+import uuid
+import random
+import asyncio
+import logging
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from app.config import get_settings
+from app.services.cache_service import CacheService
+from app.services.local_cache import LocalCache
+
+logger = logging.getLogger(__name__)
+
+# Pub/sub channel announcing "<worker id>:<post id>" whenever a summary changes
+SUMMARY_INVALIDATION_CHANNEL = "post_summary:invalidate"
+
+
+@dataclass
+class SummaryEntry:
+    """A cached summary with the metadata needed for stale-while-revalidate."""
+
+    summary: str
+    created_at: float  # unix time
+    ttl: float  # seconds the summary counts as fresh
+    compute_seconds: float = 0.0  # how long the model call took
+
+    @property
+    def fresh_until(self) -> float:
+        return self.created_at + self.ttl
+
+    @property
+    def stale(self) -> bool:
+        return time.time() >= self.fresh_until
+
+    def should_refresh(self, beta: float) -> bool:
+        """
+        XFetch early expiry: refresh with a probability that rises as expiry
+        nears, scaled by how long a recompute takes.
+        """
+        jitter = -self.compute_seconds * beta * math.log(1.0 - random.random())
+        return time.time() + jitter >= self.fresh_until
+
+    def encode(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def decode(cls, raw: str, ttl: float) -> "SummaryEntry":
+        """Parse a stored entry; bare strings from before entries had metadata count as fresh."""
+        if raw.startswith("{"):
+            try:
+                return cls(**json.loads(raw))
+            except (ValueError, TypeError):
+                pass
+        return cls(summary=raw, created_at=time.time(), ttl=ttl)
+
+
+class SummaryCache:
+    """
+    Two-tier cache of post summaries with stale-while-revalidate.
+
+    A small in-process LRU answers hot posts without a Redis round trip.
+    Its TTL is much shorter than the Redis one, and workers announce every
+    write over pub/sub so the others drop their local copy right away. The
+    local tier is cleared whenever the subscription is re-established,
+    since invalidations may have been missed in between.
+
+    Redis keeps an entry for ``summary_stale_ttl`` past its freshness, so a
+    stale summary can be served while it is recomputed in the background.
+    """
+
+    def __init__(self, cache_service: CacheService):
+        self.settings = get_settings()
+        self.cache = cache_service
+        self.worker_id = uuid.uuid4().hex
+        self._summaries: LocalCache[SummaryEntry] = LocalCache(
+            max_entries=self.settings.summary_cache_local_max_entries,
+            ttl=min(self.settings.summary_cache_local_ttl, self.settings.post_summary_ttl),
+        )
+        self._listener: Optional[asyncio.Task] = None
+        self._subscribed = asyncio.Event()
+        self.hits = {"local": 0, "redis": 0}
+        self.misses = 0
+        self.stale_hits = 0
+        self.invalidations = 0
+
+    async def start(self, timeout: float = 1.0) -> None:
+        """Start listening for invalidations, waiting briefly for the subscription."""
+        if self._listener is None:
+            self._listener = asyncio.create_task(
+                self.cache.listen(SUMMARY_INVALIDATION_CHANNEL, self._on_invalidation, self._on_subscribe)
+            )
+        try:
+            await asyncio.wait_for(self._subscribed.wait(), timeout)
+        except asyncio.TimeoutError:
+            # Redis is down; the local tier only lives for its short TTL meanwhile
+            logger.warning("Summary invalidation channel not subscribed yet")
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+
+    def _on_subscribe(self) -> None:
+        """(Re)subscribed: drop entries whose invalidations may have been missed."""
+        self._summaries.clear()
+        self._subscribed.set()
+
+    def _on_invalidation(self, message: str) -> None:
+        worker_id, _, post_id = message.partition(":")
+        if worker_id != self.worker_id:
+            self._summaries.delete(post_id)
+            self.invalidations += 1
+
+    def _decode(self, raw: str) -> SummaryEntry:
+        return SummaryEntry.decode(raw, self.settings.post_summary_ttl)
+
+    async def get(self, post_id: str) -> Optional[SummaryEntry]:
+        """Cached entry for a post, fresh or stale, local tier first."""
+        entry = self._summaries.get(post_id)
+        if entry is not None:
+            self.hits["local"] += 1
+        else:
+            raw = await self.cache.get_post_summary(post_id)
+            if not raw:
+                self.misses += 1
+                return None
+            entry = self._decode(raw)
+            self.hits["redis"] += 1
+            self._summaries.set(post_id, entry)
+        if entry.stale:
+            self.stale_hits += 1
+        return entry
+
+    async def wait(self, post_id: str, timeout: float) -> Optional[SummaryEntry]:
+        """Wait for a summary another worker is computing."""
+        raw = await self.cache.wait_for_post_summary(post_id, timeout=timeout)
+        return self._decode(raw) if raw else None
+
+    async def set(self, post_id: str, summary: str, compute_seconds: float = 0.0) -> SummaryEntry:
+        """Store a summary in both tiers and tell other workers to drop theirs."""
+        entry = SummaryEntry(
+            summary=summary,
+            created_at=time.time(),
+            ttl=self.settings.post_summary_ttl,
+            compute_seconds=compute_seconds,
+        )
+        self._summaries.set(post_id, entry)
+        await self.cache.set_post_summary(
+            post_id,
+            entry.encode(),
+            ttl=self.settings.post_summary_ttl + self.settings.summary_stale_ttl,
+        )
+        await self.cache.publish(SUMMARY_INVALIDATION_CHANNEL, f"{self.worker_id}:{post_id}")
+        return entry
+
+    def stats(self) -> dict:
+        """Per-tier hit counters and ratios."""
+        lookups = self.hits["local"] + self.hits["redis"] + self.misses
+        return {
+            "hits_local": self.hits["local"],
+            "hits_redis": self.hits["redis"],
+            "misses": self.misses,
+            "hit_ratio_local": round(self.hits["local"] / lookups, 4) if lookups else 0.0,
+            "hit_ratio_redis": round(self.hits["redis"] / lookups, 4) if lookups else 0.0,
+            "hit_ratio": round((lookups - self.misses) / lookups, 4) if lookups else 0.0,
+            "local_entries": len(self._summaries),
+            "stale_hits": self.stale_hits,
+            "invalidations": self.invalidations,
+        }
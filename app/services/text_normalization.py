@@ -0,0 +1,30 @@
+import re
+import unicodedata
+
+# Arabic letter variants folded to one form (after hamza/madda marks are dropped)
+ARABIC_FOLD = str.maketrans({"ى": "ي", "ة": "ه", "\u0640": None})  # U+0640 is tatweel
+# Emoji presentation selectors: "❤️" and "❤" should compare equal
+EMOJI_SELECTORS = str.maketrans({"\ufe0e": None, "\ufe0f": None})
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Fold a comment to a canonical form for matching.
+
+    Lowercases, strips Latin accents and Arabic diacritics (both are
+    combining marks after NFKD, which also turns أ/إ/آ into ا), removes
+    tatweel and emoji variation selectors, folds ى/ة, and collapses
+    whitespace.
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    if not text.isascii():
+        # ASCII has no combining marks, so most comments skip this per-character pass
+        text = "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+    text = text.translate(ARABIC_FOLD).translate(EMOJI_SELECTORS)
+    return WHITESPACE_RE.sub(" ", text).strip()
+
+
+def is_word_char(ch: str) -> bool:
+    """Letters, digits (arabizi) and apostrophes (l'avez, c'est) belong to words."""
+    return ch.isalnum() or ch in "'’"
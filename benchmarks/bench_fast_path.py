@@ -0,0 +1,47 @@
+"""
+Latency of answering a comment from the template banks instead of the model.
+
+    python -m benchmarks.bench_fast_path
+"""
+import asyncio
+import time
+
+from app.config import get_settings
+from app.models import Language, ProductContext, ReplyRequest, SellerContext
+from app.services.reply_generator import ReplyGenerator
+
+COMMENTS = [
+    ("Magnifique 😍", Language.FRENCH),
+    ("So beautiful", Language.ENGLISH),
+    ("روعة", Language.TUNISIAN),
+    ("C'est combien?", Language.FRENCH),
+    ("Dispo?", Language.FRENCH),
+    ("بشحال", Language.TUNISIAN),
+]
+
+
+async def main() -> None:
+    get_settings().reply_fast_path = "safe"
+    # Never called: every comment above is answered from a template
+    generator = ReplyGenerator(claude_service=None, cache_service=None)
+    context = SellerContext(
+        product_context=ProductContext(regular_price=89, sale_price=69.9, stock_status="low_stock"),
+    )
+    requests = [
+        ReplyRequest(post_id="1", post_summary="Robe", comment_text=text, language=language,
+                     cta_allowed=True, seller_context=context)
+        for text, language in COMMENTS
+    ]
+
+    repeat = 2000
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for request in requests:
+            response = await generator.generate(request)
+            assert response.fast_path
+    elapsed = time.perf_counter() - start
+    print(f"{'fast path generate':<22} {elapsed / (repeat * len(requests)) * 1e6:8.2f} us/reply")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
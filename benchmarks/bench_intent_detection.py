@@ -0,0 +1,60 @@
+"""
+Compare the Aho-Corasick intent matcher with the old per-keyword substring scan.
+
+    python -m benchmarks.bench_intent_detection
+"""
+import time
+from pathlib import Path
+
+from app.models import CommentIntent
+from app.services.reply_generator import INTENT_KEYWORDS, INTENT_MATCHER
+
+CORPUS = Path(__file__).parent.parent / "tests" / "data" / "intent_corpus.tsv"
+
+
+def legacy_detect_intents(comment_text: str) -> list[CommentIntent]:
+    """The previous implementation: one substring scan per keyword."""
+    comment_lower = comment_text.lower()
+    detected = []
+    for intent, keywords in INTENT_KEYWORDS.items():
+        if any(keyword in comment_lower for keyword in keywords):
+            detected.append(intent)
+    return detected if detected else [CommentIntent.GENERAL]
+
+
+def automaton_detect_intents(comment_text: str) -> list[CommentIntent]:
+    detected = INTENT_MATCHER.match(comment_text)
+    return detected if detected else [CommentIntent.GENERAL]
+
+
+def load_corpus() -> list[tuple[str, list[str]]]:
+    rows = []
+    for line in CORPUS.read_text(encoding="utf-8").splitlines():
+        if line.strip() and not line.startswith("#"):
+            comment, expected = line.split("\t")
+            rows.append((comment, expected.split(",")))
+    return rows
+
+
+def bench(name: str, fn, rows: list, repeat: int = 500) -> None:
+    comments = [comment for comment, _ in rows]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for comment in comments:
+            fn(comment)
+    elapsed = time.perf_counter() - start
+    correct = sum(1 for comment, expected in rows if [i.value for i in fn(comment)] == expected)
+    print(
+        f"{name:<10} {elapsed / (repeat * len(comments)) * 1e6:7.2f} us/comment  "
+        f"corpus agreement {correct}/{len(rows)}"
+    )
+
+
+def main() -> None:
+    rows = load_corpus()
+    bench("legacy", legacy_detect_intents, rows)
+    bench("automaton", automaton_detect_intents, rows)
+
+
+if __name__ == "__main__":
+    main()
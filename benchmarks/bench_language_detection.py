@@ -0,0 +1,77 @@
+"""
+Compare the local language detector with the LLM detection path.
+
+    python -m benchmarks.bench_language_detection          # local only
+    python -m benchmarks.bench_language_detection --llm    # also call OpenRouter
+
+The LLM run needs ANTHROPIC_API_KEY (an OpenRouter key) and makes one
+request per evaluation comment.
+"""
+import sys
+import time
+import asyncio
+from pathlib import Path
+
+from app.config import get_settings
+from app.models import Language
+from app.services.claude_service import ClaudeService
+from app.services.language_detector import LanguageDetector
+
+EVAL_SET = Path(__file__).parent.parent / "tests" / "data" / "language_eval.tsv"
+
+
+def load_eval_set() -> list[tuple[Language, str]]:
+    rows = []
+    for line in EVAL_SET.read_text(encoding="utf-8").splitlines():
+        if line.strip() and not line.startswith("#"):
+            label, text = line.split("\t", 1)
+            rows.append((Language(label), text))
+    return rows
+
+
+def report(name: str, rows: list, predictions: list, seconds: float, calls: int) -> None:
+    correct = sum(1 for (label, _), predicted in zip(rows, predictions) if predicted == label)
+    print(
+        f"{name:<16} accuracy={correct / len(rows):.3f} ({correct}/{len(rows)})  "
+        f"latency={seconds / calls * 1e6:,.1f} us/comment"
+    )
+
+
+def bench_local(rows: list, repeat: int = 200) -> None:
+    detector = LanguageDetector()
+    texts = [text for _, text in rows]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            detector.detect(text)
+    elapsed = time.perf_counter() - start
+    report("local", rows, [detector.detect(t)[0] for t in texts], elapsed, repeat * len(texts))
+
+    threshold = get_settings().language_detection_min_confidence
+    unsure = sum(1 for t in texts if detector.detect(t)[1] < threshold)
+    print(f"{'':<16} below threshold {threshold}: {unsure}/{len(texts)} would fall back to the LLM")
+
+
+async def bench_llm(rows: list) -> None:
+    service = ClaudeService()
+    predictions = []
+    start = time.perf_counter()
+    for _, text in rows:
+        predictions.append(await service.detect_language_llm(text))
+    elapsed = time.perf_counter() - start
+    await service.disconnect()
+    report("llm", rows, predictions, elapsed, len(rows))
+
+
+def main() -> None:
+    rows = load_eval_set()
+    bench_local(rows)
+    if "--llm" in sys.argv:
+        if not get_settings().anthropic_api_key:
+            print("llm              skipped: ANTHROPIC_API_KEY not set")
+        else:
+            asyncio.run(bench_llm(rows))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Cost of scoring a candidate reply against an account's recent-reply window.
+
+    python -m benchmarks.bench_near_duplicates
+"""
+import time
+
+from app.services.reply_similarity import NearDuplicateChecker, decode_signature, encode_signature, signature
+from benchmarks.bench_reply_validator import SAMPLES
+
+WINDOW = 50
+
+# Replies that repeat nothing in the window, the common case
+FRESH = [
+    "Avec plaisir, on t'attend en DM pour ta taille!",
+    "Elle existe aussi en beige et en bordeaux.",
+    "Livraison en 48h partout en Tunisie.",
+    "Thank you, the restock lands next Monday!",
+    "مرحبا بيك، ابعثلنا ميساج",
+]
+
+
+def main() -> None:
+    history = [f"{SAMPLES[i % len(SAMPLES)]} ({i})" for i in range(WINDOW)]
+    stored = [encode_signature(signature(reply)) for reply in history]
+    checker = NearDuplicateChecker(threshold=0.6)
+    print(f"signature size: {len(stored[0])} chars")
+
+    repeat = 500
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for reply in SAMPLES:
+            signature(reply)
+    elapsed = time.perf_counter() - start
+    print(f"{'signature':<22} {elapsed / (repeat * len(SAMPLES)) * 1e6:8.2f} us/reply")
+
+    decode_signature.cache_clear()
+    start = time.perf_counter()
+    decoded = [decode_signature(sig) for sig in stored]
+    print(f"{f'decode {WINDOW} (cold)':<22} {(time.perf_counter() - start) * 1e6:8.2f} us/fetch")
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        [decode_signature(sig) for sig in stored]
+    elapsed = time.perf_counter() - start
+    print(f"{f'decode {WINDOW} (warm)':<22} {elapsed / repeat * 1e6:8.2f} us/fetch")
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for reply in SAMPLES:
+            checker.max_similarity(reply, decoded)
+    elapsed = time.perf_counter() - start
+    print(f"{f'score vs {WINDOW} recent':<22} {elapsed / (repeat * len(SAMPLES)) * 1e6:8.2f} us/reply")
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for reply in FRESH:
+            checker.is_duplicate(reply, decoded)
+    elapsed = time.perf_counter() - start
+    print(f"{'check a fresh reply':<22} {elapsed / (repeat * len(FRESH)) * 1e6:8.2f} us/reply")
+
+
+if __name__ == "__main__":
+    main()
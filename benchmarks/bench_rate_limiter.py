@@ -0,0 +1,45 @@
+"""
+Per-request overhead of the API key rate limiter.
+
+    python -m benchmarks.bench_rate_limiter
+
+Uses the Redis at REDIS_URL when reachable (one EVALSHA round trip per
+request), otherwise an in-memory fake; the in-process fallback is always
+measured.
+"""
+import asyncio
+import time
+
+import fakeredis
+
+from app.services.api_keys import ApiKeyInfo, api_key_digest
+from app.services.cache_service import CacheService
+from app.services.rate_limiter import RateLimiter
+
+REQUESTS = 5000
+
+
+async def bench(name: str, limiter: RateLimiter) -> None:
+    keys = [ApiKeyInfo(digest=api_key_digest(f"key-{i}"), tenant_id=f"t{i}") for i in range(100)]
+    start = time.perf_counter()
+    for i in range(REQUESTS):
+        await limiter.check(keys[i % len(keys)])
+    elapsed = time.perf_counter() - start
+    print(f"{name:<22} {elapsed / REQUESTS * 1e6:8.1f} us/request")
+
+
+async def main() -> None:
+    cache = CacheService()
+    await cache.connect()
+    if cache.is_connected:
+        await bench("redis", RateLimiter(cache))
+        await cache.disconnect()
+    else:
+        cache._client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        await bench("fakeredis (no network)", RateLimiter(cache))
+
+    await bench("in-process fallback", RateLimiter(None))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
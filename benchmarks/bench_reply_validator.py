@@ -0,0 +1,61 @@
+"""
+Compare the compiled single-pass validator with the old rule-by-rule checks.
+
+    python -m benchmarks.bench_reply_validator
+"""
+import re
+import time
+from typing import Optional
+
+from app.services.reply_generator import FORBIDDEN_PATTERNS, REPLY_VALIDATOR
+
+SAMPLES = [
+    "Merci beaucoup! Ecris-nous en DM.",
+    "C'est 49 DT. N'hesite pas!",
+    "Oui on l'a en noir!",
+    "Check out https://example.com for more info",
+    "Great product! #sale #discount",
+    "As an AI, I can help you. Really. Truly.",
+    "يعيشك، السوم 45 دينار والتوصيل مجاني 😍",
+    "Bonjour! Oui c'est disponible en taille M et L. On livre partout en Tunisie en 48h. Écris-nous en DM!",
+    "x" * 320,
+    "Thanks so much, glad you love it! Send us a DM and we'll sort out your size.",
+]
+
+
+def legacy_validate_reply(reply: str) -> tuple[bool, Optional[str]]:
+    """The previous implementation: one uncompiled search per rule."""
+    for pattern in FORBIDDEN_PATTERNS:
+        if re.search(pattern, reply):
+            return False, "Contains AI/automation reference"
+    sentences = [s.strip() for s in re.split(r'[.!?]', reply) if s.strip()]
+    if len(sentences) > 2:
+        return False, "Too many sentences"
+    if "http" in reply.lower() or "www." in reply.lower():
+        return False, "Contains link"
+    if "#" in reply:
+        return False, "Contains hashtag"
+    if len(reply) > 300:
+        return False, "Exceeds character limit"
+    return True, None
+
+
+def bench(name: str, fn, repeat: int = 20000) -> None:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for reply in SAMPLES:
+            fn(reply)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<22} {elapsed / (repeat * len(SAMPLES)) * 1e6:6.2f} us/reply")
+
+
+def main() -> None:
+    mismatches = [r for r in SAMPLES if legacy_validate_reply(r) != REPLY_VALIDATOR.validate(r)]
+    print(f"first-error agreement: {len(SAMPLES) - len(mismatches)}/{len(SAMPLES)}")
+    bench("legacy", legacy_validate_reply)
+    bench("compiled (first)", REPLY_VALIDATOR.validate)
+    bench("compiled (all rules)", REPLY_VALIDATOR.check)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# Tests for the API key registry
+import json
+
+import fakeredis
+import pytest
+
+from app.services.api_keys import ApiKeyRegistry, api_key_digest
+from app.services.cache_service import CacheService
+
+
+@pytest.fixture
+def registry(monkeypatch, tmp_path):
+    keys_file = tmp_path / "keys.json"
+    keys_file.write_text(json.dumps([
+        {"key": "file-key", "tenant_id": "acme", "rate_limit": 600, "model_tier": "premium"},
+        {"key_sha256": api_key_digest("hashed-key"), "tenant_id": "globex"},
+        {"key": "ops-key", "tenant_id": "ops", "admin": True},
+    ]))
+    registry = ApiKeyRegistry()
+    monkeypatch.setattr(registry.settings, "api_keys", " env-key , ")
+    monkeypatch.setattr(registry.settings, "api_keys_file", str(keys_file))
+    monkeypatch.setattr(registry.settings, "api_keys_redis_hash", "api_keys")
+    registry.load()
+    return registry
+
+
+class TestApiKeyRegistry:
+    """Tests for key parsing, lookup and reload."""
+
+    def test_authenticates_keys_from_every_source(self, registry):
+        assert registry.authenticate("env-key").tenant_id.startswith("key-")
+        acme = registry.authenticate("file-key")
+        assert (acme.tenant_id, acme.rate_limit, acme.model_tier) == ("acme", 600, "premium")
+        assert registry.authenticate("hashed-key").tenant_id == "globex"
+        assert registry.authenticate("wrong") is None
+        assert not registry.dev_mode
+
+    def test_table_holds_no_plain_keys(self, registry):
+        assert "file-key" not in repr(registry._keys)
+
+    @pytest.mark.asyncio
+    async def test_reload_adds_redis_keys_and_survives_errors(self, registry, monkeypatch):
+        cache = CacheService()
+        cache._client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        await cache._client.hset(
+            "api_keys", api_key_digest("redis-key"), json.dumps({"tenant_id": "initech", "burst": 5})
+        )
+
+        await registry.reload(cache)
+        assert registry.authenticate("redis-key").burst == 5
+
+        # A broken keys file leaves the current table in place
+        monkeypatch.setattr(registry.settings, "api_keys_file", "/nonexistent.json")
+        await registry.reload(cache)
+        assert registry.authenticate("redis-key") is not None
+        assert registry.stats()["reload_errors"] == 1
+
+    def test_dev_mode_without_keys(self, monkeypatch):
+        registry = ApiKeyRegistry()
+        monkeypatch.setattr(registry.settings, "api_keys", "")
+        monkeypatch.setattr(registry.settings, "api_keys_file", None)
+        monkeypatch.setattr(registry.settings, "api_keys_redis_hash", "")
+        assert registry.dev_mode
+
+    @pytest.mark.asyncio
+    async def test_redis_source_never_falls_back_to_dev_mode(self, monkeypatch):
+        """Redis down at boot, or the last key revoked, rejects instead of opening the API."""
+        registry = ApiKeyRegistry()
+        monkeypatch.setattr(registry.settings, "api_keys", "")
+        monkeypatch.setattr(registry.settings, "api_keys_file", None)
+        monkeypatch.setattr(registry.settings, "api_keys_redis_hash", "api_keys")
+
+        down = CacheService()
+        registry.load()
+        await registry.reload(down)
+        assert not registry.dev_mode
+        assert registry.authenticate("anything") is None
+
+        cache = CacheService()
+        cache._client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        await cache._client.hset("api_keys", api_key_digest("redis-key"), json.dumps({"tenant_id": "initech"}))
+        await registry.reload(cache)
+        assert registry.authenticate("redis-key") is not None
+
+        await cache._client.hdel("api_keys", api_key_digest("redis-key"))
+        await registry.reload(cache)
+        assert not registry.dev_mode
+        assert registry.authenticate("redis-key") is None
+
+
+class TestMetricsEndpoint:
+    """Cross-tenant metrics are only served to admin keys."""
+
+    def test_requires_admin_key(self, registry, monkeypatch):
+        from fastapi.testclient import TestClient
+        import app.main as main
+
+        monkeypatch.setattr(main, "get_api_key_registry", lambda: registry)
+        client = TestClient(main.app)
+
+        assert client.get("/api/v1/metrics", headers={"X-API-Key": "file-key"}).status_code == 403
+        response = client.get("/api/v1/metrics", headers={"X-API-Key": "ops-key"})
+        assert response.status_code == 200
+        assert "api_keys" in response.json()["metrics"]
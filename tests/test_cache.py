@@ -0,0 +1,320 @@
+# Tests for in-process and Redis-backed caches
+import asyncio
+import time
+
+import fakeredis
+import pytest
+
+from app.config import Settings
+from app.services.cache_service import CacheService
+from app.services.local_cache import LocalCache
+from app.services.single_flight import SingleFlight
+from app.services.summary_cache import SummaryCache
+
+
+class TestLocalCache:
+    """Tests for the bounded in-process LRU."""
+
+    def test_evicts_least_recently_used_by_bytes(self):
+        """Oldest untouched entries go first once the byte budget is exceeded."""
+        cache = LocalCache(max_bytes=10, sizeof=len)
+        cache.set("a", "aaaa")
+        cache.set("b", "bbbb")
+        cache.get("a")
+        cache.set("c", "cccc")
+
+        assert cache.get("b") is None
+        assert cache.get("a") == "aaaa"
+        assert cache.get("c") == "cccc"
+        assert cache.total_bytes == 8
+
+    def test_rejects_entries_larger_than_budget(self):
+        """A single oversized value is not stored."""
+        cache = LocalCache(max_bytes=3, sizeof=len)
+        assert not cache.set("a", "toolong")
+        assert len(cache) == 0
+
+    def test_entries_expire(self):
+        """Entries past their TTL are treated as missing."""
+        cache = LocalCache(max_entries=5, ttl=0.01)
+        cache.set("a", 1)
+        time.sleep(0.02)
+        assert cache.get("a") is None
+        assert len(cache) == 0
+
+
+class TestSingleFlight:
+    """Tests for in-process request coalescing."""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_callers_share_one_call(self):
+        """Callers for the same key await one execution."""
+        flight = SingleFlight()
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "summary"
+
+        results = await asyncio.gather(*(flight.do("post-1", work) for _ in range(20)))
+
+        assert results == ["summary"] * 20
+        assert calls == 1
+        assert flight.stats()["coalesced"] == 19
+        assert len(flight) == 0
+
+    @pytest.mark.asyncio
+    async def test_errors_propagate_and_key_is_released(self):
+        """A failure reaches every waiter and the next call runs again."""
+        flight = SingleFlight()
+
+        async def boom():
+            await asyncio.sleep(0.001)
+            raise RuntimeError("upstream down")
+
+        results = await asyncio.gather(
+            flight.do("k", boom), flight.do("k", boom), return_exceptions=True
+        )
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+        async def ok():
+            return 1
+
+        assert await flight.do("k", ok) == 1
+
+
+class TestCacheServiceLocks:
+    """Tests for lease helpers when Redis is unavailable."""
+
+    @pytest.mark.asyncio
+    async def test_lock_granted_without_redis(self):
+        """With no Redis, every worker may proceed on its own."""
+        cache = CacheService()
+        token = await cache.acquire_lock("post_summary:1", 1000)
+        assert token
+        await cache.release_lock("post_summary:1", token)
+        assert await cache.wait_for_post_summary("1", timeout=0.05) is None
+
+    def test_lease_outlives_summary_deadline(self):
+        """A slow summary keeps its lease, and waiters outwait it, until the deadline fires."""
+        settings = Settings(summary_deadline_seconds=60.0, summary_lock_margin_seconds=5.0)
+        assert settings.summary_lock_ttl_ms == 65000
+        assert settings.summary_lock_wait_seconds == 65.0
+
+
+@pytest.fixture
+def redis_cache():
+    """CacheService backed by an in-memory fake Redis."""
+    cache = CacheService()
+    cache._client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    return cache
+
+
+class TestRecentReplies:
+    """Tests for the list-backed recent replies store."""
+
+    @pytest.mark.asyncio
+    async def test_replies_are_capped_and_chronological(self, redis_cache, monkeypatch):
+        monkeypatch.setattr(redis_cache.settings, "recent_replies_max", 3)
+        for i in range(5):
+            await redis_cache.add_recent_reply("acct", f"r{i}")
+
+        assert await redis_cache.get_recent_replies("acct") == ["r2", "r3", "r4"]
+        assert await redis_cache.get_recent_replies("acct", limit=2) == ["r3", "r4"]
+        assert await redis_cache._client.ttl("recent_replies_list:acct") > 0
+
+    @pytest.mark.asyncio
+    async def test_batch_write_across_accounts(self, redis_cache):
+        await redis_cache.add_recent_replies([("a", "a1"), ("b", "b1"), ("a", "a2")])
+
+        assert await redis_cache.get_recent_replies("a") == ["a1", "a2"]
+        assert await redis_cache.get_recent_replies("b") == ["b1"]
+
+    @pytest.mark.asyncio
+    async def test_concurrent_writers_do_not_lose_updates(self, redis_cache):
+        await asyncio.gather(*(redis_cache.add_recent_reply("acct", f"r{i}") for i in range(20)))
+        assert len(await redis_cache.get_recent_replies("acct")) == 20
+
+
+class FlakyRedis:
+    """Stands in for a Redis client whose GETs fail or hang."""
+
+    def __init__(self, hang: bool = False):
+        self.hang = hang
+        self.calls = 0
+
+    async def get(self, key):
+        self.calls += 1
+        if self.hang:
+            await asyncio.sleep(1)
+        raise ConnectionError("redis down")
+
+    async def ping(self):
+        raise ConnectionError("redis down")
+
+    async def close(self):
+        pass
+
+
+class TestCacheServiceResilience:
+    """Tests for reconnection, per-operation timeouts and the Redis breaker."""
+
+    @pytest.mark.asyncio
+    async def test_reconnects_in_background(self, monkeypatch):
+        cache = CacheService()
+        monkeypatch.setattr(cache.reconnect_policy, "base_delay", 0.001)
+        monkeypatch.setattr(cache.reconnect_policy, "max_delay", 0.001)
+        clients = [FlakyRedis(), FlakyRedis(), fakeredis.FakeAsyncRedis(decode_responses=True)]
+        monkeypatch.setattr(cache, "_new_client", lambda: clients.pop(0))
+
+        await cache.connect()
+        assert (await cache.health_check())["redis"] == "reconnecting"
+
+        for _ in range(100):
+            if cache.is_connected:
+                break
+            await asyncio.sleep(0.01)
+        assert (await cache.health_check())["redis"] == "healthy"
+        assert cache.reconnect_attempts == 2
+        await cache.set_post_summary("1", "summary")
+        assert await cache.get_post_summary("1") == "summary"
+
+    @pytest.mark.asyncio
+    async def test_breaker_skips_redis_after_repeated_errors(self, monkeypatch):
+        cache = CacheService()
+        cache._client = flaky = FlakyRedis()
+        monkeypatch.setattr(cache.breaker, "failure_threshold", 3)
+
+        for _ in range(10):
+            assert await cache.get_post_summary("1") is None
+
+        assert flaky.calls == 3
+        health = await cache.health_check()
+        assert health["redis_circuit"] == "open"
+        assert health["redis_skipped_ops"] == 7
+
+    @pytest.mark.asyncio
+    async def test_image_errors_leave_the_shared_breaker_closed(self, monkeypatch):
+        cache = CacheService()
+        cache._client = FlakyRedis()
+        monkeypatch.setattr(cache.bulk_breaker, "failure_threshold", 3)
+
+        for _ in range(5):
+            assert await cache.get_image_by_url("k") is None
+
+        health = await cache.health_check()
+        assert health["redis_bulk_circuit"] == "open"
+        assert health["redis_circuit"] == "closed"
+
+    @pytest.mark.asyncio
+    async def test_slow_operations_hit_the_time_budget(self, monkeypatch):
+        cache = CacheService()
+        cache._client = FlakyRedis(hang=True)
+        monkeypatch.setattr(cache.settings, "redis_op_timeout", 0.01)
+
+        started = time.monotonic()
+        assert await cache.get_post_summary("1") is None
+        assert time.monotonic() - started < 0.5
+
+
+class TestSummaryCache:
+    """Tests for the two-tier post-summary cache."""
+
+    @staticmethod
+    def worker(server) -> SummaryCache:
+        cache = CacheService()
+        cache._client = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+        return SummaryCache(cache)
+
+    @pytest.mark.asyncio
+    async def test_local_tier_serves_hot_posts(self):
+        summaries = self.worker(fakeredis.FakeServer())
+        await summaries.set("1", "Robe rouge")
+        other = SummaryCache(summaries.cache)
+
+        assert (await other.get("1")).summary == "Robe rouge"
+        assert (await other.get("1")).summary == "Robe rouge"
+        assert await other.get("2") is None
+        stats = other.stats()
+        assert (stats["hits_redis"], stats["hits_local"], stats["misses"]) == (1, 1, 1)
+        assert stats["hit_ratio_local"] == round(1 / 3, 4)
+
+    @pytest.mark.asyncio
+    async def test_writes_invalidate_other_workers(self):
+        server = fakeredis.FakeServer()
+        a, b = self.worker(server), self.worker(server)
+        await a.start()
+        await b.start()
+        try:
+            await a.set("1", "v1")
+            assert (await b.get("1")).summary == "v1"
+
+            seen = b.invalidations
+            await a.set("1", "v2")
+            for _ in range(100):
+                if b.invalidations > seen:
+                    break
+                await asyncio.sleep(0.01)
+            assert (await b.get("1")).summary == "v2"
+            # A worker ignores its own announcements
+            assert a.invalidations == 0
+        finally:
+            await a.stop()
+            await b.stop()
+
+
+class TestStaleWhileRevalidate:
+    """Tests for serving stale summaries and refreshing ahead of expiry."""
+
+    def test_xfetch_refreshes_only_near_expiry(self):
+        from app.services.summary_cache import SummaryEntry
+
+        now = time.time()
+        fresh = SummaryEntry("s", created_at=now, ttl=3600, compute_seconds=5)
+        expiring = SummaryEntry("s", created_at=now - 3599, ttl=3600, compute_seconds=30)
+        expired = SummaryEntry("s", created_at=now - 7200, ttl=3600)
+
+        assert not any(fresh.should_refresh(beta=1.0) for _ in range(100))
+        assert sum(expiring.should_refresh(beta=1.0) for _ in range(100)) > 90
+        assert expired.stale and expired.should_refresh(beta=1.0)
+
+    def test_legacy_plain_summary_decodes_as_fresh(self):
+        from app.services.summary_cache import SummaryEntry
+
+        entry = SummaryEntry.decode("Robe rouge", ttl=60)
+        assert entry.summary == "Robe rouge" and not entry.stale
+
+    @pytest.mark.asyncio
+    async def test_stale_summary_served_then_refreshed(self, monkeypatch):
+        import app.main as main
+        from app.models import SummarizeRequest
+        from app.services.summary_cache import SummaryEntry
+
+        cache = CacheService()
+        cache._client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        summaries = SummaryCache(cache)
+        old = SummaryEntry("old summary", created_at=time.time() - 100, ttl=10)
+        await cache.set_post_summary("1", old.encode(), ttl=1000)
+
+        class MockClaudeService:
+            calls = 0
+
+            async def summarize_post(self, caption, image_urls, deadline=None):
+                self.calls += 1
+                return "new summary"
+
+        claude = MockClaudeService()
+        monkeypatch.setattr(main, "cache_service", cache)
+        monkeypatch.setattr(main, "summary_cache", summaries)
+        monkeypatch.setattr(main, "claude_service", claude)
+        request = SummarizeRequest(post_id="1", caption="Robe", image_urls=[])
+
+        response = await main.summarize_post(request, client=None)
+        assert (response.summary, response.cached, response.stale) == ("old summary", True, True)
+
+        await asyncio.gather(*main._background_refreshes)
+        response = await main.summarize_post(request, client=None)
+        assert (response.summary, response.stale) == ("new summary", False)
+        assert claude.calls == 1
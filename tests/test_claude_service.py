@@ -0,0 +1,206 @@
+# Tests for ClaudeService HTTP handling
+import asyncio
+import base64
+import io
+
+import httpx
+import pytest
+from PIL import Image
+
+from app.services.claude_service import ClaudeService
+from app.services.image_cache import CachedImage
+from app.services.image_processor import ImageProcessor
+
+
+def make_service(handler) -> ClaudeService:
+    """Build a ClaudeService whose shared client uses a mock transport."""
+    service = ClaudeService()
+    service._http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return service
+
+
+class TestSharedHttpClient:
+    """Tests for the pooled HTTP client lifecycle."""
+
+    @pytest.mark.asyncio
+    async def test_connect_and_disconnect(self):
+        """The shared client is opened once and closed on shutdown."""
+        service = ClaudeService()
+        await service.connect()
+        client = service.http_client
+        await service.connect()
+        assert service.http_client is client
+        await service.disconnect()
+        assert client.is_closed
+        assert service._http is None
+
+    @pytest.mark.asyncio
+    async def test_fetch_image_reuses_shared_client(self):
+        """Image downloads go through the shared client."""
+        calls = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(str(request.url))
+            return httpx.Response(200, content=b"img", headers={"content-type": "image/png"})
+
+        service = make_service(handler)
+        client = service.http_client
+        image_data, media_type = await service.fetch_image_as_base64("https://cdn.example.com/a.png")
+        await service.fetch_image_as_base64("https://cdn.example.com/b.png")
+
+        assert service.http_client is client
+        assert media_type == "image/png"
+        assert base64.b64decode(image_data) == b"img"
+        assert len(calls) == 2
+        await service.disconnect()
+
+
+class TestConcurrentImageFetch:
+    """Tests for concurrent image fetching."""
+
+    @pytest.mark.asyncio
+    async def test_keeps_order_and_skips_failures(self):
+        """Images come back in input order; failed downloads are dropped."""
+        def handler(request: httpx.Request) -> httpx.Response:
+            if request.url.path == "/broken.jpg":
+                return httpx.Response(404)
+            return httpx.Response(200, content=request.url.path.encode(), headers={"content-type": "image/jpeg"})
+
+        service = make_service(handler)
+        urls = [
+            "https://cdn.example.com/1.jpg",
+            "https://cdn.example.com/broken.jpg",
+            "https://cdn.example.com/2.jpg",
+        ]
+        parts = await service._fetch_image_parts(urls)
+
+        decoded = [
+            base64.b64decode(part["image_url"]["url"].split(",", 1)[1]) for part in parts
+        ]
+        assert decoded == [b"/1.jpg", b"/2.jpg"]
+        await service.disconnect()
+
+    @pytest.mark.asyncio
+    async def test_respects_per_request_limit(self, monkeypatch):
+        """No more than the per-request cap of downloads run at once."""
+        service = ClaudeService()
+        monkeypatch.setattr(service.settings, "image_fetch_concurrency_per_request", 2)
+        in_flight = 0
+        peak = 0
+
+        async def fake_fetch(url):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return CachedImage(data_uri="data:image/jpeg;base64,aW1n", media_type="image/jpeg", content_hash=url)
+
+        monkeypatch.setattr(service, "fetch_image", fake_fetch)
+        parts = await service._fetch_image_parts([f"https://cdn.example.com/{i}.jpg" for i in range(6)])
+
+        assert len(parts) == 6
+        assert peak == 2
+
+
+class TestImageCache:
+    """Tests for image caching in the fetch path."""
+
+    @pytest.mark.asyncio
+    async def test_same_url_downloaded_once(self):
+        """Repeated fetches of one URL hit the local tier."""
+        calls = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            calls.append(str(request.url))
+            return httpx.Response(200, content=b"jpeg-bytes", headers={"content-type": "image/jpeg"})
+
+        service = make_service(handler)
+        first = await service.fetch_image("https://cdn.example.com/post.jpg")
+        second = await service.fetch_image("https://cdn.example.com/post.jpg")
+
+        assert first == second
+        assert len(calls) == 1
+        assert service.image_cache.stats()["hits_local"] == 1
+        await service.disconnect()
+
+    @pytest.mark.asyncio
+    async def test_same_content_shared_across_urls(self):
+        """Different URLs with identical bytes share one encoded entry."""
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, content=b"same", headers={"content-type": "image/jpeg"})
+
+        service = make_service(handler)
+        first = await service.fetch_image("https://cdn.example.com/a.jpg?sig=1")
+        second = await service.fetch_image("https://cdn.example.com/a.jpg?sig=2")
+
+        assert first is second
+        assert service.image_cache.stats()["local_entries"] == 1
+        await service.disconnect()
+
+    @pytest.mark.asyncio
+    async def test_profile_change_misses_url_entries(self):
+        """A rendition made under other output settings is not served for the same URL."""
+        import fakeredis
+        from app.services.cache_service import CacheService
+        from app.services.image_cache import CachedImage, ImageCache
+
+        cache = CacheService()
+        cache._client = fakeredis.FakeAsyncRedis(decode_responses=True)
+        url = "https://cdn.example.com/post.jpg"
+        image = CachedImage(data_uri="data:image/jpeg;base64,AAAA", media_type="image/jpeg", content_hash="h:jpeg-1024-q80")
+        await ImageCache(cache, profile="jpeg-1024-q80").put(url, image)
+
+        assert await ImageCache(cache, profile="jpeg-1024-q80").get(url) == image
+        assert await ImageCache(cache, profile="jpeg-768-q70").get(url) is None
+
+
+class TestImageProcessor:
+    """Tests for image downscaling before the vision call."""
+
+    def _jpeg(self, size: tuple[int, int]) -> bytes:
+        img = Image.new("RGB", size, (200, 30, 30))
+        exif = Image.Exif()
+        exif[0x010F] = "CameraMaker"
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=95, exif=exif)
+        return out.getvalue()
+
+    def test_downscales_and_strips_metadata(self):
+        """Large images are shrunk to max_edge and lose their EXIF block."""
+        processor = ImageProcessor()
+        data, media_type = processor.process_sync(self._jpeg((2160, 2700)), "image/jpeg")
+
+        with Image.open(io.BytesIO(data)) as img:
+            assert max(img.size) == processor.max_edge
+            assert not img.getexif()
+        assert media_type == "image/jpeg"
+
+    def test_undecodable_bytes_pass_through(self):
+        """Anything Pillow cannot read is sent unchanged."""
+        processor = ImageProcessor()
+        assert processor.process_sync(b"not an image", "image/png") == (b"not an image", "image/png")
+
+    @pytest.mark.asyncio
+    async def test_processed_result_is_cached(self, monkeypatch):
+        """Processing runs once per image, not once per comment."""
+        source = self._jpeg((2000, 2000))
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(200, content=source, headers={"content-type": "image/jpeg"})
+
+        service = make_service(handler)
+        runs = 0
+        original = service.image_processor.process_sync
+
+        def counting(data, media_type):
+            nonlocal runs
+            runs += 1
+            return original(data, media_type)
+
+        monkeypatch.setattr(service.image_processor, "process_sync", counting)
+        await service.fetch_image("https://cdn.example.com/a.jpg")
+        await service.fetch_image("https://cdn.example.com/b.jpg")
+
+        assert runs == 1
+        await service.disconnect()
@@ -0,0 +1,117 @@
+# Tests for the local language detector
+from pathlib import Path
+
+import pytest
+
+from app.models import Language
+from app.services.claude_service import ClaudeService
+from app.services.language_detector import LanguageDetector
+
+EVAL_SET = Path(__file__).parent / "data" / "language_eval.tsv"
+
+
+def load_eval_set() -> list[tuple[Language, str]]:
+    """Labelled comments held out from the detector's training phrases."""
+    rows = []
+    for line in EVAL_SET.read_text(encoding="utf-8").splitlines():
+        if line.strip() and not line.startswith("#"):
+            label, text = line.split("\t", 1)
+            rows.append((Language(label), text))
+    return rows
+
+
+class TestLanguageDetector:
+    """Tests for script, arabizi and code-switching handling."""
+
+    def setup_method(self):
+        self.detector = LanguageDetector()
+
+    def test_eval_set_accuracy(self):
+        """The detector stays accurate on the labelled evaluation set."""
+        rows = load_eval_set()
+        correct = sum(1 for label, text in rows if self.detector.detect(text)[0] == label)
+        assert correct / len(rows) >= 0.95
+
+    def test_arabizi_is_tunisian(self):
+        """Latin text with 3/7/9 digits is read as Darija."""
+        for text in ["3andkom el 7aja hedhi?", "9adech", "n7eb nchouf"]:
+            assert self.detector.detect(text)[0] == Language.TUNISIAN, text
+
+    def test_french_darija_code_switching(self):
+        """French sentences carrying Darija markers are Tunisian."""
+        assert self.detector.detect("Bonjour, famma taille M svp?")[0] == Language.TUNISIAN
+
+    def test_script_decides_arabic_candidates(self):
+        """Arabic-script text never comes back as French or English."""
+        language, _ = self.detector.detect("هل هذا متوفر؟")
+        assert language in (Language.ARABIC, Language.TUNISIAN)
+
+    def test_emoji_only_has_no_confidence(self):
+        """With no letters at all the detector defers to the fallback."""
+        assert self.detector.detect("🔥🔥🔥")[1] == 0.0
+
+
+class TestDetectLanguageFallback:
+    """Tests for the LLM fallback below the confidence threshold."""
+
+    @pytest.mark.asyncio
+    async def test_confident_result_skips_model(self, monkeypatch):
+        """Clear comments are answered without a network call."""
+        service = ClaudeService()
+
+        async def fail(*args, **kwargs):
+            raise AssertionError("model should not be called")
+
+        monkeypatch.setattr(service, "detect_language_llm", fail)
+        assert await service.detect_language("9adech soum?") == Language.TUNISIAN
+
+    @pytest.mark.asyncio
+    async def test_unsure_result_asks_model(self, monkeypatch):
+        """Low-confidence comments fall back to the model."""
+        service = ClaudeService()
+
+        async def llm(comment_text, deadline=None):
+            return Language.ENGLISH
+
+        monkeypatch.setattr(service, "detect_language_llm", llm)
+        assert await service.detect_language("😍😍") == Language.ENGLISH
+
+
+class TestReplyLanguage:
+    """Endpoints detect the reply language when the client omits it."""
+
+    def test_missing_language_is_detected(self, monkeypatch):
+        from fastapi.testclient import TestClient
+        import app.main as main
+        from app.config import get_settings
+        from app.services.api_keys import ApiKeyRegistry
+
+        class RecordingGenerator:
+            def __init__(self):
+                self.languages = []
+
+            async def generate(self, request, deadline=None, model_tier=None):
+                self.languages.append(request.language)
+                raise RuntimeError("no model in this test")
+
+        async def detect_language(comment_text, deadline=None):
+            return Language.TUNISIAN
+
+        service = ClaudeService()
+        monkeypatch.setattr(service, "detect_language", detect_language)
+        generator = RecordingGenerator()
+        monkeypatch.setattr(get_settings(), "api_keys", "")
+        monkeypatch.setattr(main, "get_api_key_registry", ApiKeyRegistry)
+        monkeypatch.setattr(main, "claude_service", service)
+        monkeypatch.setattr(main, "reply_generator", generator)
+        client = TestClient(main.app)
+        body = {"post_id": "1", "post_summary": "Robe", "comment_text": "9adech soum?"}
+
+        client.post("/api/v1/generate-reply", json=body, headers={"X-API-Key": "anything"})
+        client.post("/api/v1/generate-reply", json={**body, "language": "en"}, headers={"X-API-Key": "anything"})
+        assert generator.languages == [Language.TUNISIAN, Language.ENGLISH]
+
+    def test_local_detection_keeps_default_when_unsure(self):
+        service = ClaudeService()
+        assert service.detect_language_local("9adech soum?", Language.FRENCH) == Language.TUNISIAN
+        assert service.detect_language_local("😍😍", Language.ENGLISH) == Language.ENGLISH
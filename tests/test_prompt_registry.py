@@ -0,0 +1,73 @@
+# Tests for the preloaded prompt registry
+import os
+
+import pytest
+
+from app.services.prompt_registry import PromptRegistry, PromptTemplate, REQUIRED_PLACEHOLDERS
+
+
+class TestPromptTemplate:
+    """Tests for pre-split template rendering."""
+
+    def test_render_matches_chained_replace(self):
+        """Single-join rendering gives the same text as the old replace chain."""
+        registry = PromptRegistry()
+        registry.load_all()
+        template = registry.get("system_prompt_fr.txt")
+        values = {
+            "SELLER_CONTEXT": "Boutique X",
+            "POST_SUMMARY": "Robe rouge",
+            "COMMENT_TEXT": "prix?",
+        }
+        expected = template.text
+        for name, value in values.items():
+            expected = expected.replace("{{" + name + "}}", value)
+
+        assert template.render(**values) == expected
+
+    def test_missing_value_raises(self):
+        """Rendering without every placeholder fails loudly."""
+        template = PromptTemplate("t.txt", "Hello {{NAME}} from {{CITY}}")
+        with pytest.raises(KeyError):
+            template.render(NAME="Sami")
+
+    def test_values_are_not_reinterpreted(self):
+        """A comment containing a placeholder marker is inserted verbatim."""
+        template = PromptTemplate("t.txt", "{{COMMENT_TEXT}} / {{POST_SUMMARY}}")
+        assert template.render(COMMENT_TEXT="{{POST_SUMMARY}}", POST_SUMMARY="x") == "{{POST_SUMMARY}} / x"
+
+
+class TestPromptRegistry:
+    """Tests for loading, validation and hot reload."""
+
+    def _write_all(self, directory):
+        for name, placeholders in REQUIRED_PLACEHOLDERS.items():
+            body = " ".join("{{" + p + "}}" for p in sorted(placeholders))
+            (directory / name).write_text(body, encoding="utf-8")
+
+    def test_shipped_prompts_load(self):
+        """Every prompt in app/prompts has the placeholders the code fills."""
+        registry = PromptRegistry()
+        registry.load_all()
+        for name in REQUIRED_PLACEHOLDERS:
+            assert registry.get(name).placeholders >= REQUIRED_PLACEHOLDERS[name]
+
+    def test_missing_placeholder_fails_fast(self, tmp_path):
+        """A template that lost a placeholder is rejected at startup."""
+        self._write_all(tmp_path)
+        (tmp_path / "summary_prompt.txt").write_text("no caption here", encoding="utf-8")
+        with pytest.raises(ValueError):
+            PromptRegistry(prompts_dir=tmp_path).load_all()
+
+    def test_hot_reload_on_mtime_change(self, tmp_path):
+        """Edited templates are picked up when hot reload is on."""
+        self._write_all(tmp_path)
+        registry = PromptRegistry(prompts_dir=tmp_path, hot_reload=True, reload_interval=0)
+        registry.load_all()
+
+        path = tmp_path / "summary_prompt.txt"
+        path.write_text("New: {{CAPTION}}", encoding="utf-8")
+        stat = path.stat()
+        os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+
+        assert registry.render("summary_prompt.txt", CAPTION="c") == "New: c"
@@ -0,0 +1,149 @@
+# Tests for per-API-key token-bucket rate limiting
+import fakeredis
+import pytest
+import redis.asyncio as redis
+from fastapi.testclient import TestClient
+
+from app.services.cache_service import CacheService
+from app.services.api_keys import ApiKeyInfo, ApiKeyRegistry, api_key_digest
+from app.services.rate_limiter import RateLimiter
+
+
+def client(key: str, **limits) -> ApiKeyInfo:
+    return ApiKeyInfo(digest=api_key_digest(key), tenant_id=key, **limits)
+
+
+class FailingGenerator:
+    """Stands in for the reply generator once the request has been charged."""
+
+    async def generate(self, request, deadline=None, model_tier=None):
+        raise RuntimeError("no model in this test")
+
+
+REPLY_BODY = {"post_id": "1", "post_summary": "Robe", "comment_text": "prix?"}
+
+
+def redis_limiter() -> RateLimiter:
+    cache = CacheService()
+    cache._client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    return RateLimiter(cache)
+
+
+class TestRateLimiter:
+    """Tests for bucket accounting in Redis and in-process."""
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("make_limiter", [redis_limiter, lambda: RateLimiter(CacheService())])
+    async def test_burst_then_limited(self, make_limiter, monkeypatch):
+        """A full bucket allows a burst, then answers 429 with a Retry-After."""
+        limiter = make_limiter()
+        monkeypatch.setattr(limiter.settings, "rate_limit_per_minute", 60)
+        monkeypatch.setattr(limiter.settings, "rate_limit_burst", 3)
+
+        results = [await limiter.check(client("key")) for _ in range(4)]
+
+        assert [r.allowed for r in results] == [True, True, True, False]
+        assert [r.remaining for r in results[:3]] == [2, 1, 0]
+        headers = results[-1].headers()
+        assert headers["Retry-After"] == "1"
+        assert headers["X-RateLimit-Limit"] == "60"
+        # Other keys have their own bucket
+        assert (await limiter.check(client("other"))).allowed
+
+    @pytest.mark.asyncio
+    async def test_per_key_override(self, monkeypatch):
+        limiter = redis_limiter()
+        monkeypatch.setattr(limiter.settings, "rate_limit_burst", 1)
+        monkeypatch.setattr(
+            limiter.settings,
+            "rate_limit_overrides",
+            {api_key_digest("big"): {"per_minute": 600, "burst": 5}},
+        )
+
+        assert sum([(await limiter.check(client("big"))).allowed for _ in range(6)]) == 5
+        assert sum([(await limiter.check(client("small"))).allowed for _ in range(6)]) == 1
+        # Limits carried by the key itself win over settings overrides
+        assert sum([(await limiter.check(client("own", burst=2))).allowed for _ in range(6)]) == 2
+
+    @pytest.mark.asyncio
+    async def test_falls_back_locally_when_redis_fails(self):
+        cache = CacheService()
+        # Nothing listens on port 1, so every script call fails
+        cache._client = redis.from_url("redis://127.0.0.1:1", decode_responses=True)
+        limiter = RateLimiter(cache)
+
+        assert (await limiter.check(client("key"))).allowed
+        assert limiter.stats()["local_fallbacks"] == 1
+
+
+class TestRateLimitedEndpoints:
+    """The limiter is enforced on model-calling endpoints after authentication."""
+
+    def test_429_with_headers(self, monkeypatch):
+        import app.main as main
+
+        limiter = RateLimiter(CacheService())
+        monkeypatch.setattr(limiter.settings, "api_keys", "")
+        monkeypatch.setattr(limiter.settings, "rate_limit_burst", 1)
+        monkeypatch.setattr(main, "rate_limiter", limiter)
+        monkeypatch.setattr(main, "get_api_key_registry", ApiKeyRegistry)
+        monkeypatch.setattr(main, "reply_generator", FailingGenerator())
+        client = TestClient(main.app)
+        headers = {"X-API-Key": "anything"}
+
+        first = client.post("/api/v1/generate-reply", json=REPLY_BODY, headers=headers)
+        assert first.headers["X-RateLimit-Remaining"] == "0"
+
+        second = client.post("/api/v1/generate-reply", json=REPLY_BODY, headers=headers)
+        assert second.status_code == 429
+        assert int(second.headers["Retry-After"]) >= 1
+
+    def test_batch_is_charged_per_comment(self, monkeypatch):
+        import app.main as main
+
+        limiter = RateLimiter(CacheService())
+        monkeypatch.setattr(limiter.settings, "api_keys", "")
+        monkeypatch.setattr(limiter.settings, "rate_limit_burst", 5)
+        monkeypatch.setattr(limiter.settings, "batch_max_comments", 10)
+        monkeypatch.setattr(main, "rate_limiter", limiter)
+        monkeypatch.setattr(main, "get_api_key_registry", ApiKeyRegistry)
+        client = TestClient(main.app)
+        headers = {"X-API-Key": "anything"}
+
+        def batch(size):
+            comments = [{"comment_id": str(i), "comment_text": "prix?"} for i in range(size)]
+            return {"post_id": "1", "post_summary": "Robe", "comments": comments, "stream": True}
+
+        # Between the burst and batch_max_comments: the smaller limit is the one reported
+        too_big = client.post("/api/v1/generate-replies", json=batch(7), headers=headers)
+        assert too_big.status_code == 422
+        assert "max 5" in too_big.json()["detail"]
+
+        class NoopGenerator:
+            async def generate_batch(self, batch, model_tier=None):
+                return
+                yield
+
+        monkeypatch.setattr(main, "reply_generator", NoopGenerator())
+        accepted = client.post("/api/v1/generate-replies", json=batch(4), headers=headers)
+        assert accepted.headers["X-RateLimit-Remaining"] == "1"
+
+        limited = client.post("/api/v1/generate-replies", json=batch(2), headers=headers)
+        assert limited.status_code == 429
+
+    def test_speculative_candidates_are_charged(self, monkeypatch):
+        import app.main as main
+
+        limiter = RateLimiter(CacheService())
+        monkeypatch.setattr(limiter.settings, "api_keys", "")
+        monkeypatch.setattr(limiter.settings, "rate_limit_burst", 5)
+        monkeypatch.setattr(main, "rate_limiter", limiter)
+        monkeypatch.setattr(main, "get_api_key_registry", ApiKeyRegistry)
+        monkeypatch.setattr(main, "reply_generator", FailingGenerator())
+        client = TestClient(main.app)
+        headers = {"X-API-Key": "anything"}
+        body = {**REPLY_BODY, "candidates": 3}
+
+        first = client.post("/api/v1/generate-reply", json=body, headers=headers)
+        assert first.headers["X-RateLimit-Remaining"] == "2"
+        assert client.post("/api/v1/generate-reply", json=body, headers=headers).status_code == 429
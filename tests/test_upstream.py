@@ -0,0 +1,349 @@
+# Tests for upstream call protection (concurrency limiting, retries, breaker)
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.services.claude_service import ClaudeService
+from app.services.concurrency_limiter import AdaptiveLimiter, UpstreamOverloaded
+from app.services.resilience import CircuitBreaker, CircuitOpen, Deadline, DeadlineExceeded, RetryPolicy
+
+
+def status_error(code: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "https://openrouter.ai/api/v1/chat/completions")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(code, request=request))
+
+
+class TestAdaptiveLimiter:
+    """Tests for the AIMD concurrency limiter."""
+
+    @pytest.mark.asyncio
+    async def test_queue_full_is_rejected_fast(self):
+        """Callers beyond limit + queue are shed immediately."""
+        limiter = AdaptiveLimiter(initial_limit=1, min_limit=1, max_queue=1, queue_timeout=1.0)
+        await limiter.acquire()
+        queued = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+
+        assert limiter.queue_depth == 1
+        with pytest.raises(UpstreamOverloaded):
+            await limiter.acquire()
+
+        limiter.release(latency=0.1, congested=False)
+        await queued
+        assert limiter.in_flight == 1
+        assert limiter.stats()["rejected"] == 1
+
+    @pytest.mark.asyncio
+    async def test_queued_call_times_out(self):
+        """A caller that waits past queue_timeout is rejected and dequeued."""
+        limiter = AdaptiveLimiter(initial_limit=1, min_limit=1, queue_timeout=0.01)
+        await limiter.acquire()
+        with pytest.raises(UpstreamOverloaded):
+            await limiter.acquire()
+        assert limiter.queue_depth == 0
+
+    @pytest.mark.asyncio
+    async def test_additive_increase_multiplicative_decrease(self):
+        """Successes grow the limit slowly; a 429 cuts it by the backoff ratio."""
+        limiter = AdaptiveLimiter(initial_limit=10, min_limit=2, max_limit=100, backoff_ratio=0.5, latency_target=5.0)
+        for _ in range(10):
+            async with limiter.slot():
+                pass
+        assert limiter.limit > 10
+        grown = limiter.limit
+
+        with pytest.raises(httpx.HTTPStatusError):
+            async with limiter.slot():
+                raise status_error(429)
+        assert limiter.limit == pytest.approx(grown * 0.5)
+
+    @pytest.mark.asyncio
+    async def test_client_errors_do_not_shrink_limit(self):
+        """A 400 is the caller's fault, not congestion."""
+        limiter = AdaptiveLimiter(initial_limit=10)
+        with pytest.raises(httpx.HTTPStatusError):
+            async with limiter.slot():
+                raise status_error(400)
+        assert limiter.limit > 10
+
+    @pytest.mark.asyncio
+    async def test_cancelled_holders_leave_limit_unchanged(self):
+        """Losing hedges and timed-out attempts are cancelled, which says nothing about upstream."""
+        limiter = AdaptiveLimiter(initial_limit=4, max_limit=100)
+
+        async def hold():
+            async with limiter.slot():
+                await asyncio.sleep(10)
+
+        for _ in range(20):
+            task = asyncio.create_task(hold())
+            await asyncio.sleep(0)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        assert limiter.limit == 4
+        assert limiter.in_flight == 0
+
+
+def make_service(handler) -> ClaudeService:
+    """ClaudeService with a mock transport and near-zero retry backoff."""
+    service = ClaudeService()
+    service._http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    service.retry_policy = RetryPolicy(max_attempts=3, base_delay=0.001, max_delay=0.001)
+    return service
+
+
+def completion(text: str) -> httpx.Response:
+    return httpx.Response(200, json={"choices": [{"message": {"content": text}}]})
+
+
+class TestUpstreamConcurrency:
+    """Tests for how model calls are admitted."""
+
+    @pytest.mark.asyncio
+    async def test_only_the_limiter_caps_openrouter(self, monkeypatch):
+        """The per-host cap for image hosts does not queue model calls behind the limiter."""
+        active = peak = 0
+
+        async def handler(request):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.02)
+            active -= 1
+            return completion("ok")
+
+        service = make_service(handler)
+        monkeypatch.setattr(service.settings, "http_max_connections_per_host", 1)
+        results = await asyncio.gather(*(service._call_openrouter("m", []) for _ in range(3)))
+        assert results == ["ok"] * 3
+        assert peak == 3
+
+
+class TestResilience:
+    """Tests for retries, the circuit breaker and deadlines on model calls."""
+
+    @pytest.mark.asyncio
+    async def test_retries_retryable_status(self):
+        """A 503 is retried and the later success is returned."""
+        statuses = [503, 200]
+
+        def handler(request):
+            code = statuses.pop(0)
+            return completion("ok") if code == 200 else httpx.Response(code)
+
+        service = make_service(handler)
+        assert await service._call_openrouter("m", []) == "ok"
+        assert service.resilience_stats()["retries"] == 1
+
+    @pytest.mark.asyncio
+    async def test_does_not_retry_client_errors(self):
+        """A 400 fails on the first attempt and leaves the breaker closed."""
+        calls = 0
+
+        def handler(request):
+            nonlocal calls
+            calls += 1
+            return httpx.Response(400)
+
+        service = make_service(handler)
+        with pytest.raises(httpx.HTTPStatusError):
+            await service._call_openrouter("m", [])
+        assert calls == 1
+        assert service.breaker_for("m").state == CircuitBreaker.CLOSED
+
+    @pytest.mark.asyncio
+    async def test_breaker_opens_and_fails_fast(self):
+        """Repeated upstream failures open the breaker; later calls skip the network."""
+        calls = 0
+
+        def handler(request):
+            nonlocal calls
+            calls += 1
+            return httpx.Response(502)
+
+        service = make_service(handler)
+        service.breakers["m"] = CircuitBreaker("test", failure_threshold=3, reset_timeout=60)
+        with pytest.raises(httpx.HTTPStatusError):
+            await service._call_openrouter("m", [])
+        assert service.breaker_for("m").state == CircuitBreaker.OPEN
+
+        with pytest.raises(CircuitOpen):
+            await service._call_openrouter("m", [])
+        assert calls == 3
+
+    @pytest.mark.asyncio
+    async def test_local_errors_leave_half_open_breaker_waiting(self):
+        """A call shed by the local limiter is no verdict on the upstream."""
+        service = make_service(lambda request: completion("ok"))
+        breaker = service.breakers["m"] = CircuitBreaker("test", failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        service.limiter = AdaptiveLimiter(initial_limit=1, min_limit=1, max_queue=0)
+        await service.limiter.acquire()
+
+        with pytest.raises(UpstreamOverloaded):
+            await service._call_openrouter("m", [])
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+
+        # The probe slot was released, so the next real call can close it
+        service.limiter.release(latency=0.1, congested=False)
+        assert await service._call_openrouter("m", []) == "ok"
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    @pytest.mark.asyncio
+    async def test_spent_deadline_fails_without_calling(self):
+        """No attempt is made once the request's deadline has passed."""
+        service = make_service(lambda request: completion("late"))
+        with pytest.raises(DeadlineExceeded):
+            await service._call_openrouter("m", [], deadline=Deadline(0))
+
+    def test_half_open_allows_single_probe(self):
+        """After the cooldown only one probe goes through."""
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        assert breaker.allow()
+        assert not breaker.allow()
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    @pytest.mark.asyncio
+    async def test_hedged_request_beats_slow_attempt(self, monkeypatch):
+        """Once p95 passes, a second attempt is fired and the faster one wins."""
+        calls = 0
+
+        async def handler(request):
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                await asyncio.sleep(1)
+                return completion("slow")
+            return completion("fast")
+
+        service = make_service(handler)
+        monkeypatch.setattr(service.settings, "hedge_enabled", True)
+        for _ in range(service.settings.hedge_min_samples):
+            service.latency.record(0.01)
+
+        assert await service._call_openrouter("m", []) == "fast"
+        assert service.resilience_stats()["hedges"] == 1
+
+
+def sse_body(*deltas: str) -> bytes:
+    lines = [": OPENROUTER PROCESSING", ""]
+    for delta in deltas:
+        lines += ["data: " + json.dumps({"choices": [{"delta": {"content": delta}}]}), ""]
+    lines += ["data: [DONE]", ""]
+    return "\n".join(lines).encode()
+
+
+class TestStreaming:
+    """Tests for streamed model calls."""
+
+    @pytest.mark.asyncio
+    async def test_stream_yields_deltas(self):
+        """Content deltas are yielded in order; comments and [DONE] are skipped."""
+        seen = []
+
+        def handler(request):
+            seen.append(request.content)
+            return httpx.Response(200, content=sse_body("Merci", " beaucoup!"))
+
+        service = make_service(handler)
+        deltas = [d async for d in service._stream_openrouter("m", [])]
+        assert deltas == ["Merci", " beaucoup!"]
+        assert b'"stream":true' in seen[0].replace(b" ", b"")
+
+    @pytest.mark.asyncio
+    async def test_stream_retries_before_first_delta(self):
+        """Failures before any text is produced are retried."""
+        statuses = [503, 200]
+
+        def handler(request):
+            code = statuses.pop(0)
+            return httpx.Response(code, content=sse_body("ok") if code == 200 else b"")
+
+        service = make_service(handler)
+        assert [d async for d in service._stream_openrouter("m", [])] == ["ok"]
+        assert service.resilience_stats()["retries"] == 1
+
+
+class TestModelRouting:
+    """Tests for the model routing table and fallback chains."""
+
+    def test_route_selection(self, monkeypatch):
+        """Intent beats tier, escalations beat praise, overrides replace defaults."""
+        from app.models import CommentIntent
+        from app.services.model_router import CALL_LANGUAGE, CALL_REPLY, ModelRouter
+        router = ModelRouter()
+        assert router.route(CALL_REPLY, [CommentIntent.PRAISE]).name == "reply:praise"
+        assert router.route(CALL_REPLY, [CommentIntent.PRAISE, CommentIntent.NEGATIVE]).name == "reply:negative"
+        assert router.route(CALL_REPLY, [CommentIntent.PRICE_INQUIRY], "premium").name == "reply@premium"
+        assert router.route(CALL_REPLY, [CommentIntent.PRAISE], "premium").name == "reply:praise"
+        assert router.route(CALL_REPLY, [CommentIntent.GENERAL], "standard").name == "reply"
+        assert router.route(CALL_LANGUAGE).max_tokens == 10
+
+        monkeypatch.setattr(router.settings, "model_routes", {"reply:praise@premium": {"models": ["big"]}})
+        router = ModelRouter()
+        assert router.route(CALL_REPLY, [CommentIntent.PRAISE], "premium").models == ("big",)
+
+    @pytest.mark.asyncio
+    async def test_falls_back_when_primary_errors(self):
+        """A failing primary hands over to the next model; usage is priced per route."""
+        from app.services.model_router import ModelRoute
+        models = []
+
+        def handler(request):
+            payload = json.loads(request.content)
+            models.append(payload["model"])
+            if payload["model"] == "primary":
+                return httpx.Response(503)
+            return httpx.Response(200, json={
+                "choices": [{"message": {"content": "ok"}}],
+                "usage": {"prompt_tokens": 1_000_000, "completion_tokens": 0},
+            })
+
+        service = make_service(handler)
+        service.settings.model_prices["fallback"] = {"input": 0.5, "output": 2.0}
+        route = ModelRoute(name="test", models=("primary", "fallback"), temperature=0.2)
+        try:
+            assert await service._call_route(route, [], max_tokens=50) == "ok"
+        finally:
+            del service.settings.model_prices["fallback"]
+
+        assert models == ["primary"] * 3 + ["fallback"]
+        stats = service.router.stats()["test"]
+        assert stats["fallbacks"] == 1 and stats["failures"] == 1
+        assert stats["models"] == {"fallback": 1}
+        assert stats["cost_usd"] == 0.5
+
+    @pytest.mark.asyncio
+    async def test_falls_back_when_primary_is_slow(self):
+        """A primary running past attempt_timeout is abandoned for the next model."""
+        from app.services.model_router import ModelRoute
+
+        async def handler(request):
+            if json.loads(request.content)["model"] == "slow":
+                await asyncio.sleep(1)
+            return completion("fast")
+
+        service = make_service(handler)
+        route = ModelRoute(name="test", models=("slow", "quick"), attempt_timeout=0.05)
+        assert await service._call_route(route, [], max_tokens=50, deadline=Deadline(5)) == "fast"
+        assert service.router.stats()["test"]["fallbacks"] == 1
+
+    @pytest.mark.asyncio
+    async def test_stream_falls_back_before_first_delta(self):
+        """Streams switch models only while nothing has been sent yet."""
+        from app.services.model_router import ModelRoute
+
+        def handler(request):
+            if json.loads(request.content)["model"] == "primary":
+                return httpx.Response(502)
+            return httpx.Response(200, content=sse_body("Merci!"))
+
+        service = make_service(handler)
+        route = ModelRoute(name="test", models=("primary", "fallback"))
+        assert [d async for d in service._stream_route(route, [], max_tokens=50)] == ["Merci!"]
+        assert service.breaker_for("primary").failures == 3